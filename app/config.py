@@ -15,6 +15,28 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 60
     refresh_token_expire_days: int = 7
     download_link_expire_days: int = 7
+    link_reuse: bool = False  # return an existing open link for the same dealer+file instead of minting one
+    link_reuse_min_remaining_hours: int = 24  # reusable links closer than this to expiry are replaced
+    link_regenerate_chunk_size: int = 1000  # dealers minted per INSERT when reissuing a vendor's links
+    idempotency_key_ttl_hours: int = 24
+    idempotency_lease_seconds: int = 300  # an unfinished claim older than this is taken to be abandoned
+    # Retention: links expired for longer than this are moved to download_links_archive (or dropped)
+    link_retention_days: int = 30
+    link_archive_on_purge: bool = True
+    link_purge_interval_seconds: int = 3600
+    link_purge_batch_size: int = 5000
+    # "opaque" (random, looked up in the DB) or "signed" (HMAC, validated in memory); both are accepted
+    download_token_format: str = "opaque"
+    download_token_secret: str = ""  # HMAC key for signed download tokens; defaults to jwt_secret
+    revocation_refresh_seconds: int = 30  # how often workers reload revoked links / active dealers
+    file_meta_cache_ttl_seconds: int = 60
+    token_cache_size: int = 10000  # resolved download tokens kept per worker
+    token_cache_ttl_seconds: int = 30
+    principal_cache_size: int = 10000  # bearer tokens -> resolved caller, per worker
+    principal_cache_ttl_seconds: int = 60  # also bounds how long other workers see a changed dealer
+    download_event_queue_size: int = 10000  # pending download events per worker; beyond this they are dropped
+    download_event_batch_size: int = 500
+    download_event_flush_seconds: float = 2.0
 
     # CORS
     cors_origins: str = "http://localhost:3000,http://127.0.0.1:3000"
@@ -22,6 +44,22 @@ class Settings(BaseSettings):
     # File storage
     storage_path: str = "./storage"
     max_upload_size_mb: int = 100
+    download_encodings: str = "zstd,gzip"  # pre-compressed variants offered, in server preference order
+    compress_min_size_bytes: int = 1024
+    variant_queue_size: int = 64  # blobs waiting to be compressed in the background; raw bytes are sent meanwhile
+    # Download byte offload: "" (stream from Python), "x-accel-redirect" (nginx), "x-sendfile"
+    # (Apache/lighttpd) or "zerocopy" (ASGI http.response.zerocopysend when the server supports it)
+    download_offload: str = ""
+    download_offload_prefix: str = "/protected-storage"  # nginx internal location aliased to storage_path
+    delta_max_file_mb: int = 256  # binary deltas are only built when both versions are at most this big
+    delta_queue_size: int = 16  # deltas waiting for the background builder; further requests get the full file
+    upload_session_ttl_hours: int = 24  # resumable uploads idle this long are reaped
+    upload_session_reap_interval_seconds: int = 600
+    upload_chunk_max_mb: int = 16
+    batch_upload_max_files: int = 500
+    io_executor_workers: int = 8  # threads for blocking disk/DB work awaited by async handlers
+    password_hash_workers: int = 2  # bcrypt processes; 0 hashes inline in the calling thread
+    password_hash_queue_size: int = 64  # operations waiting beyond the workers before fast-failing with 503
 
     # Email (optional - use SendGrid, Mailgun, or SMTP)
     email_api_key: str = ""
@@ -32,18 +70,42 @@ class Settings(BaseSettings):
     smtp_password: str = ""
     use_smtp: bool = False
 
+    # Rate limits: "<burst>/<seconds>" token buckets (burst requests, refilled evenly over seconds); "" disables
+    rate_limit_backend: str = "memory"  # "memory" (per worker) or "postgres" (shared by all workers)
+    rate_limit_login: str = "10/60"  # per client IP
+    rate_limit_register: str = "5/3600"  # per client IP
+    rate_limit_wallace: str = "600/60"  # per API key
+    rate_limit_wallace_bulk: str = "10/60"  # per API key
+    rate_limit_trust_forwarded_for: bool = False  # key by X-Forwarded-For (only behind a proxy that sets it)
+
     # Wallace API (for utility authentication)
     wallace_api_key: str = "change-me-wallace-api-key"
+    wallace_bulk_max_entries: int = 10000
+    wallace_bulk_chunk_size: int = 200  # entries resolved and minted per transaction, then streamed
+    wallace_max_concurrent: int = 8  # in-flight Wallace API requests per worker; more are shed with 503
+    wallace_bundle_links: bool = True  # also return one zip bundle link when a call yields several links
 
     # Google OAuth
     google_client_id: str = ""
     google_client_secret: str = ""
     google_allowed_domains: str = ""  # optional, comma-separated
+    google_token_url: str = "https://oauth2.googleapis.com/token"
+    google_jwks_url: str = "https://www.googleapis.com/oauth2/v3/certs"
+    google_jwks_default_max_age_seconds: int = 3600  # when the JWKS response has no max-age
+    google_jwks_min_refresh_seconds: int = 60  # floor between refetches forced by unknown kids
+
+    # Outbound HTTP (shared pooled client)
+    outbound_http_timeout_seconds: float = 10.0
+    outbound_http_max_connections: int = 20
 
     @property
     def cors_origins_list(self) -> list[str]:
         return [o.strip() for o in self.cors_origins.split(",")]
 
+    @property
+    def download_encodings_list(self) -> list[str]:
+        return [e.strip() for e in self.download_encodings.split(",") if e.strip()]
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,6 +1,6 @@
 """Database connection and session management."""
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from app.config import get_settings
 
 settings = get_settings()
@@ -15,9 +15,23 @@ Base = declarative_base()
 
 
 def get_db():
-    """Dependency for FastAPI to get database session."""
+    """
+    Dependency for FastAPI to get database session.
+    The session checks out a pooled connection lazily on first use and is closed as soon as the
+    endpoint returns, before the response is sent, so a streamed body never holds a connection.
+    Handlers with slow work left after their last query call release_db() to hand it back earlier.
+    """
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+def release_db(db: Session) -> None:
+    """
+    Return the session's pooled connection now. Uncommitted work is rolled back, so commit first.
+    Loaded objects stay readable (detached); the session can be reused and will check out a
+    fresh connection on its next query.
+    """
+    db.close()
@@ -1,11 +1,17 @@
-"""FastAPI dependencies: auth, db, rate limit."""
-from fastapi import Depends, HTTPException, status
+"""FastAPI dependencies: auth, db, rate limit, idempotency."""
+import hashlib
+import math
+import threading
+from typing import Any, Callable, Iterator
+from fastapi import Depends, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, APIKeyHeader
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Dealer, Admin
-from app.utils.security import decode_token
-from app.services.auth_service import validate_refresh_token
+from app.services.auth_service import Principal, resolve_principal, validate_refresh_token
+from app.services.idempotency_service import run_idempotent, IdempotencyInProgress, IdempotencyMismatch
+from app.services.rate_limit_service import parse_policy, take
+from app.config import get_settings
 
 security = HTTPBearer(auto_error=False)
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
@@ -14,53 +20,187 @@ api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 def get_current_user_optional(
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
     db: Session = Depends(get_db),
-) -> Dealer | Admin | None:
+) -> Principal | None:
+    """The caller, from the principal cache when possible (no JWT decode, no query)."""
     if not credentials:
         return None
-    payload = decode_token(credentials.credentials)
-    if not payload or payload.get("token_kind") == "refresh":
-        return None
-    if payload.get("type") not in ("dealer", "admin"):
-        return None
-    user_id = payload.get("id")
-    user_type = payload.get("type")
-    if user_type == "dealer":
-        return db.get(Dealer, user_id)
-    return db.get(Admin, user_id)
+    return resolve_principal(db, credentials.credentials)
 
 
 def get_current_user(
-    user: Dealer | Admin | None = Depends(get_current_user_optional),
-) -> Dealer | Admin:
+    user: Principal | None = Depends(get_current_user_optional),
+) -> Principal:
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if isinstance(user, Dealer) and not user.active:
+    if user.type == "dealer" and not user.active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account disabled")
     return user
 
 
 def get_current_admin(
-    user: Dealer | Admin = Depends(get_current_user),
-) -> Admin:
-    if not isinstance(user, Admin):
+    user: Principal = Depends(get_current_user),
+) -> Principal:
+    if user.type != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return user
 
 
 def get_current_dealer(
-    user: Dealer | Admin = Depends(get_current_user),
-) -> Dealer:
-    if not isinstance(user, Dealer):
+    user: Principal = Depends(get_current_user),
+) -> Principal:
+    if user.type != "dealer":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Dealer access required")
     return user
 
 
 def wallace_api_key(api_key: str | None = Depends(api_key_header)):
-    from app.config import get_settings
     if api_key != get_settings().wallace_api_key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
     return api_key
+
+
+def _api_key_identity(api_key: str) -> str:
+    return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:32]
+
+
+def _principal_identity(db: Session, credentials: HTTPAuthorizationCredentials) -> str | None:
+    principal = resolve_principal(db, credentials.credentials)
+    return f"{principal.type}:{principal.id}" if principal is not None else None
+
+
+class IdempotentCall:
+    def __init__(self, db: Session, scope: str, key: str | None):
+        self.db, self.scope, self.key = db, scope, key
+
+    def run(self, body: Any, produce: Callable[[], Any]) -> Any:
+        """
+        Return produce()'s result, or replay the stored one for a repeated Idempotency-Key
+        (marked with an Idempotent-Replayed header). 409 while the first request is still running,
+        422 if the key comes back with a different body.
+        """
+        try:
+            result, replayed = run_idempotent(self.db, self.scope, self.key, body, produce)
+        except IdempotencyInProgress as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except IdempotencyMismatch as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        if replayed:
+            return JSONResponse(result, headers={"Idempotent-Replayed": "true"})
+        return result
+
+
+class Idempotency:
+    """
+    Dependency honouring an optional Idempotency-Key header: Depends(Idempotency("scope")).run(body, produce).
+    Keys are scoped to the caller (the X-API-Key, hashed, or the bearer token's user), so two
+    clients that pick the same key do not see each other's responses.
+    """
+
+    def __init__(self, scope: str):
+        self.scope = scope
+
+    def __call__(
+        self,
+        key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
+        db: Session = Depends(get_db),
+        credentials: HTTPAuthorizationCredentials | None = Depends(security),
+        api_key: str | None = Depends(api_key_header),
+    ) -> IdempotentCall:
+        if not key:
+            return IdempotentCall(db, self.scope, None)
+        if api_key:
+            caller = _api_key_identity(api_key)
+        else:
+            caller = (_principal_identity(db, credentials) if credentials else None) or "anonymous"
+        return IdempotentCall(db, f"{self.scope}:{caller}", key)
+
+
+def client_ip(request: Request) -> str:
+    if get_settings().rate_limit_trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """
+    Token-bucket limit from Settings.rate_limit_<scope>: Depends(RateLimit("login", key="ip")).
+    key is "ip", "api_key" (X-API-Key header, hashed) or "principal" (the bearer token's user,
+    falling back to the IP). Over the limit: 429 with Retry-After.
+    """
+
+    def __init__(self, scope: str, key: str = "ip"):
+        if key not in ("ip", "api_key", "principal"):
+            raise ValueError(f"Unknown rate limit key: {key}")
+        self.scope, self.key = scope, key
+        self.policy = parse_policy(getattr(get_settings(), f"rate_limit_{scope}"))
+
+    def _identity(self, request: Request, db: Session, credentials, api_key: str | None) -> str:
+        if self.key == "api_key" and api_key:
+            return _api_key_identity(api_key)
+        if self.key == "principal" and credentials:
+            identity = _principal_identity(db, credentials)
+            if identity is not None:
+                return identity
+        return "ip:" + client_ip(request)
+
+    def __call__(
+        self,
+        request: Request,
+        db: Session = Depends(get_db),
+        credentials: HTTPAuthorizationCredentials | None = Depends(security),
+        api_key: str | None = Depends(api_key_header),
+    ) -> None:
+        if self.policy is None:
+            return
+        retry_after = take(db, self.scope, self._identity(request, db, credentials, api_key), self.policy)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+class ConcurrencyLimit:
+    """
+    Shed load instead of queueing it: at most `limit` requests of this kind in flight per worker,
+    the rest get 503 with Retry-After. As a dependency the slot is held until the endpoint returns,
+    which is before a StreamingResponse body is sent; streaming endpoints call acquire() instead and
+    release the slot when the body is done.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def acquire(self) -> Callable[[], None]:
+        """Take a slot or raise 503. Returns its release function, safe to call more than once."""
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        lock = threading.Lock()
+        held = [True]
+
+        def release() -> None:
+            with lock:
+                if held[0]:
+                    held[0] = False
+                    self._slots.release()
+
+        return release
+
+    def __call__(self) -> Iterator[None]:
+        release = self.acquire()
+        try:
+            yield
+        finally:
+            release()
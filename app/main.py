@@ -1,10 +1,19 @@
 """FastAPI application entry point."""
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.config import get_settings
 from app.database import Base, engine, SessionLocal
 from app.routers import auth, dealers, vendors, files, links, wallace, notifications, reports
+from app.services.download_recorder import download_recorder
+from app.services.retention_service import purge_links_forever
+from app.services.revocation_service import refresh_revocations_forever
+from app.services.upload_session_service import reap_sessions_forever
+from app.utils.executors import shutdown_io_executor
+from app.utils.http_client import close_http_client, get_http_client
+from app.utils.password_hashing import PasswordHashingBusy, shutdown_password_pool
 
 settings = get_settings()
 
@@ -32,6 +41,16 @@ app.include_router(notifications.router)
 app.include_router(reports.router)
 
 
+@app.exception_handler(PasswordHashingBusy)
+def password_hashing_busy(request: Request, exc: PasswordHashingBusy):
+    """Login, registration and dealer password changes fail fast while the hashing pool is saturated."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/api/health")
 def health():
     return {"status": "ok"}
@@ -65,3 +84,26 @@ def startup():
     from app.utils.storage import ensure_storage_path
     ensure_storage_path()
     _ensure_tables_and_seed()
+
+
+# Periodic jobs run on the event loop for the app's lifetime; each loops and sleeps on its own.
+_BACKGROUND_JOBS = (reap_sessions_forever, refresh_revocations_forever, purge_links_forever)
+_background_tasks: list[asyncio.Task] = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    _background_tasks.extend(asyncio.create_task(job()) for job in _BACKGROUND_JOBS)
+    download_recorder.start()
+    get_http_client()  # open the shared outbound pool up front
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    download_recorder.stop()
+    shutdown_io_executor()
+    shutdown_password_pool()
+    await close_http_client()
@@ -2,7 +2,12 @@
 from app.models.dealer import Dealer, DealerVendor
 from app.models.vendor import Vendor
 from app.models.file import PriceFile
-from app.models.link import DownloadLink
+from app.models.blob import FileBlob
+from app.models.link import DownloadLink, DownloadLinkArchive
+from app.models.bundle import DownloadBundle, DownloadBundleLink
+from app.models.download_event import DownloadEvent
+from app.models.idempotency import IdempotencyKey
+from app.models.rate_limit import RateLimitBucket
 from app.models.audit import AuditLog
 from app.models.admin import Admin
 
@@ -11,7 +16,14 @@ __all__ = [
     "DealerVendor",
     "Vendor",
     "PriceFile",
+    "FileBlob",
     "DownloadLink",
+    "DownloadLinkArchive",
+    "DownloadBundle",
+    "DownloadBundleLink",
+    "DownloadEvent",
+    "IdempotencyKey",
+    "RateLimitBucket",
     "AuditLog",
     "Admin",
 ]
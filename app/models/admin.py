@@ -1,5 +1,5 @@
 """Admin model."""
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -14,3 +14,7 @@ class Admin(Base):
     role = Column(String(50), default="admin")  # admin, super_admin
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+# Login looks identities up by lower(email) (see auth_service.find_identities)
+Index("ix_admins_email_lower", func.lower(Admin.email))
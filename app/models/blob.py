@@ -0,0 +1,18 @@
+"""FileBlob model: content-addressed storage shared by PriceFile rows."""
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class FileBlob(Base):
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+    storage_path = Column(String(500), nullable=False)  # relative to storage_path, e.g. blobs/ab/cd/<sha256>
+    ref_count = Column(Integer, nullable=False, default=0)  # PriceFile rows pointing here
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    price_files = relationship("PriceFile", back_populates="blob")
@@ -0,0 +1,22 @@
+"""DownloadBundle model: one token covering several download links, served as a zip."""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class DownloadBundle(Base):
+    __tablename__ = "download_bundles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dealer_id = Column(Integer, ForeignKey("dealers.id", ondelete="CASCADE"), nullable=False)
+    token = Column(String(64), unique=True, nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # latest expiry among its links
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DownloadBundleLink(Base):
+    __tablename__ = "download_bundle_links"
+
+    bundle_id = Column(Integer, ForeignKey("download_bundles.id", ondelete="CASCADE"), primary_key=True)
+    link_id = Column(Integer, ForeignKey("download_links.id", ondelete="CASCADE"), primary_key=True)
+    position = Column(Integer, nullable=False)  # order of entries in the zip
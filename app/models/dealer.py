@@ -1,5 +1,5 @@
 """Dealer and DealerVendor models."""
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Table, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -18,12 +18,17 @@ class Dealer(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     vendors = relationship("DealerVendor", back_populates="dealer", cascade="all, delete-orphan")
-    download_links = relationship("DownloadLink", back_populates="dealer")
+    download_links = relationship("DownloadLink", back_populates="dealer", passive_deletes=True)
+
+
+# Login looks identities up by lower(email) (see auth_service.find_identities)
+Index("ix_dealers_email_lower", func.lower(Dealer.email))
 
 
 class DealerVendor(Base):
     """Many-to-many: dealers can have multiple vendors with optional custom folder name."""
     __tablename__ = "dealer_vendors"
+    __table_args__ = (Index("ix_dealer_vendors_dealer_folder", "dealer_id", "custom_folder_name"),)
 
     id = Column(Integer, primary_key=True, index=True)
     dealer_id = Column(Integer, ForeignKey("dealers.id", ondelete="CASCADE"), nullable=False)
@@ -0,0 +1,16 @@
+"""DownloadEvent model: one row per served download (append-only history)."""
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, DateTime, Index
+from app.database import Base
+
+
+class DownloadEvent(Base):
+    __tablename__ = "download_events"
+    __table_args__ = (Index("ix_download_events_dealer_at", "dealer_id", "downloaded_at"),)
+
+    # No foreign keys: history outlives purged links and deleted files.
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    link_id = Column(Integer, nullable=False, index=True)
+    file_id = Column(Integer, nullable=False)
+    dealer_id = Column(Integer, nullable=False)
+    status = Column(SmallInteger, nullable=False)  # 200 full, 206 range, 226 delta
+    downloaded_at = Column(DateTime(timezone=True), nullable=False)
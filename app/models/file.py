@@ -1,5 +1,5 @@
 """PriceFile model."""
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -7,16 +7,24 @@ from app.database import Base
 
 class PriceFile(Base):
     __tablename__ = "price_files"
+    __table_args__ = (
+        # "latest file for vendor (and dealer)" lookups; see link_service.resolve_latest_files
+        Index("ix_price_files_vendor_dealer_uploaded", "vendor_id", "dealer_id", "uploaded_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     vendor_id = Column(Integer, ForeignKey("vendors.id", ondelete="CASCADE"), nullable=False)
     dealer_id = Column(Integer, ForeignKey("dealers.id", ondelete="CASCADE"), nullable=True)  # null = shared vendor file
     filename = Column(String(255), nullable=False)
-    file_path = Column(String(500), nullable=False)  # path on disk
+    file_path = Column(String(500), nullable=False)  # path on disk (the blob's path for content-addressed files)
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), nullable=True, index=True)  # null = legacy per-dealer path
+    content_hash = Column(String(64), nullable=True)  # sha256 hex, used as the download ETag
+    size = Column(BigInteger, nullable=True)  # bytes
     version = Column(String(50), nullable=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
     uploaded_by = Column(String(100), nullable=True)  # admin email or "wallace_utility"
 
     vendor = relationship("Vendor", back_populates="price_files")
+    blob = relationship("FileBlob", back_populates="price_files")
     dealer = relationship("Dealer", backref="price_files")
-    download_links = relationship("DownloadLink", back_populates="price_file")
+    download_links = relationship("DownloadLink", back_populates="price_file", passive_deletes=True)
@@ -0,0 +1,15 @@
+"""IdempotencyKey model: stored responses for client-supplied Idempotency-Key headers."""
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String(100), primary_key=True)  # endpoint and caller, e.g. "links.generate:admin:1"
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # sha256 of the request body
+    response = Column(Text, nullable=True)  # JSON; null while the first request is still running
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    claimed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # lease of the running request
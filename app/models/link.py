@@ -1,20 +1,49 @@
 """DownloadLink model."""
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
+# Predicate of the partial unique index below; ON CONFLICT must name it verbatim to target the index.
+REUSABLE_SLOT_PREDICATE = "reusable AND downloaded_at IS NULL AND revoked_at IS NULL"
+
 
 class DownloadLink(Base):
     __tablename__ = "download_links"
+    __table_args__ = (
+        # At most one open reusable link per dealer and file (see link_service._reuse_or_insert_links).
+        Index(
+            "uq_download_links_reusable_slot",
+            "dealer_id",
+            "file_id",
+            unique=True,
+            postgresql_where=text(REUSABLE_SLOT_PREDICATE),
+            sqlite_where=text(REUSABLE_SLOT_PREDICATE),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, ForeignKey("price_files.id", ondelete="CASCADE"), nullable=False)
     dealer_id = Column(Integer, ForeignKey("dealers.id", ondelete="CASCADE"), nullable=False)
     token = Column(String(64), unique=True, nullable=False, index=True)
-    expires_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # purge scans; see retention_service
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     downloaded_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+    reusable = Column(Boolean, nullable=False, default=False, server_default=text("false"))  # minted in link_reuse mode
 
     price_file = relationship("PriceFile", back_populates="download_links")
     dealer = relationship("Dealer", back_populates="download_links")
+
+
+class DownloadLinkArchive(Base):
+    """Purged download links, minus the token (see retention_service). Kept for download history."""
+    __tablename__ = "download_links_archive"
+
+    id = Column(Integer, primary_key=True)  # the original download_links.id
+    file_id = Column(Integer, nullable=False)
+    dealer_id = Column(Integer, nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    downloaded_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,11 @@
+"""RateLimitBucket model: token buckets shared by all workers (rate_limit_backend = "postgres")."""
+from sqlalchemy import Column, String, Float, DateTime
+from app.database import Base
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String(255), primary_key=True)  # "<scope>:<ip|api key digest|principal>"
+    tokens = Column(Float, nullable=False)  # as of updated_at
+    updated_at = Column(DateTime(timezone=True), nullable=False, index=True)
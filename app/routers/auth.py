@@ -1,10 +1,10 @@
 """Authentication routes."""
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
-import httpx
 from urllib.parse import urlencode
 from app.database import get_db
-from app.models import Dealer, Admin, AuditLog
+from app.dependencies import RateLimit
+from app.models import Dealer, AuditLog
 from app.schemas.auth import (
     LoginRequest,
     Token,
@@ -13,60 +13,54 @@ from app.schemas.auth import (
     DealerRegisterResponse,
 )
 from app.services.auth_service import (
-    authenticate_dealer,
-    authenticate_admin,
-    create_tokens_for_dealer,
-    create_tokens_for_admin,
+    authenticate_async,
+    find_identities,
+    create_tokens_for_identity,
     validate_refresh_token,
     hash_password,
 )
+from app.services.google_oauth_service import GoogleAuthError, authenticate_code
+from app.utils.executors import run_in_io_executor
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 settings = get_settings()
 
 
-@router.post("/login", response_model=Token)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    """Login as dealer or admin. Try admin first, then dealer."""
-    user = authenticate_admin(db, data.email, data.password)
-    if user:
-        access, refresh = create_tokens_for_admin(user)
-        return Token(
-            access_token=access,
-            refresh_token=refresh,
-            expires_in=settings.access_token_expire_minutes * 60,
-        )
-    user = authenticate_dealer(db, data.email, data.password)
-    if user:
-        access, refresh = create_tokens_for_dealer(user)
-        return Token(
-            access_token=access,
-            refresh_token=refresh,
-            expires_in=settings.access_token_expire_minutes * 60,
-        )
-    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+@router.post("/login", response_model=Token, dependencies=[Depends(RateLimit("login"))])
+async def login(data: LoginRequest, db: Session = Depends(get_db)):
+    """
+    Login as dealer or admin (admins win if both share the email). One identity query; bcrypt runs
+    on the hashing pool, and unknown emails cost the same bcrypt check as wrong passwords.
+    """
+    identity = await authenticate_async(db, data.email, data.password)
+    if identity is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+    access, refresh = create_tokens_for_identity(identity)
+    return Token(
+        access_token=access,
+        refresh_token=refresh,
+        expires_in=settings.access_token_expire_minutes * 60,
+    )
 
 
 @router.post("/refresh", response_model=Token)
 def refresh(body: RefreshRequest, db: Session = Depends(get_db)):
     """Refresh access token."""
     payload = validate_refresh_token(body.refresh_token)
-    if not payload:
+    if not payload or not payload.get("sub"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    user_type = "admin" if payload.get("type") == "admin" else "dealer"
+    identity = next(
+        (
+            i for i in find_identities(db, payload["sub"])
+            if i.type == user_type and i.id == payload.get("id") and i.email == payload["sub"]
+        ),
+        None,
+    )
+    if identity is None or not identity.active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-    user_type = payload.get("type")
-    user_id = payload.get("id")
-    sub = payload.get("sub")
-    if user_type == "admin":
-        admin = db.get(Admin, user_id)
-        if not admin or admin.email != sub:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-        access, ref = create_tokens_for_admin(admin)
-    else:
-        dealer = db.get(Dealer, user_id)
-        if not dealer or dealer.email != sub or not dealer.active:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-        access, ref = create_tokens_for_dealer(dealer)
+    access, ref = create_tokens_for_identity(identity)
     return Token(
         access_token=access,
         refresh_token=ref,
@@ -78,6 +72,7 @@ def refresh(body: RefreshRequest, db: Session = Depends(get_db)):
     "/register-dealer",
     response_model=DealerRegisterResponse,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(RateLimit("register"))],
 )
 def register_dealer(
     body: DealerRegisterRequest,
@@ -151,46 +146,23 @@ def google_login(request: Request):
 
 
 @router.get("/google/callback")
-def google_callback(code: str | None = None, request: Request = None, db: Session = Depends(get_db)):
-    """Handle Google OAuth callback: exchange code, verify ID token, issue our JWTs, and redirect to frontend."""
+async def google_callback(code: str | None = None, request: Request = None, db: Session = Depends(get_db)):
+    """
+    Handle Google OAuth callback: exchange code, verify ID token, issue our JWTs, and redirect to frontend.
+    Async on the shared HTTP client; the ID token is checked locally against cached Google keys.
+    """
     if code is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing code")
 
-    client_id = settings.google_client_id
-    client_secret = settings.google_client_secret
-    if not client_id or not client_secret:
+    if not settings.google_client_id or not settings.google_client_secret:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Google login not configured")
 
     base_url = str(request.base_url).rstrip("/")
     redirect_uri = f"{base_url}/api/auth/google/callback"
-
-    # Exchange code for tokens
-    token_data = {
-        "code": code,
-        "client_id": client_id,
-        "client_secret": client_secret,
-        "redirect_uri": redirect_uri,
-        "grant_type": "authorization_code",
-    }
-    with httpx.Client(timeout=10.0) as client:
-        token_res = client.post("https://oauth2.googleapis.com/token", data=token_data)
-        if token_res.status_code != 200:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to exchange code with Google")
-        token_json = token_res.json()
-        id_token = token_json.get("id_token")
-        if not id_token:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing id_token from Google")
-
-        # Validate id_token via tokeninfo
-        info_res = client.get("https://oauth2.googleapis.com/tokeninfo", params={"id_token": id_token})
-        if info_res.status_code != 200:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid id_token from Google")
-        info = info_res.json()
-
-    email = info.get("email")
-    aud = info.get("aud")
-    if not email or aud != client_id:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Google token payload")
+    try:
+        email = await authenticate_code(code, redirect_uri)
+    except GoogleAuthError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     # Optional domain restriction
     allowed_domains = [d.strip() for d in settings.google_allowed_domains.split(",") if d.strip()]
@@ -199,15 +171,15 @@ def google_callback(code: str | None = None, request: Request = None, db: Sessio
         if domain not in allowed_domains:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Email domain is not allowed")
 
-    # Map email to Admin or Dealer
-    user = db.query(Admin).filter(Admin.email == email).first()
-    if user:
-        access, refresh = create_tokens_for_admin(user)
-    else:
-        dealer = db.query(Dealer).filter(Dealer.email == email, Dealer.active == True).first()  # type: ignore[comparison-overlap]
-        if not dealer:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No matching active user for this Google account")
-        access, refresh = create_tokens_for_dealer(dealer)
+    # Map email to Admin or (active) Dealer
+    def issue_tokens() -> tuple[str, str] | None:
+        identity = next((i for i in find_identities(db, email) if i.active), None)
+        return create_tokens_for_identity(identity) if identity else None
+
+    tokens = await run_in_io_executor(issue_tokens)
+    if tokens is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No matching active user for this Google account")
+    access, refresh = tokens
 
     # Redirect back to frontend callback with tokens in fragment so they don't go to server logs
     frontend_base = request.headers.get("X-Frontend-URL") or settings.cors_origins_list[0]
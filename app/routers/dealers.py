@@ -3,11 +3,14 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from app.config import get_settings
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Dealer, DealerVendor, Vendor
+from app.models import Dealer, DealerVendor, PriceFile, Vendor
 from app.schemas.dealer import DealerCreate, DealerUpdate, DealerResponse, DealerList, DealerVendorSchema
 from app.dependencies import get_current_admin
-from app.services.auth_service import hash_password
+from app.services.auth_service import hash_password, forget_principal
 from app.services.email_service import send_welcome_email
+from app.services.file_service import delete_price_files, remove_deleted_files
+from app.services.link_service import forget_dealer_links
+from app.services.revocation_service import record_dealer_status
 
 router = APIRouter(prefix="/api/dealers", tags=["dealers"])
 _settings = get_settings()
@@ -88,6 +91,11 @@ def update_dealer(
     if data.active is not None:
         dealer.active = data.active
     db.commit()
+    forget_principal("dealer", dealer_id)
+    if data.active is not None:
+        record_dealer_status(dealer_id, data.active)
+        if not data.active:
+            forget_dealer_links(dealer_id)
     db.refresh(dealer)
     return dealer
 
@@ -101,8 +109,13 @@ def delete_dealer(
     dealer = db.get(Dealer, dealer_id)
     if not dealer:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dealer not found")
+    # The dealer's price files would go with it by cascade, leaving their blobs' ref counts too high.
+    deleted = delete_price_files(db, PriceFile.dealer_id == dealer_id)
     db.delete(dealer)
     db.commit()
+    remove_deleted_files(db, deleted)
+    forget_dealer_links(dealer_id)
+    forget_principal("dealer", dealer_id)
 
 
 @router.get("/{dealer_id}/vendors")
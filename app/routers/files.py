@@ -1,13 +1,40 @@
 """File upload and management routes."""
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+import contextlib
+import zipfile
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request
 from fastapi.responses import FileResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.orm import Session
 from pathlib import Path
 from app.database import get_db
-from app.models import PriceFile, Vendor
-from app.schemas.file import FileUploadResponse, FileResponse as FileResponseSchema, FileList
+from app.models import Dealer, PriceFile, Vendor
+from app.schemas.file import (
+    FileUploadResponse,
+    FileResponse as FileResponseSchema,
+    FileList,
+    UploadSessionCreate,
+    UploadSessionStatus,
+    UploadSessionComplete,
+    BatchManifestEntry,
+    BatchUploadResult,
+)
 from app.dependencies import get_current_admin, get_current_dealer, get_current_user_optional, wallace_api_key
-from app.services.file_service import create_price_file, get_file_by_id, list_files, delete_price_file
+from app.services import upload_session_service as upload_sessions
+from app.services.file_service import (
+    create_price_file,
+    create_price_file_async,
+    create_price_files_batch,
+    resolve_upload_targets,
+    BatchItem,
+    get_vendor_by_code,
+    get_vendor_by_code_async,
+    get_file_by_id,
+    list_files,
+    delete_price_file,
+)
+from app.utils.storage import UploadTooLarge, ChecksumMismatch, iter_file_chunks
+from app.utils.executors import run_in_io_executor
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/files", tags=["files"])
@@ -15,6 +42,12 @@ settings = get_settings()
 MAX_SIZE = settings.max_upload_size_mb * 1024 * 1024
 
 
+def _check_declared_size(file: UploadFile) -> None:
+    """Reject early when the multipart parser already knows the part is over the limit."""
+    if file.size is not None and file.size > MAX_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+
+
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
@@ -22,14 +55,21 @@ async def upload_file(
     dealer_id: int | None = Form(None),
     version: str | None = Form(None),
     uploaded_by: str | None = Form(None),
+    sha256: str | None = Form(None),
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    content = await file.read()
-    if len(content) > MAX_SIZE:
-        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+    _check_declared_size(file)
     by = uploaded_by or admin.email
-    pf = create_price_file(db, vendor_id, dealer_id, file.filename or "file", content, by, version)
+    try:
+        pf = await create_price_file_async(
+            db, vendor_id, dealer_id, file.filename or "file", iter_file_chunks(file.file), by, version,
+            max_size=MAX_SIZE, expected_sha256=sha256,
+        )
+    except UploadTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return pf
 
 
@@ -39,22 +79,241 @@ async def upload_file_from_utility(
     vendor_code: str = Form(...),
     dealer_id: int | None = Form(None),
     custom_folder: str | None = Form(None),
+    sha256: str | None = Form(None),
     db: Session = Depends(get_db),
     _api_key=Depends(wallace_api_key),
 ):
-    """Used by Wallace PC upload utility. Authenticated via X-API-Key."""
-    vendor = db.query(Vendor).filter(Vendor.code == vendor_code).first()
+    """
+    Used by Wallace PC upload utility. Authenticated via X-API-Key.
+    Sending the file's sha256 lets the server skip writing content it already stores.
+    """
+    vendor = await get_vendor_by_code_async(db, vendor_code)
     if not vendor:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Vendor code not found: {vendor_code}")
-    content = await file.read()
-    if len(content) > MAX_SIZE:
+    _check_declared_size(file)
+    try:
+        pf = await create_price_file_async(
+            db, vendor.id, dealer_id, file.filename or "file", iter_file_chunks(file.file), "wallace_utility", None,
+            max_size=MAX_SIZE, expected_sha256=sha256,
+        )
+    except UploadTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return pf
+
+
+_manifest_adapter = TypeAdapter(list[BatchManifestEntry])
+
+
+@router.post("/upload-batch", response_model=list[BatchUploadResult])
+async def upload_batch_from_utility(
+    manifest: str = Form(..., description="JSON list of {filename, vendor_code | custom_folder, dealer_id, sha256}"),
+    files: list[UploadFile] = File([]),
+    archive: UploadFile | None = File(None),
+    db: Session = Depends(get_db),
+    _api_key=Depends(wallace_api_key),
+):
+    """
+    Batch upload for the Wallace utility: many multipart `files` and/or one zip `archive`, mapped
+    to vendors by the manifest. Vendor codes and dealer ids are resolved up front, files are written
+    concurrently and all PriceFile rows are inserted in one transaction. Returns a result per
+    manifest entry; a bad entry does not fail the others.
+    """
+    try:
+        entries = _manifest_adapter.validate_json(manifest)
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=e.errors())
+    if len(entries) > settings.batch_upload_max_files:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Too many files in batch")
+
+    sources: dict[str, list] = {}
+    for part in files:
+        _check_declared_size(part)
+        sources.setdefault(part.filename or "", []).append(lambda f=part.file: contextlib.nullcontext(f))
+    zip_file = None
+    if archive is not None:
+        try:
+            zip_file = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Archive is not a valid zip file")
+        for info in zip_file.infolist():
+            if not info.is_dir():
+                sources.setdefault(info.filename, []).append(lambda i=info: zip_file.open(i))
+
+    targets = await run_in_io_executor(
+        resolve_upload_targets, db, [(e.vendor_code, e.dealer_id, e.custom_folder) for e in entries]
+    )
+    results: list[BatchUploadResult | None] = [None] * len(entries)
+    items: list[BatchItem] = []
+    item_entries: list[int] = []
+    for i, (entry, (vendor_id, dealer_found)) in enumerate(zip(entries, targets)):
+        if not dealer_found:
+            error = f"Dealer not found: {entry.dealer_id}"
+        elif vendor_id is None:
+            error = f"Vendor not found: {entry.vendor_code or entry.custom_folder}"
+        elif not sources.get(entry.filename):
+            error = "No file in request for this manifest entry"
+        else:
+            items.append(
+                BatchItem(entry.filename.rsplit("/", 1)[-1], vendor_id, entry.dealer_id,
+                          sources[entry.filename].pop(0), entry.sha256)
+            )
+            item_entries.append(i)
+            continue
+        results[i] = BatchUploadResult(filename=entry.filename, status="error", error=error)
+
+    try:
+        outcomes = await create_price_files_batch(db, items, "wallace_utility", max_size=MAX_SIZE)
+    finally:
+        if zip_file is not None:
+            zip_file.close()
+    for i, outcome in zip(item_entries, outcomes):
+        filename = entries[i].filename
+        if outcome.error is None:
+            results[i] = BatchUploadResult(
+                filename=filename,
+                status="created",
+                file_id=outcome.file_id,
+                file_path=outcome.file_path,
+                content_hash=outcome.content_hash,
+            )
+        elif isinstance(outcome.error, UploadTooLarge):
+            results[i] = BatchUploadResult(filename=filename, status="error", error="File too large")
+        elif isinstance(outcome.error, (ValueError, zipfile.BadZipFile)):
+            results[i] = BatchUploadResult(filename=filename, status="error", error=str(outcome.error))
+        else:
+            raise outcome.error
+    return results
+
+
+def _session_status(session: upload_sessions.UploadSession) -> UploadSessionStatus:
+    expires = session.updated_at + settings.upload_session_ttl_hours * 3600
+    return UploadSessionStatus(
+        session_id=session.id,
+        filename=session.filename,
+        size=session.size,
+        chunk_size=session.chunk_size,
+        offset=session.offset,
+        expires_at=datetime.fromtimestamp(expires, tz=timezone.utc),
+    )
+
+
+@router.post("/upload-sessions", response_model=UploadSessionStatus, status_code=status.HTTP_201_CREATED)
+def create_upload_session(
+    data: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    _api_key=Depends(wallace_api_key),
+):
+    """
+    Resumable upload for the Wallace utility: create a session, PUT chunks 0, 1, ... of chunk_size
+    bytes at offset index * chunk_size (GET the session to learn where to resume), then POST
+    /complete with the file's SHA-256.
+    """
+    vendor = get_vendor_by_code(db, data.vendor_code)
+    if not vendor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Vendor code not found: {data.vendor_code}")
+    if data.dealer_id is not None and not db.get(Dealer, data.dealer_id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Dealer not found: {data.dealer_id}")
+    if data.size > MAX_SIZE:
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
-    pf = create_price_file(
-        db, vendor.id, dealer_id, file.filename or "file", content, "wallace_utility", None
+    chunk_limit = settings.upload_chunk_max_mb * 1024 * 1024
+    if data.chunk_size is not None and data.chunk_size > chunk_limit:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"chunk_size is limited to {chunk_limit} bytes"
+        )
+    session = upload_sessions.create_session(
+        vendor.id, data.dealer_id, data.filename, data.size, data.sha256, data.chunk_size or chunk_limit
     )
+    return _session_status(session)
+
+
+@router.get("/upload-sessions/{session_id}", response_model=UploadSessionStatus)
+def get_upload_session(session_id: str, _api_key=Depends(wallace_api_key)):
+    session = upload_sessions.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    return _session_status(session)
+
+
+@router.put("/upload-sessions/{session_id}/chunks/{index}")
+async def put_upload_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    _api_key=Depends(wallace_api_key),
+):
+    """Store chunk number `index` (raw request body) at byte `offset`. Returns the next offset."""
+    session = await run_in_io_executor(upload_sessions.get_session, session_id)
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    limit = settings.upload_chunk_max_mb * 1024 * 1024
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Chunk too large")
+    body = bytearray()
+    async for piece in request.stream():
+        body += piece
+        if len(body) > limit:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Chunk too large")
+    try:
+        new_offset = await run_in_io_executor(upload_sessions.write_chunk, session, index, offset, bytes(body))
+    except upload_sessions.OffsetMismatch as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Offset is past the stored data; resume from offset", "offset": e.current_offset},
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"chunk": index, "offset": new_offset}
+
+
+@router.post("/upload-sessions/{session_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    session_id: str,
+    data: UploadSessionComplete,
+    db: Session = Depends(get_db),
+    _api_key=Depends(wallace_api_key),
+):
+    """Verify the assembled file against its SHA-256 and record it like a regular utility upload."""
+    session = await run_in_io_executor(upload_sessions.get_session, session_id)
+    if not session:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    if session.offset != session.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload incomplete", "offset": session.offset, "size": session.size},
+        )
+    sha256 = data.sha256.lower()
+    if session.sha256 and session.sha256 != sha256:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="SHA-256 differs from the one declared at creation")
+
+    def _finalize():
+        with upload_sessions.finalizing(session_id) as part:
+            return create_price_file(
+                db, session.vendor_id, session.dealer_id, session.filename, iter_file_chunks(part),
+                "wallace_utility", None, max_size=MAX_SIZE, expected_sha256=sha256,
+            )
+
+    try:
+        pf = await run_in_io_executor(_finalize)
+    except upload_sessions.SessionBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return pf
 
 
+@router.delete("/upload-sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_upload_session(session_id: str, _api_key=Depends(wallace_api_key)):
+    upload_sessions.delete_session(session_id)
+
+
 @router.get("", response_model=list[FileList])
 def list_files_route(
     db: Session = Depends(get_db),
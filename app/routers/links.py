@@ -1,16 +1,37 @@
 """Download link generation and download routes."""
+from functools import partial
+from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
-from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas.link import LinkGenerateRequest, LinkResponse, WallaceLinkItem
-from app.dependencies import get_current_admin, get_current_dealer
+from app.database import get_db, release_db
+from app.schemas.link import (
+    LinkGenerateRequest,
+    LinkResponse,
+    WallaceLinkItem,
+    BundleCreateRequest,
+    BundleResponse,
+    BulkRevokeRequest,
+    BulkRevokeResponse,
+    RegenerateLinksRequest,
+    RegenerateLinksResponse,
+)
+from app.dependencies import get_current_admin, get_current_dealer, Idempotency, IdempotentCall
 from app.services.link_service import (
     generate_links,
-    get_link_by_token,
-    mark_downloaded,
+    resolve_download,
+    record_download,
+    revoke_links,
+    revoke_links_matching,
+    regenerate_vendor_links,
     get_file_content,
+    is_delta_base,
+    BundleEntry,
+    create_bundle,
+    resolve_bundle,
+    record_bundle_download,
 )
+from app.utils.downloads import file_download_response, delta_download_response, offload_headers, zip_download_response
+from app.utils.storage import DELTA_ENCODING, get_encoded_variant, get_delta
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/links", tags=["links"])
@@ -27,15 +48,14 @@ def generate_download_links(
     request: Request,
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
+    idempotent: IdempotentCall = Depends(Idempotency("links.generate")),
 ):
+    """Retries carrying the same Idempotency-Key get the first response back instead of new links."""
     base = _base_url(request)
-    links = generate_links(db, data.dealer_id, data.file_ids, base)
-    result = []
-    for link in links:
-        pf = link.price_file
-        vendor = pf.vendor if pf is not None else None
-        url = f"{base}/api/links/download/{link.token}"
-        result.append(
+
+    def produce() -> list[LinkResponse]:
+        links = generate_links(db, data.dealer_id, data.file_ids, base)
+        return [
             LinkResponse(
                 id=link.id,
                 file_id=link.file_id,
@@ -44,31 +64,176 @@ def generate_download_links(
                 expires_at=link.expires_at,
                 created_at=link.created_at,
                 downloaded_at=link.downloaded_at,
-                download_url=url,
-                filename=pf.filename if pf is not None else None,
-                version=pf.version if pf is not None else None,
-                vendor_code=vendor.code if vendor is not None else None,
-                vendor_name=vendor.name if vendor is not None else None,
+                download_url=f"{base}/api/links/download/{link.token}",
+                filename=link.filename,
+                version=link.version,
+                vendor_code=link.vendor_code,
+                vendor_name=link.vendor_name,
             )
-        )
-    return result
+            for link in links
+        ]
 
+    return idempotent.run(data, produce)
 
-@router.get("/download/{token}")
+
+@router.api_route("/download/{token}", methods=["GET", "HEAD"])
 def download_by_token(
     token: str,
+    request: Request,
+    base: str | None = Query(None, description="SHA-256 of a previous version the client already has"),
     db: Session = Depends(get_db),
 ):
-    """Public endpoint: validate token and stream file. Used by dealer download utility and browser."""
-    pair = get_link_by_token(db, token)
-    if not pair:
+    """
+    Public endpoint: validate token and stream file. Used by dealer download utility and browser.
+    Supports HEAD, Range/If-Range (resume) and If-None-Match against the file's content-hash ETag,
+    and serves cached gzip/zstd variants when the client's Accept-Encoding allows (the first request
+    for a variant queues its compression and gets the raw bytes).
+    With ?base=<sha256> of an earlier version in the same series, answers 226 IM Used with a
+    zstd-patch delta when one has been built and is smaller than the file (the first such request
+    queues the build and gets the full file).
+    Token checks and download bookkeeping always run here; with download_offload set, the bytes
+    themselves are sent by the fronting server or via zero-copy sendfile. Signed tokens are
+    validated in memory; every served download is recorded write-behind, off the request path.
+    """
+    grant = resolve_download(db, token)
+    if not grant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link expired or invalid")
-    link, price_file = pair
-    path, filename = get_file_content(link, price_file)
+    price_file = grant.file
+    path, filename = get_file_content(None, price_file)
     if not path.exists():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found on server")
-    mark_downloaded(db, link)
-    return FileResponse(path, filename=filename, media_type="application/octet-stream")
+    encoded_variant = None
+    if price_file.blob_id is not None:
+        encoded_variant = partial(get_encoded_variant, price_file.file_path, build=request.method == "GET")
+    target_sha256 = price_file.content_hash
+    base_sha256 = base.lower() if base else None
+    wants_delta = (
+        base_sha256 is not None
+        and price_file.blob_id is not None
+        and base_sha256 != target_sha256
+        and "range" not in request.headers
+        and is_delta_base(db, price_file, base_sha256)
+    )
+    # Hand the connection back before touching the disk; get_db would keep it until this handler
+    # returns.
+    release_db(db)
+    # Variants and deltas are built in the background; until one is ready the plain file is served.
+    # HEAD only reports what already exists.
+    delta_path = get_delta(base_sha256, target_sha256, build=request.method == "GET") if wants_delta else None
+    if delta_path is not None and delta_path.stat().st_size < path.stat().st_size:
+        response = delta_download_response(delta_path, filename, base_sha256, target_sha256, DELTA_ENCODING)
+    else:
+        response = file_download_response(
+            request,
+            path,
+            filename,
+            target_sha256,
+            encoded_variant=encoded_variant,
+            encodings=settings.download_encodings_list,
+            min_compress_size=settings.compress_min_size_bytes,
+            offload=offload_headers(
+                settings.download_offload, price_file.file_path, path, settings.download_offload_prefix
+            ),
+            zero_copy=settings.download_offload == "zerocopy",
+        )
+    if request.method == "GET" and response.status_code in (200, 206, 226):
+        record_download(grant, response.status_code)
+    return response
+
+
+@router.post("/bundles", response_model=BundleResponse, status_code=status.HTTP_201_CREATED)
+def create_download_bundle(
+    data: BundleCreateRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """One token for several of a dealer's links; expired, revoked or foreign links are left out."""
+    try:
+        bundle = create_bundle(db, data.dealer_id, data.link_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return BundleResponse(
+        token=bundle.token,
+        download_url=f"{_base_url(request)}/api/links/bundle/{bundle.token}",
+        expires_at=bundle.expires_at,
+        link_count=bundle.link_count,
+    )
+
+
+def _bundle_members(entries: list[BundleEntry]) -> list[tuple[str, Path]]:
+    """(arcname, path) per entry: one folder per vendor code, repeated names numbered."""
+    members, seen = [], set()
+    for entry in entries:
+        path, filename = get_file_content(None, entry.grant.file)
+        stem, dot, suffix = filename.rpartition(".")
+        if not dot:
+            stem, suffix = filename, ""
+        name, n = f"{entry.vendor_code}/{filename}", 1
+        while name in seen:
+            n += 1
+            name = f"{entry.vendor_code}/{stem} ({n}){dot}{suffix}"
+        seen.add(name)
+        members.append((name, path))
+    return members
+
+
+@router.get("/bundle/{token}")
+def download_bundle(
+    token: str,
+    db: Session = Depends(get_db),
+):
+    """
+    Public endpoint: all files of a bundle as one zip, streamed while it is assembled. Links that
+    expired or were revoked after the bundle was made are left out. Once the whole archive has
+    been sent, each file counts as a download of its own link.
+    """
+    entries = [e for e in resolve_bundle(db, token) if get_file_content(None, e.grant.file)[0].exists()]
+    release_db(db)
+    if not entries:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Bundle expired or invalid")
+    return zip_download_response(
+        _bundle_members(entries), "price-files.zip", on_complete=partial(record_bundle_download, entries)
+    )
+
+
+@router.post("/{link_id}/revoke", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_link(
+    link_id: int,
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """Revoke a link: its token stops working at once here and within revocation_refresh_seconds on other workers."""
+    if not revoke_links(db, [link_id]):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found or already revoked")
+
+
+@router.post("/revoke-bulk", response_model=BulkRevokeResponse)
+def revoke_links_bulk(
+    data: BulkRevokeRequest,
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """Revoke every active link for a vendor, dealer and/or set of files with one UPDATE."""
+    try:
+        revoked = revoke_links_matching(db, data.vendor_id, data.dealer_id, data.file_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return BulkRevokeResponse(revoked=revoked)
+
+
+@router.post("/regenerate", response_model=RegenerateLinksResponse)
+def regenerate_links(
+    data: RegenerateLinksRequest,
+    db: Session = Depends(get_db),
+    admin=Depends(get_current_admin),
+):
+    """After a corrected upload: revoke a vendor's active links and reissue them to its dealers, in one transaction."""
+    try:
+        result = regenerate_vendor_links(db, data.vendor_id, data.dealer_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return RegenerateLinksResponse(**result._asdict())
 
 
 @router.get("", response_model=list[LinkResponse])
@@ -95,6 +260,7 @@ def list_links(
             expires_at=l.expires_at,
             created_at=l.created_at,
             downloaded_at=l.downloaded_at,
+            revoked_at=l.revoked_at,
             download_url=f"{base}/api/links/download/{l.token}",
             filename=l.price_file.filename if l.price_file is not None else None,
             version=l.price_file.version if l.price_file is not None else None,
@@ -1,11 +1,15 @@
 """Reports and activity logs."""
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, union_all
 from app.database import get_db
-from app.models import AuditLog, DownloadLink, PriceFile
+from app.models import AuditLog, DownloadLink, DownloadLinkArchive, PriceFile
 from app.schemas.audit import AuditLogResponse
 from app.dependencies import get_current_admin
+from app.services.link_service import cache_stats, download_recorder_stats
+from app.services.auth_service import principal_cache_stats
+from app.services.rate_limit_service import rate_limit_stats
+from app.utils.password_hashing import password_hashing_stats
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
@@ -15,14 +19,15 @@ def download_stats(
     db: Session = Depends(get_db),
     admin=Depends(get_current_admin),
 ):
-    """Download statistics: count by file, by dealer, etc."""
-    total = db.query(DownloadLink).filter(DownloadLink.downloaded_at != None).count()
-    by_dealer = (
-        db.query(DownloadLink.dealer_id, func.count(DownloadLink.id).label("count"))
-        .filter(DownloadLink.downloaded_at != None)
-        .group_by(DownloadLink.dealer_id)
-        .all()
-    )
+    """Download statistics: count by file, by dealer, etc. Includes links already moved to the archive."""
+    downloaded = union_all(
+        select(DownloadLink.dealer_id).where(DownloadLink.downloaded_at != None),
+        select(DownloadLinkArchive.dealer_id).where(DownloadLinkArchive.downloaded_at != None),
+    ).subquery()
+    by_dealer = db.execute(
+        select(downloaded.c.dealer_id, func.count().label("count")).group_by(downloaded.c.dealer_id)
+    ).all()
+    total = sum(c for _, c in by_dealer)
     return {"total_downloads": total, "by_dealer": [{"dealer_id": d, "count": c} for d, c in by_dealer]}
 
 
@@ -34,3 +39,14 @@ def activity_logs(
     limit: int = Query(100, ge=1, le=500),
 ):
     return db.query(AuditLog).order_by(AuditLog.timestamp.desc()).offset(skip).limit(limit).all()
+
+
+@router.get("/runtime-stats")
+def runtime_stats(admin=Depends(get_current_admin)):
+    """This worker's in-process counters (caches, download recorder, password hashing, rate limits) for monitoring."""
+    return {
+        "caches": {**cache_stats(), "principals": principal_cache_stats()},
+        "download_events": download_recorder_stats(),
+        "password_hashing": password_hashing_stats(),
+        "rate_limits": rate_limit_stats(),
+    }
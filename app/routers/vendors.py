@@ -2,9 +2,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Vendor
+from app.models import PriceFile, Vendor
 from app.schemas.vendor import VendorCreate, VendorUpdate, VendorResponse
 from app.dependencies import get_current_admin
+from app.services.file_service import delete_price_files, remove_deleted_files
 
 router = APIRouter(prefix="/api/vendors", tags=["vendors"])
 
@@ -78,5 +79,8 @@ def delete_vendor(
     vendor = db.get(Vendor, vendor_id)
     if not vendor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vendor not found")
+    # The vendor's price files would go with it by cascade, leaving their blobs' ref counts too high.
+    deleted = delete_price_files(db, PriceFile.vendor_id == vendor_id)
     db.delete(vendor)
     db.commit()
+    remove_deleted_files(db, deleted)
@@ -1,84 +1,179 @@
 """Wallace integration API: get links by customer number and vendor codes."""
+import logging
+from typing import Callable, Iterator
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models import Dealer, DealerVendor, Vendor, PriceFile, DownloadLink
-from app.schemas.link import WallaceGetLinksRequest, WallaceGetLinksResponse, WallaceLinkItem
-from app.dependencies import wallace_api_key
-from app.services.link_service import generate_links, get_dealer_by_customer_number
+from app.schemas.link import (
+    WallaceGetLinksRequest,
+    WallaceGetLinksResponse,
+    WallaceLinkItem,
+    WallaceBulkGetLinksRequest,
+    WallaceBulkLinksResult,
+)
+from app.dependencies import wallace_api_key, Idempotency, IdempotentCall, RateLimit, ConcurrencyLimit
+from app.services.link_service import (
+    GeneratedLink,
+    create_bundles_for_links,
+    generate_links,
+    generate_links_bulk,
+    get_dealer_by_customer_number,
+    get_dealers_by_customer_numbers,
+    resolve_latest_files,
+    resolve_latest_files_bulk,
+)
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/wallace", tags=["wallace"])
 settings = get_settings()
+logger = logging.getLogger(__name__)
+# Shared by both endpoints: one runaway Wallace script cannot take every request thread of a worker.
+wallace_slots = ConcurrencyLimit(settings.wallace_max_concurrent)
 
 
-@router.post("/get-links", response_model=WallaceGetLinksResponse)
+@router.post(
+    "/get-links",
+    response_model=WallaceGetLinksResponse,
+    # The key is checked before the rate limit so that made-up keys don't each get a fresh bucket.
+    dependencies=[Depends(wallace_api_key), Depends(RateLimit("wallace", key="api_key")), Depends(wallace_slots)],
+)
 def get_links_for_wallace(
     data: WallaceGetLinksRequest,
     request: Request,
     db: Session = Depends(get_db),
-    _api_key=Depends(wallace_api_key),
+    idempotent: IdempotentCall = Depends(Idempotency("wallace.get-links")),
 ):
     """
     Wallace calls this when Jack charges a customer for price files.
     Returns secure download links for each vendor. Wallace can then email these to the dealer.
+    With several links, bundle_link fetches them all as one zip.
+    A retry with the same Idempotency-Key header returns the first response.
     """
-    dealer = get_dealer_by_customer_number(db, data.customer_number)
-    if not dealer:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dealer not found for customer number")
-    # Resolve vendor codes (or custom folder names) to file_ids
-    file_ids = []
-    for vendor_code in data.vendors:
-        vendor = db.query(Vendor).filter(Vendor.code == vendor_code).first()
-        if not vendor:
-            # Maybe it's a custom_folder_name for this dealer
-            dv = db.query(DealerVendor).filter(
-                DealerVendor.dealer_id == dealer.id,
-                DealerVendor.custom_folder_name == vendor_code,
-            ).first()
-            if dv:
-                vendor = db.get(Vendor, dv.vendor_id)
-        if not vendor:
-            continue
-        # Latest file: dealer-specific first, then shared
-        pf = (
-            db.query(PriceFile)
-            .filter(PriceFile.vendor_id == vendor.id, PriceFile.dealer_id == dealer.id)
-            .order_by(PriceFile.uploaded_at.desc())
-            .first()
+
+    def produce() -> WallaceGetLinksResponse:
+        dealer = get_dealer_by_customer_number(db, data.customer_number)
+        if not dealer:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dealer not found for customer number")
+        dealer_id, dealer_email = dealer.id, dealer.email
+        # Vendor codes (or custom folder names) -> latest file, dealer-specific first, then shared
+        file_ids = resolve_latest_files(db, dealer_id, data.vendors)
+        if not file_ids:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No price files found for given vendors")
+        # Generate links
+        base = str(request.base_url).rstrip("/")
+        links = generate_links(db, dealer_id, file_ids, base)
+        bundle_link = _bundle_links(db, [links], base)[0]
+        return WallaceGetLinksResponse(links=_link_items(links, base), dealer_email=dealer_email, bundle_link=bundle_link)
+
+    return idempotent.run(data, produce)
+
+
+def _link_items(links: list[GeneratedLink], base: str) -> list[WallaceLinkItem]:
+    return [
+        WallaceLinkItem(
+            vendor=link.vendor_code,
+            link=f"{base}/api/links/download/{link.token}",
+            filename=link.filename,
+            expires_at=link.expires_at,
         )
-        if not pf:
-            pf = (
-                db.query(PriceFile)
-                .filter(PriceFile.vendor_id == vendor.id, PriceFile.dealer_id == None)
-                .order_by(PriceFile.uploaded_at.desc())
-                .first()
-            )
-        if not pf:
-            pf = (
-                db.query(PriceFile)
-                .filter(PriceFile.vendor_id == vendor.id)
-                .order_by(PriceFile.uploaded_at.desc())
-                .first()
-            )
-        if pf:
-            file_ids.append(pf.id)
-    if not file_ids:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No price files found for given vendors")
-    # Generate links
+        for link in links
+    ]
+
+
+def _bundle_links(db: Session, link_sets: list[list[GeneratedLink]], base: str) -> list[str | None]:
+    """A zip bundle URL per set of several links (None for single links), minted in one transaction."""
+    wanted = [i for i, links in enumerate(link_sets) if len(links) > 1] if settings.wallace_bundle_links else []
+    bundles = create_bundles_for_links(db, [link_sets[i] for i in wanted])
+    urls: list[str | None] = [None] * len(link_sets)
+    for i, bundle in zip(wanted, bundles):
+        urls[i] = f"{base}/api/links/bundle/{bundle.token}"
+    return urls
+
+
+def _bulk_chunk_results(db: Session, entries: list[WallaceGetLinksRequest], base: str) -> list[WallaceBulkLinksResult]:
+    """Resolve and mint one chunk: dealers, latest files and links are each one set-wise statement."""
+    dealers = {
+        number: (dealer.id, dealer.email)  # plain values: committing below expires the ORM objects
+        for number, dealer in get_dealers_by_customer_numbers(db, [e.customer_number for e in entries]).items()
+    }
+    found = [e for e in entries if e.customer_number in dealers]
+    file_ids = resolve_latest_files_bulk(db, [(dealers[e.customer_number][0], e.vendors) for e in found])
+    to_mint = [(e, ids) for e, ids in zip(found, file_ids) if ids]
+    minted = generate_links_bulk(db, [(dealers[e.customer_number][0], ids) for e, ids in to_mint])
+    links_by_entry = {id(e): links for (e, _), links in zip(to_mint, minted)}
+    bundle_by_entry = {id(e): url for (e, _), url in zip(to_mint, _bundle_links(db, minted, base))}
+    results = []
+    for e in entries:
+        if e.customer_number not in dealers:
+            results.append(WallaceBulkLinksResult(
+                customer_number=e.customer_number, status="error", error="Dealer not found for customer number"
+            ))
+        elif not links_by_entry.get(id(e)):
+            results.append(WallaceBulkLinksResult(
+                customer_number=e.customer_number, status="error", error="No price files found for given vendors"
+            ))
+        else:
+            results.append(WallaceBulkLinksResult(
+                customer_number=e.customer_number,
+                status="ok",
+                links=_link_items(links_by_entry[id(e)], base),
+                dealer_email=dealers[e.customer_number][1],
+                bundle_link=bundle_by_entry[id(e)],
+            ))
+    return results
+
+
+def _stream_bulk_results(
+    entries: list[WallaceGetLinksRequest], base: str, release_slot: Callable[[], None]
+) -> Iterator[str]:
+    # Own session: the request's get_db session is closed before a streamed body is consumed.
+    # Same for the concurrency slot, which is held until the last line is sent.
+    db = SessionLocal()
+    try:
+        size = settings.wallace_bulk_chunk_size
+        for i in range(0, len(entries), size):
+            chunk = entries[i:i + size]
+            try:
+                results = _bulk_chunk_results(db, chunk, base)
+            except Exception:
+                logger.exception("Bulk get-links chunk failed")
+                db.rollback()
+                results = [
+                    WallaceBulkLinksResult(customer_number=e.customer_number, status="error", error="Internal error")
+                    for e in chunk
+                ]
+            for result in results:
+                yield result.model_dump_json() + "\n"
+    finally:
+        db.close()
+        release_slot()
+
+
+@router.post(
+    "/get-links-bulk",
+    dependencies=[Depends(wallace_api_key), Depends(RateLimit("wallace_bulk", key="api_key"))],
+)
+def get_links_bulk_for_wallace(
+    data: WallaceBulkGetLinksRequest,
+    request: Request,
+):
+    """
+    Bulk get-links for billing runs: many {customer_number, vendors} entries in one call.
+    Streams one NDJSON line per entry, in request order. Entries are processed in chunks of
+    wallace_bulk_chunk_size, each resolved set-wise and minted in one transaction; a chunk's
+    lines are sent only after its links are committed, so Wallace can start emailing early.
+    Unknown customers and entries with no files are reported per line (status "error").
+    """
+    if len(data.entries) > settings.wallace_bulk_max_entries:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Too many entries")
     base = str(request.base_url).rstrip("/")
-    links = generate_links(db, dealer.id, file_ids, base)
-    items = []
-    for link in links:
-        pf = db.get(PriceFile, link.file_id)
-        if pf:
-            url = f"{base}/api/links/download/{link.token}"
-            items.append(
-                WallaceLinkItem(
-                    vendor=pf.vendor.code,
-                    link=url,
-                    filename=pf.filename,
-                    expires_at=link.expires_at,
-                )
-            )
-    return WallaceGetLinksResponse(links=items, dealer_email=dealer.email)
+    release_slot = wallace_slots.acquire()
+    # The background task covers a client that disconnects before the body is started.
+    return StreamingResponse(
+        _stream_bulk_results(data.entries, base, release_slot),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(release_slot),
+    )
@@ -1,6 +1,6 @@
 """File schemas."""
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class FileUploadResponse(BaseModel):
@@ -10,6 +10,8 @@ class FileUploadResponse(BaseModel):
     vendor_id: int
     dealer_id: int | None
     version: str | None
+    content_hash: str | None = None
+    size: int | None = None
     uploaded_at: datetime
     uploaded_by: str | None
 
@@ -24,6 +26,8 @@ class FileResponse(BaseModel):
     vendor_id: int
     dealer_id: int | None
     version: str | None
+    content_hash: str | None = None
+    size: int | None = None
     uploaded_at: datetime
     uploaded_by: str | None
 
@@ -41,3 +45,42 @@ class FileList(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    vendor_code: str
+    dealer_id: int | None = None
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., ge=0)  # total bytes the client will send
+    sha256: str | None = Field(default=None, min_length=64, max_length=64)
+    chunk_size: int | None = Field(default=None, gt=0)  # bytes in every chunk but the last; default upload_chunk_max_mb
+
+
+class UploadSessionStatus(BaseModel):
+    session_id: str
+    filename: str
+    size: int
+    chunk_size: int  # chunk `index` starts at byte index * chunk_size
+    offset: int  # bytes stored so far; the next chunk starts here
+    expires_at: datetime
+
+
+class UploadSessionComplete(BaseModel):
+    sha256: str = Field(..., min_length=64, max_length=64)
+
+
+class BatchManifestEntry(BaseModel):
+    filename: str  # multipart part filename or archive member name
+    vendor_code: str | None = None
+    dealer_id: int | None = None
+    custom_folder: str | None = None  # dealer's custom folder name, used when vendor_code is absent/unknown
+    sha256: str | None = Field(default=None, min_length=64, max_length=64)
+
+
+class BatchUploadResult(BaseModel):
+    filename: str
+    status: str  # "created" or "error"
+    file_id: int | None = None
+    file_path: str | None = None
+    content_hash: str | None = None
+    error: str | None = None
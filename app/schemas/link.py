@@ -1,6 +1,6 @@
 """Download link schemas."""
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class LinkGenerateRequest(BaseModel):
@@ -16,6 +16,7 @@ class LinkResponse(BaseModel):
     expires_at: datetime
     created_at: datetime
     downloaded_at: datetime | None
+    revoked_at: datetime | None = None
     download_url: str | None = None
     # Extra context to help admins distinguish links
     filename: str | None = None
@@ -33,6 +34,40 @@ class LinkDownloadResponse(BaseModel):
     content_type: str = "application/octet-stream"
 
 
+class BundleCreateRequest(BaseModel):
+    dealer_id: int
+    link_ids: list[int] = Field(..., min_length=1)
+
+
+class BundleResponse(BaseModel):
+    token: str
+    download_url: str
+    expires_at: datetime
+    link_count: int
+
+
+class BulkRevokeRequest(BaseModel):
+    """Filters combine; at least one is required."""
+    vendor_id: int | None = None
+    dealer_id: int | None = None
+    file_ids: list[int] | None = None
+
+
+class BulkRevokeResponse(BaseModel):
+    revoked: int
+
+
+class RegenerateLinksRequest(BaseModel):
+    vendor_id: int
+    dealer_ids: list[int] | None = None  # default: every active dealer assigned to the vendor
+
+
+class RegenerateLinksResponse(BaseModel):
+    dealers: int
+    revoked: int
+    generated: int
+
+
 class WallaceGetLinksRequest(BaseModel):
     customer_number: str
     vendors: list[str]  # e.g. ["KEL_SILV", "YAMAHA", "MERCURY"]
@@ -48,3 +83,18 @@ class WallaceLinkItem(BaseModel):
 class WallaceGetLinksResponse(BaseModel):
     links: list[WallaceLinkItem]
     dealer_email: str
+    bundle_link: str | None = None  # one zip of all links, when there are several
+
+
+class WallaceBulkGetLinksRequest(BaseModel):
+    entries: list[WallaceGetLinksRequest] = Field(..., min_length=1)
+
+
+class WallaceBulkLinksResult(BaseModel):
+    """One NDJSON line of the bulk response, per request entry."""
+    customer_number: str
+    status: str  # "ok" or "error"
+    links: list[WallaceLinkItem] = []
+    dealer_email: str | None = None
+    bundle_link: str | None = None
+    error: str | None = None
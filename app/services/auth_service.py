@@ -1,46 +1,91 @@
 """Authentication service."""
+import time
+from typing import NamedTuple
+from sqlalchemy import func, literal, select, true, union_all
 from sqlalchemy.orm import Session
 from app.models import Dealer, Admin
-from app.utils.security import verify_password, get_password_hash, create_access_token, create_refresh_token, decode_token
+from app.utils.security import create_access_token, create_refresh_token, decode_token
+from app.utils.password_hashing import (  # bcrypt runs on the hashing process pool
+    hash_password as _hash_password,
+    verify_password_async,
+)
+from app.utils.executors import run_in_io_executor
+from app.utils.cache import TTLCache
 from app.config import get_settings
 
 settings = get_settings()
 
 
-def authenticate_dealer(db: Session, email: str, password: str) -> Dealer | None:
-    dealer = db.query(Dealer).filter(Dealer.email == email).first()
-    if not dealer or not dealer.active:
-        return None
-    if not verify_password(password, dealer.password_hash):
-        return None
-    return dealer
+class Principal(NamedTuple):
+    """The authenticated caller, as the auth dependencies see it."""
+    id: int
+    type: str  # "dealer" or "admin"
+    email: str
+    active: bool
+    expires: float  # access token expiry, unix seconds
 
 
-def authenticate_admin(db: Session, email: str, password: str) -> Admin | None:
-    admin = db.query(Admin).filter(Admin.email == email).first()
-    if not admin:
-        return None
-    if not verify_password(password, admin.password_hash):
-        return None
-    return admin
+# Access token -> Principal, so repeat requests skip the JWT decode and the user lookup. Changes made
+# through this worker drop entries at once (forget_principal); other workers see them within the TTL.
+_principal_cache: TTLCache[str, Principal] = TTLCache(
+    maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl_seconds
+)
+
+
+class Identity(NamedTuple):
+    """An admin or dealer account, as login sees it."""
+    type: str  # "admin" or "dealer"
+    id: int
+    email: str
+    password_hash: str
+    active: bool
 
 
-def create_tokens_for_dealer(dealer: Dealer) -> tuple[str, str]:
-    payload = {"sub": dealer.email, "type": "dealer", "id": dealer.id}
-    access = create_access_token(payload)
-    refresh = create_refresh_token(payload)
-    return access, refresh
+# Checked when no account matches, so unknown emails take as long to refuse as wrong passwords
+# (same cost factor as get_password_hash; the password behind it was random and discarded).
+_DUMMY_HASH = "$2b$12$WDHtTW46xhTrd.goE8a.9edApVWOP2mufPv2GmUUhxt8CWR1oMahm"
+
+
+def find_identities(db: Session, email: str) -> list[Identity]:
+    """
+    Admins and dealers whose email matches case-insensitively, from one query on the lower(email)
+    indexes. Admins come first, then exact-case matches; usually there is exactly one.
+    """
+    wanted = email.lower()
+    admins = select(
+        literal("admin").label("type"), Admin.id, Admin.email, Admin.password_hash, true().label("active")
+    ).where(func.lower(Admin.email) == wanted)
+    dealers = select(
+        literal("dealer").label("type"), Dealer.id, Dealer.email, Dealer.password_hash, Dealer.active
+    ).where(func.lower(Dealer.email) == wanted)
+    rows = db.execute(union_all(admins, dealers)).all()
+    rows.sort(key=lambda row: (row.type != "admin", row.email != email))
+    return [Identity(row.type, row.id, row.email, row.password_hash, bool(row.active)) for row in rows]
+
+
+async def authenticate_async(db: Session, email: str, password: str) -> Identity | None:
+    """
+    Login for async handlers: one lookup on the I/O executor, bcrypt on the hashing pool. Every
+    outcome costs at least one bcrypt check: unknown emails verify against a dummy hash, and
+    inactive dealers are refused only after their password has been checked.
+    """
+    candidates = await run_in_io_executor(find_identities, db, email)
+    if not candidates:
+        await verify_password_async(password, _DUMMY_HASH)
+        return None
+    for identity in candidates:
+        if await verify_password_async(password, identity.password_hash):
+            return identity if identity.active else None
+    return None
 
 
-def create_tokens_for_admin(admin: Admin) -> tuple[str, str]:
-    payload = {"sub": admin.email, "type": "admin", "id": admin.id}
-    access = create_access_token(payload)
-    refresh = create_refresh_token(payload)
-    return access, refresh
+def create_tokens_for_identity(identity: Identity) -> tuple[str, str]:
+    payload = {"sub": identity.email, "type": identity.type, "id": identity.id}
+    return create_access_token(payload), create_refresh_token(payload)
 
 
 def hash_password(password: str) -> str:
-    return get_password_hash(password)
+    return _hash_password(password)
 
 
 def validate_refresh_token(token: str) -> dict | None:
@@ -48,3 +93,33 @@ def validate_refresh_token(token: str) -> dict | None:
     if not payload or payload.get("token_kind") != "refresh":
         return None
     return payload
+
+
+def resolve_principal(db: Session, token: str) -> Principal | None:
+    """Caller behind an access token; None for invalid, expired or refresh tokens and unknown users."""
+    principal = _principal_cache.get(token)
+    if principal is not None:
+        if principal.expires > time.time():
+            return principal
+        _principal_cache.pop(token)
+        return None
+    payload = decode_token(token)
+    if not payload or payload.get("token_kind") == "refresh" or payload.get("type") not in ("dealer", "admin"):
+        return None
+    user_type = payload["type"]
+    user = db.get(Dealer if user_type == "dealer" else Admin, payload.get("id"))
+    if user is None:
+        return None
+    active = bool(user.active) if user_type == "dealer" else True
+    principal = Principal(user.id, user_type, user.email, active, float(payload["exp"]))
+    _principal_cache.set(token, principal)
+    return principal
+
+
+def forget_principal(user_type: str, user_id: int) -> None:
+    """Drop cached principals of a user whose account was changed or deleted."""
+    _principal_cache.pop_where(lambda _, p: p.type == user_type and p.id == user_id)
+
+
+def principal_cache_stats() -> dict[str, int]:
+    return _principal_cache.stats()
@@ -0,0 +1,117 @@
+"""
+Write-behind download bookkeeping: served downloads are queued in memory and a background thread
+writes them in batches (one multi-row INSERT into download_events plus one UPDATE of first
+downloaded_at per batch), so recording adds no database work to the response path.
+"""
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import NamedTuple
+from sqlalchemy import case, insert, update
+from app.database import SessionLocal
+from app.models import DownloadEvent, DownloadLink
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class _Event(NamedTuple):
+    link_id: int
+    file_id: int
+    dealer_id: int
+    status: int
+    downloaded_at: datetime
+
+
+class DownloadRecorder:
+    """Bounded queue + flusher thread. Events arriving while the queue is full are dropped and counted."""
+
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue[_Event] = queue.Queue(maxsize)
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self.recorded = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def record(self, link_id: int, file_id: int, dealer_id: int, status: int) -> None:
+        try:
+            self._queue.put_nowait(_Event(link_id, file_id, dealer_id, status, datetime.now(timezone.utc)))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="download-recorder", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flusher and write everything still queued."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": self._queue.qsize(), "recorded": self.recorded, "dropped": self.dropped, "failed": self.failed}
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _take_batch(self) -> list[_Event]:
+        batch: list[_Event] = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[_Event]) -> None:
+        first_download: dict[int, datetime] = {}
+        for event in batch:
+            first_download.setdefault(event.link_id, event.downloaded_at)
+        db = SessionLocal()
+        try:
+            db.execute(insert(DownloadEvent).values([event._asdict() for event in batch]))
+            db.execute(
+                update(DownloadLink)
+                .where(DownloadLink.id.in_(first_download), DownloadLink.downloaded_at.is_(None))
+                .values(downloaded_at=case(first_download, value=DownloadLink.id))
+            )
+            db.commit()
+            self.recorded += len(batch)
+        except Exception:
+            db.rollback()
+            self.failed += len(batch)
+            logger.exception("Could not record %d download events", len(batch))
+        finally:
+            db.close()
+
+
+download_recorder = DownloadRecorder(
+    maxsize=settings.download_event_queue_size,
+    batch_size=settings.download_event_batch_size,
+    flush_interval=settings.download_event_flush_seconds,
+)
@@ -1,9 +1,23 @@
 """File upload and storage service."""
+import asyncio
 from datetime import datetime
 from pathlib import Path
+from typing import BinaryIO, Callable, ContextManager, Iterable, NamedTuple
+from sqlalchemy import Integer, column, update, delete, select, text, tuple_, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from app.models import PriceFile, Vendor, Dealer
-from app.utils.storage import save_upload_file, ensure_storage_path
+from app.database import release_db
+from app.models import PriceFile, Vendor, Dealer, DealerVendor, FileBlob
+from app.utils.storage import (
+    StagedUpload,
+    iter_file_chunks,
+    stage_upload_stream,
+    commit_staged_upload,
+    discard_staged_upload,
+    get_blob_relative_path,
+    ensure_storage_path,
+)
+from app.utils.executors import run_in_io_executor
 from app.config import get_settings
 
 settings = get_settings()
@@ -13,34 +27,250 @@ def get_vendor_by_code(db: Session, code: str) -> Vendor | None:
     return db.query(Vendor).filter(Vendor.code == code).first()
 
 
+def _lock_blob_hashes(db: Session, hashes: Iterable[str]) -> None:
+    """
+    Transaction-scoped advisory locks on content hashes, taken in sorted order. Held by an upload
+    from before its blob row exists until it commits, and by remove_deleted_files while it checks
+    for a re-created row and unlinks, so bytes are never removed under a blob that needs them.
+    """
+    db.execute(
+        text(
+            "SELECT pg_advisory_xact_lock(hashtextextended(h, 0)) "
+            "FROM (SELECT unnest(CAST(:hashes AS text[])) AS h ORDER BY 1) AS hashes"
+        ),
+        {"hashes": sorted(set(hashes))},
+    )
+
+
+def _acquire_blobs(db: Session, staged: list[StagedUpload]) -> dict[str, int]:
+    """
+    Insert blob rows or add references to them in one statement; returns sha256 -> blob id.
+    The rows and their hash locks are held until commit. Rows are sorted by hash so concurrent
+    batches lock in the same order.
+    """
+    refs: dict[str, StagedUpload] = {}
+    counts: dict[str, int] = {}
+    for s in staged:
+        refs.setdefault(s.sha256, s)
+        counts[s.sha256] = counts.get(s.sha256, 0) + 1
+    _lock_blob_hashes(db, refs)
+    stmt = pg_insert(FileBlob).values(
+        [
+            {
+                "sha256": sha256,
+                "size": refs[sha256].size,
+                "storage_path": get_blob_relative_path(sha256),
+                "ref_count": counts[sha256],
+            }
+            for sha256 in sorted(refs)
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FileBlob.sha256],
+        set_={"ref_count": FileBlob.ref_count + stmt.excluded.ref_count},
+    ).returning(FileBlob.sha256, FileBlob.id)
+    return {sha256: blob_id for sha256, blob_id in db.execute(stmt)}
+
+
+def _release_blobs(db: Session, counts: dict[int, int]) -> list[tuple[str, str]]:
+    """
+    Drop counts[blob_id] references from each blob in one UPDATE. Returns (storage_path, sha256)
+    of the blobs that lost their last reference; their rows are deleted.
+    """
+    releases = values(column("blob_id", Integer), column("refs", Integer), name="releases").data(sorted(counts.items()))
+    rows = db.execute(
+        update(FileBlob)
+        .where(FileBlob.id == releases.c.blob_id)
+        .values(ref_count=FileBlob.ref_count - releases.c.refs)
+        .returning(FileBlob.id, FileBlob.ref_count, FileBlob.storage_path, FileBlob.sha256)
+    ).all()
+    orphaned = [row for row in rows if row.ref_count <= 0]
+    if orphaned:
+        db.execute(delete(FileBlob).where(FileBlob.id.in_([row.id for row in orphaned])))
+    return [(row.storage_path, row.sha256) for row in orphaned]
+
+
 def create_price_file(
     db: Session,
     vendor_id: int,
     dealer_id: int | None,
     filename: str,
-    file_content: bytes,
+    file_chunks: Iterable[bytes],
     uploaded_by: str,
     version: str | None = None,
+    max_size: int | None = None,
+    expected_sha256: str | None = None,
 ) -> PriceFile:
+    """
+    Stream file_chunks into the content-addressed blob store and record the PriceFile.
+    Identical content is stored once and reference-counted. Raises UploadTooLarge past max_size
+    and ChecksumMismatch if expected_sha256 is given and does not match.
+    The session's connection is released while bytes are written, so objects loaded earlier
+    in the request are detached afterwards.
+    """
     vendor = db.get(Vendor, vendor_id)
     if not vendor:
         raise ValueError("Vendor not found")
-    vendor_code = vendor.code
-    relative_path = save_upload_file(file_content, vendor_code, dealer_id, filename)
-    pf = PriceFile(
-        vendor_id=vendor_id,
-        dealer_id=dealer_id,
-        filename=filename,
-        file_path=relative_path,
-        version=version,
-        uploaded_by=uploaded_by,
-    )
-    db.add(pf)
-    db.commit()
+    release_db(db)
+    staged = stage_upload_stream(file_chunks, max_size=max_size, expected_sha256=expected_sha256)
+    try:
+        # Take the blob's locks before the rename so a concurrent last-reference delete
+        # cannot unlink the file between our rename and our commit.
+        blob_id = _acquire_blobs(db, [staged])[staged.sha256]
+        stored = commit_staged_upload(staged)
+        pf = PriceFile(
+            vendor_id=vendor_id,
+            dealer_id=dealer_id,
+            filename=filename,
+            file_path=stored.relative_path,
+            blob_id=blob_id,
+            content_hash=stored.sha256,
+            size=stored.size,
+            version=version,
+            uploaded_by=uploaded_by,
+        )
+        db.add(pf)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        discard_staged_upload(staged)
     db.refresh(pf)
     return pf
 
 
+async def create_price_file_async(db: Session, *args, **kwargs) -> PriceFile:
+    """create_price_file on the I/O executor, for async handlers."""
+    return await run_in_io_executor(create_price_file, db, *args, **kwargs)
+
+
+class BatchItem(NamedTuple):
+    filename: str
+    vendor_id: int
+    dealer_id: int | None
+    open_source: Callable[[], ContextManager[BinaryIO]]  # opens the part / archive member to read
+    expected_sha256: str | None = None
+
+
+class BatchOutcome(NamedTuple):
+    file_id: int | None = None
+    file_path: str | None = None
+    content_hash: str | None = None
+    error: Exception | None = None
+
+
+class UploadTarget(NamedTuple):
+    vendor_id: int | None  # None when neither the vendor code nor the dealer's custom folder matched
+    dealer_found: bool  # False for a dealer_id that does not exist; True when no dealer was given
+
+
+def resolve_upload_targets(
+    db: Session, refs: list[tuple[str | None, int | None, str | None]]
+) -> list[UploadTarget]:
+    """
+    Map (vendor_code, dealer_id, custom_folder) refs to vendor ids and check their dealer ids, with
+    at most three queries: the dealer ids, vendor codes, then the dealer's custom folder names for
+    refs the code did not resolve. Lets a batch report unknown dealers per entry instead of failing
+    its INSERT on the foreign key.
+    """
+    dealer_ids = {dealer_id for _, dealer_id, _ in refs if dealer_id is not None}
+    known_dealers = {d for (d,) in db.query(Dealer.id).filter(Dealer.id.in_(dealer_ids))} if dealer_ids else set()
+    codes = {code for code, _, _ in refs if code}
+    by_code = dict(db.query(Vendor.code, Vendor.id).filter(Vendor.code.in_(codes)).all()) if codes else {}
+    folders = {
+        (dealer_id, folder)
+        for code, dealer_id, folder in refs
+        if by_code.get(code) is None and dealer_id in known_dealers and folder
+    }
+    by_folder: dict[tuple[int, str], int] = {}
+    if folders:
+        rows = (
+            db.query(DealerVendor.dealer_id, DealerVendor.custom_folder_name, DealerVendor.vendor_id)
+            .filter(tuple_(DealerVendor.dealer_id, DealerVendor.custom_folder_name).in_(list(folders)))
+            .all()
+        )
+        for dealer_id, folder, vendor_id in rows:
+            by_folder.setdefault((dealer_id, folder), vendor_id)
+    return [
+        UploadTarget(
+            by_code.get(code) or by_folder.get((dealer_id, folder)),
+            dealer_id is None or dealer_id in known_dealers,
+        )
+        for code, dealer_id, folder in refs
+    ]
+
+
+def _stage_batch_item(item: BatchItem, max_size: int | None) -> StagedUpload:
+    with item.open_source() as source:
+        return stage_upload_stream(iter_file_chunks(source), max_size=max_size, expected_sha256=item.expected_sha256)
+
+
+def _record_staged_batch(
+    db: Session, items: list[BatchItem], staged: list[StagedUpload], uploaded_by: str
+) -> list[BatchOutcome]:
+    """One transaction: a single blob upsert, then all PriceFile rows in one multi-row INSERT."""
+    try:
+        blob_ids = _acquire_blobs(db, staged)
+        rows = []
+        for item, upload in zip(items, staged):
+            stored = commit_staged_upload(upload)
+            rows.append(
+                PriceFile(
+                    vendor_id=item.vendor_id,
+                    dealer_id=item.dealer_id,
+                    filename=item.filename,
+                    file_path=stored.relative_path,
+                    blob_id=blob_ids[stored.sha256],
+                    content_hash=stored.sha256,
+                    size=stored.size,
+                    uploaded_by=uploaded_by,
+                )
+            )
+        db.add_all(rows)
+        db.flush()
+        outcomes = [BatchOutcome(pf.id, pf.file_path, pf.content_hash) for pf in rows]
+        db.commit()
+        return outcomes
+    except BaseException:
+        db.rollback()
+        raise
+
+
+async def create_price_files_batch(
+    db: Session, items: list[BatchItem], uploaded_by: str, max_size: int | None = None
+) -> list[BatchOutcome]:
+    """
+    Stage every item concurrently on the I/O executor, then record the successful ones in a
+    single transaction. Per-item staging failures (too large, checksum) come back as outcomes
+    with `error` set instead of failing the batch.
+    """
+    release_db(db)
+    staged_or_errors = await asyncio.gather(
+        *(run_in_io_executor(_stage_batch_item, item, max_size) for item in items),
+        return_exceptions=True,
+    )
+    ok = [(i, s) for i, s in enumerate(staged_or_errors) if isinstance(s, StagedUpload)]
+    outcomes = [
+        BatchOutcome(error=s) if isinstance(s, BaseException) else BatchOutcome() for s in staged_or_errors
+    ]
+    try:
+        if ok:
+            recorded = await run_in_io_executor(
+                _record_staged_batch, db, [items[i] for i, _ in ok], [s for _, s in ok], uploaded_by
+            )
+            for (i, _), outcome in zip(ok, recorded):
+                outcomes[i] = outcome
+    finally:
+        for _, s in ok:
+            discard_staged_upload(s)
+    return outcomes
+
+
+async def get_vendor_by_code_async(db: Session, code: str) -> Vendor | None:
+    return await run_in_io_executor(get_vendor_by_code, db, code)
+
+
 def get_file_by_id(db: Session, file_id: int) -> PriceFile | None:
     return db.query(PriceFile).filter(PriceFile.id == file_id).first()
 
@@ -60,9 +290,63 @@ def list_files(
     return q.order_by(PriceFile.uploaded_at.desc()).offset(skip).limit(limit).all()
 
 
+class DeletedFiles(NamedTuple):
+    file_ids: list[int]
+    orphaned: list[tuple[str, str | None]]  # (path, blob sha256 or None) of bytes unreferenced once committed
+
+
+def delete_price_files(db: Session, *criteria) -> DeletedFiles:
+    """
+    Delete the PriceFile rows matching criteria and release their blob references. Run this before
+    deleting a dealer or vendor, whose foreign keys would otherwise cascade past the reference
+    counts. Nothing is removed from disk yet: the caller commits and then passes the result to
+    remove_deleted_files, so a rollback leaves every row pointing at bytes that still exist.
+    """
+    rows = db.execute(
+        delete(PriceFile).where(*criteria).returning(PriceFile.id, PriceFile.blob_id, PriceFile.file_path)
+    ).all()
+    orphaned: list[tuple[str, str | None]] = []
+    counts: dict[int, int] = {}
+    for row in rows:
+        if row.blob_id is None:
+            orphaned.append((row.file_path, None))
+        else:
+            counts[row.blob_id] = counts.get(row.blob_id, 0) + 1
+    if counts:
+        orphaned += _release_blobs(db, counts)
+    return DeletedFiles([row.id for row in rows], orphaned)
+
+
+def remove_deleted_files(db: Session, deleted: DeletedFiles) -> None:
+    """
+    After delete_price_files has been committed: drop the files from this worker's link caches and
+    unlink the bytes nothing references any more. A blob re-created by a concurrent upload of the
+    same content since the commit keeps its bytes.
+    """
+    from app.services.link_service import forget_file
+    from app.utils.storage import delete_file, delete_deltas
+    for file_id in deleted.file_ids:
+        forget_file(file_id)
+    hashes = [sha256 for _, sha256 in deleted.orphaned if sha256 is not None]
+    try:
+        recreated: set[str] = set()
+        if hashes:
+            _lock_blob_hashes(db, hashes)
+            recreated = set(db.scalars(select(FileBlob.sha256).where(FileBlob.sha256.in_(hashes))))
+        for path, sha256 in deleted.orphaned:
+            if sha256 not in recreated:
+                delete_file(path)
+                if sha256 is not None:
+                    delete_deltas(sha256)
+    finally:
+        db.rollback()  # ends the transaction, releasing the hash locks
+
+
 def delete_price_file(db: Session, pf: PriceFile) -> bool:
-    from app.utils.storage import delete_file
-    delete_file(pf.file_path)
-    db.delete(pf)
+    """Delete one file; see delete_price_files."""
+    file_id = pf.id
+    db.expunge(pf)
+    deleted = delete_price_files(db, PriceFile.id == file_id)
     db.commit()
+    remove_deleted_files(db, deleted)
     return True
@@ -0,0 +1,126 @@
+"""
+Google sign-in: authorization code exchange and local ID token verification. Google's signing keys
+(JWKS) are cached in process and refetched when a token names an unknown kid or the cache's
+max-age has passed, so verifying a token costs no round trip of its own.
+"""
+import asyncio
+import re
+import time
+from typing import Any
+import httpx
+from jose import JWTError, jwt
+from app.utils.http_client import get_http_client
+from app.config import get_settings
+
+settings = get_settings()
+
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+
+class GoogleAuthError(ValueError):
+    pass
+
+
+class _Jwks:
+    def __init__(self) -> None:
+        self.keys: dict[str, dict[str, Any]] = {}
+        self.expires = 0.0  # monotonic; from the response's Cache-Control max-age
+        self.fetched = 0.0
+        self.lock = asyncio.Lock()
+
+
+_jwks = _Jwks()
+
+
+def _max_age(cache_control: str | None) -> float:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return float(match.group(1)) if match else float(settings.google_jwks_default_max_age_seconds)
+
+
+async def _refresh_jwks(force: bool) -> None:
+    async with _jwks.lock:
+        now = time.monotonic()
+        # A kid miss forces a refetch, but at most once per google_jwks_min_refresh_seconds, so a
+        # stream of forged tokens cannot turn into a stream of requests to Google.
+        if force and now - _jwks.fetched < settings.google_jwks_min_refresh_seconds:
+            return
+        if not force and now < _jwks.expires:
+            return  # refreshed by a concurrent caller while we waited for the lock
+        try:
+            res = await get_http_client().get(settings.google_jwks_url)
+            res.raise_for_status()
+            keys = {key["kid"]: key for key in res.json()["keys"]}
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            raise GoogleAuthError("Could not fetch Google signing keys") from e
+        _jwks.keys, _jwks.fetched = keys, now
+        _jwks.expires = now + _max_age(res.headers.get("cache-control"))
+
+
+async def _signing_key(kid: str) -> dict[str, Any]:
+    if time.monotonic() >= _jwks.expires:
+        await _refresh_jwks(force=False)
+    if kid not in _jwks.keys:
+        await _refresh_jwks(force=True)
+    key = _jwks.keys.get(kid)
+    if key is None:
+        raise GoogleAuthError("Unknown Google signing key")
+    return key
+
+
+async def verify_id_token(id_token: str, access_token: str | None = None) -> dict[str, Any]:
+    """Check signature, audience, issuer and expiry of a Google ID token locally; returns its claims."""
+    try:
+        header = jwt.get_unverified_header(id_token)
+    except JWTError as e:
+        raise GoogleAuthError("Invalid id_token from Google") from e
+    key = await _signing_key(header.get("kid", ""))
+    try:
+        return jwt.decode(
+            id_token,
+            key,
+            algorithms=["RS256"],
+            audience=settings.google_client_id,
+            issuer=GOOGLE_ISSUERS,
+            access_token=access_token,
+        )
+    except JWTError as e:
+        raise GoogleAuthError("Invalid id_token from Google") from e
+
+
+async def exchange_code(code: str, redirect_uri: str) -> tuple[str, str | None]:
+    """Authorization code -> (id_token, access_token)."""
+    try:
+        res = await get_http_client().post(
+            settings.google_token_url,
+            data={
+                "code": code,
+                "client_id": settings.google_client_id,
+                "client_secret": settings.google_client_secret,
+                "redirect_uri": redirect_uri,
+                "grant_type": "authorization_code",
+            },
+        )
+    except httpx.HTTPError as e:
+        raise GoogleAuthError("Failed to exchange code with Google") from e
+    if res.status_code != 200:
+        raise GoogleAuthError("Failed to exchange code with Google")
+    try:
+        token_json = res.json()
+    except ValueError as e:
+        raise GoogleAuthError("Invalid token response from Google") from e
+    if not isinstance(token_json, dict):
+        raise GoogleAuthError("Invalid token response from Google")
+    id_token = token_json.get("id_token")
+    if not id_token:
+        raise GoogleAuthError("Missing id_token from Google")
+    return id_token, token_json.get("access_token")
+
+
+async def authenticate_code(code: str, redirect_uri: str) -> str:
+    """Exchange and verify; returns the Google account's verified email (one outbound call when keys are cached)."""
+    id_token, access_token = await exchange_code(code, redirect_uri)
+    claims = await verify_id_token(id_token, access_token)
+    email = claims.get("email")
+    if not email or claims.get("email_verified") is False:
+        raise GoogleAuthError("Invalid Google token payload")
+    return email
@@ -0,0 +1,109 @@
+"""Idempotency-Key support: the first response for a key is stored and replayed for retries."""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, NamedTuple
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, delete, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import IdempotencyKey
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class IdempotencyMismatch(ValueError):
+    """The key was already used with a different request body."""
+
+
+class IdempotencyInProgress(ValueError):
+    """Another request holding this key has not finished yet."""
+
+
+def request_fingerprint(body: Any) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(body), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Claim(NamedTuple):
+    lease: datetime | None  # set when the caller now owns the key; pass to complete() / release()
+    stored: Any = None  # otherwise the stored response to replay
+
+
+def claim(db: Session, scope: str, key: str, fingerprint: str) -> Claim:
+    """
+    Take ownership of (scope, key), or return the stored response to replay. Keys older than
+    idempotency_key_ttl_hours are treated as unused, and so are claims left unfinished for longer
+    than idempotency_lease_seconds (the request that took them died), so a retry is not refused
+    with 409 until the key expires.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=settings.idempotency_key_ttl_hours)
+    db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.created_at < cutoff
+        )
+    )
+    stale = now - timedelta(seconds=settings.idempotency_lease_seconds)
+    stmt = pg_insert(IdempotencyKey).values(scope=scope, key=key, request_hash=fingerprint, claimed_at=now)
+    claimed = db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.scope, IdempotencyKey.key],
+            set_={
+                "request_hash": stmt.excluded.request_hash,
+                "claimed_at": stmt.excluded.claimed_at,
+                "created_at": func.now(),
+            },
+            where=and_(IdempotencyKey.response.is_(None), IdempotencyKey.claimed_at < stale),
+        ).returning(IdempotencyKey.key)
+    ).first()
+    db.commit()
+    if claimed:
+        return Claim(now)
+    row = db.get(IdempotencyKey, (scope, key))
+    if row is not None and row.request_hash != fingerprint:
+        raise IdempotencyMismatch("Idempotency-Key was already used with a different request")
+    if row is None or row.response is None:
+        raise IdempotencyInProgress("A request with this Idempotency-Key is still in progress")
+    return Claim(None, json.loads(row.response))
+
+
+def _owned(scope: str, key: str, lease: datetime):
+    # A claim taken over after its lease ran out is no longer ours to complete or release.
+    return and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.claimed_at == lease)
+
+
+def complete(db: Session, scope: str, key: str, lease: datetime, response: Any) -> None:
+    db.execute(
+        update(IdempotencyKey)
+        .where(_owned(scope, key, lease))
+        .values(response=json.dumps(jsonable_encoder(response)))
+    )
+    db.commit()
+
+
+def release(db: Session, scope: str, key: str, lease: datetime) -> None:
+    """Give up a claim after a failed request so the client can retry with the same key."""
+    db.rollback()
+    db.execute(delete(IdempotencyKey).where(_owned(scope, key, lease), IdempotencyKey.response.is_(None)))
+    db.commit()
+
+
+def run_idempotent(db: Session, scope: str, key: str | None, body: Any, produce: Callable[[], Any]) -> tuple[Any, bool]:
+    """
+    Run produce() at most once per (scope, key) and return (result, replayed). Retries get the
+    stored JSON result with replayed=True. Without a key, produce() simply runs. If produce raises,
+    the key is released so the request can be retried.
+    """
+    if not key:
+        return produce(), False
+    lease, stored = claim(db, scope, key, request_fingerprint(body))
+    if lease is None:
+        return stored, True
+    try:
+        result = produce()
+    except BaseException:
+        release(db, scope, key, lease)
+        raise
+    complete(db, scope, key, lease, result)
+    return result, False
@@ -1,13 +1,22 @@
 """Download link generation and validation."""
+import logging
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import NamedTuple
+from sqlalchemy import Integer, Row, String, and_, column, exists, func, insert, or_, select, text, true, tuple_, union_all, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from app.models import DownloadLink, PriceFile, Dealer
-from app.utils.security import create_download_token
+from app.models import DownloadBundle, DownloadBundleLink, DownloadLink, PriceFile, Dealer, DealerVendor, Vendor
+from app.models.link import REUSABLE_SLOT_PREDICATE
+from app.utils.cache import TTLCache
+from app.utils.security import create_download_token, create_signed_download_token, verify_signed_download_token
+from app.services import revocation_service
+from app.services.download_recorder import download_recorder
 from app.utils.storage import get_full_path
 from app.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 
 def _utc_now() -> datetime:
@@ -15,59 +24,590 @@ def _utc_now() -> datetime:
     return datetime.now(timezone.utc)
 
 
-def generate_links(db: Session, dealer_id: int, file_ids: list[int], base_url: str) -> list[DownloadLink]:
-    """Generate secure download links for given dealer and files."""
+class GeneratedLink(NamedTuple):
+    """A created download link with the file/vendor context callers render, loaded up front."""
+    id: int
+    file_id: int
+    dealer_id: int
+    token: str
+    expires_at: datetime
+    created_at: datetime
+    downloaded_at: datetime | None
+    filename: str
+    version: str | None
+    vendor_code: str
+    vendor_name: str
+
+
+_LINK_COLUMNS = (
+    DownloadLink.id, DownloadLink.dealer_id, DownloadLink.file_id,
+    DownloadLink.token, DownloadLink.expires_at, DownloadLink.created_at,
+)
+# Matches the partial unique index on download_links: one open reusable link per (dealer, file).
+_REUSABLE_SLOT = and_(DownloadLink.reusable, DownloadLink.downloaded_at.is_(None), DownloadLink.revoked_at.is_(None))
+
+
+def _link_values(db: Session, pairs: list[tuple[int, int]], expires_at: datetime, reusable: bool) -> list[dict]:
+    """Row values for new links, one per (dealer_id, file_id) pair, each with a fresh token."""
+    if settings.download_token_format == "signed":
+        # Signed tokens embed the link id, so ids are drawn from the sequence before the insert.
+        link_ids = db.execute(
+            select(func.nextval("download_links_id_seq")).select_from(func.generate_series(1, len(pairs)))
+        ).scalars().all()
+        return [
+            {"id": link_id, "dealer_id": dealer_id, "file_id": file_id, "expires_at": expires_at, "reusable": reusable,
+             "token": create_signed_download_token(link_id, file_id, dealer_id, expires_at)}
+            for (dealer_id, file_id), link_id in zip(pairs, link_ids)
+        ]
+    return [
+        {"dealer_id": dealer_id, "file_id": file_id, "expires_at": expires_at, "reusable": reusable,
+         "token": create_download_token()}
+        for dealer_id, file_id in pairs
+    ]
+
+
+def _reuse_or_insert_links(db: Session, pairs: set[tuple[int, int]], expires_at: datetime) -> dict[tuple[int, int], Row]:
+    """
+    Return an open reusable link per (dealer_id, file_id), inserting only where none exists.
+    The partial unique index arbitrates concurrent callers: ON CONFLICT DO NOTHING, then read the
+    winner's row. Slots with less than link_reuse_min_remaining_hours left are retired first so
+    callers always get a link with a useful lifetime.
+    """
+    pair_in = tuple_(DownloadLink.dealer_id, DownloadLink.file_id).in_
+    retire_before = _utc_now() + timedelta(hours=settings.link_reuse_min_remaining_hours)
+    db.execute(
+        update(DownloadLink)
+        .where(_REUSABLE_SLOT, pair_in(list(pairs)), DownloadLink.expires_at < retire_before)
+        .values(reusable=False)
+    )
+    found: dict[tuple[int, int], Row] = {}
+    for _ in range(3):  # a reused slot can be downloaded/revoked between the insert and the read
+        missing = sorted(pairs - found.keys())
+        if not missing:
+            break
+        stmt = pg_insert(DownloadLink).values(_link_values(db, missing, expires_at, reusable=True))
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[DownloadLink.dealer_id, DownloadLink.file_id], index_where=text(REUSABLE_SLOT_PREDICATE)
+        ).returning(*_LINK_COLUMNS)
+        found.update({(row.dealer_id, row.file_id): row for row in db.execute(stmt)})
+        taken = [pair for pair in missing if pair not in found]
+        if taken:
+            existing = db.execute(select(*_LINK_COLUMNS).where(_REUSABLE_SLOT, pair_in(taken)))
+            found.update({(row.dealer_id, row.file_id): row for row in existing})
+    return found
+
+
+def _insert_links(db: Session, requests: list[tuple[int, list[int]]]) -> list[list[GeneratedLink]]:
+    """
+    Create links for several (dealer_id, file_ids) requests with one file query and one multi-row
+    INSERT ... RETURNING; the caller commits. Unknown files and files belonging to another dealer
+    are skipped. With link_reuse, an existing open link for the same dealer and file is returned
+    instead of a new one. Returns the links per request, in request order.
+    """
+    all_ids = {file_id for _, file_ids in requests for file_id in file_ids}
+    files = {
+        row.id: row
+        for row in db.execute(
+            select(PriceFile.id, PriceFile.dealer_id, PriceFile.filename, PriceFile.version,
+                   Vendor.code.label("vendor_code"), Vendor.name.label("vendor_name"))
+            .join(Vendor, Vendor.id == PriceFile.vendor_id)
+            .where(PriceFile.id.in_(all_ids))
+        )
+    } if all_ids else {}
+    expires_at = _utc_now() + timedelta(days=settings.download_link_expire_days)
+    wanted = [
+        [
+            files[file_id]
+            for file_id in file_ids
+            if file_id in files and not (files[file_id].dealer_id and files[file_id].dealer_id != dealer_id)
+        ]
+        for dealer_id, file_ids in requests
+    ]
+    pairs = [(dealer_id, pf.id) for (dealer_id, _), pfs in zip(requests, wanted) for pf in pfs]
+    if not pairs:
+        return [[] for _ in requests]
+    if settings.link_reuse:
+        by_pair = _reuse_or_insert_links(db, set(pairs), expires_at)
+        rows = iter([by_pair.get(pair) for pair in pairs])
+    else:
+        values = _link_values(db, pairs, expires_at, reusable=False)
+        inserted = {
+            row.token: row
+            for row in db.execute(insert(DownloadLink).values(values).returning(*_LINK_COLUMNS))
+        }
+        rows = iter([inserted[v["token"]] for v in values])
+    result = []
+    for pfs in wanted:
+        links = []
+        for pf in pfs:
+            row = next(rows)
+            if row is None:
+                continue
+            links.append(GeneratedLink(
+                id=row.id,
+                file_id=pf.id,
+                dealer_id=row.dealer_id,
+                token=row.token,
+                expires_at=row.expires_at,
+                created_at=row.created_at,
+                downloaded_at=None,
+                filename=pf.filename,
+                version=pf.version,
+                vendor_code=pf.vendor_code,
+                vendor_name=pf.vendor_name,
+            ))
+        result.append(links)
+    return result
+
+
+def generate_links(db: Session, dealer_id: int, file_ids: list[int], base_url: str) -> list[GeneratedLink]:
+    """
+    Generate secure download links for given dealer and files. Unknown files and files belonging
+    to another dealer are skipped. Three round trips regardless of len(file_ids): the dealer, the
+    files joined to their vendors, and one multi-row INSERT ... RETURNING (a couple more with
+    link_reuse).
+    """
     dealer = db.get(Dealer, dealer_id)
     if not dealer or not dealer.active:
         raise ValueError("Dealer not found or inactive")
-    links_created = []
-    expires_at = _utc_now() + timedelta(days=settings.download_link_expire_days)
-    for file_id in file_ids:
-        pf = db.get(PriceFile, file_id)
-        if not pf:
-            continue
-        if pf.dealer_id and pf.dealer_id != dealer_id:
-            continue
-        token = create_download_token()
-        link = DownloadLink(
-            file_id=file_id,
-            dealer_id=dealer_id,
-            token=token,
-            expires_at=expires_at,
-        )
-        db.add(link)
-        links_created.append((link, pf))
+    links = _insert_links(db, [(dealer_id, file_ids)])[0]
     db.commit()
-    for link in links_created:
-        db.refresh(link[0])
-    return [l[0] for l in links_created]
+    return links
+
+
+def generate_links_bulk(db: Session, requests: list[tuple[int, list[int]]]) -> list[list[GeneratedLink]]:
+    """generate_links for many (dealer_id, file_ids) pairs in one transaction. Dealers must be active."""
+    try:
+        links = _insert_links(db, requests)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return links
+
+
+def resolve_latest_files_bulk(db: Session, requests: list[tuple[int, list[str]]]) -> list[list[int]]:
+    """
+    resolve_latest_files for many (dealer_id, vendor_refs) pairs. Only the requested pairs are
+    resolved (a VALUES list, not dealers x refs), and each picks its file with a LATERAL top-1 over
+    the dealer's own and the shared files of the vendor, which the (vendor_id, dealer_id,
+    uploaded_at) index serves. Pairs with neither get a second top-1 over any file of the vendor.
+    """
+    pairs = sorted({(dealer_id, ref) for dealer_id, vendor_refs in requests for ref in vendor_refs})
+    if not pairs:
+        return [[] for _ in requests]
+    pair_rows = values(column("dealer_id", Integer), column("ref", String), name="pairs").data(pairs)
+    wanted = select(pair_rows.c.dealer_id, pair_rows.c.ref).cte("wanted")
+    by_code = select(wanted.c.dealer_id, wanted.c.ref, Vendor.id.label("vendor_id")).join(
+        Vendor, Vendor.code == wanted.c.ref
+    )
+    by_folder = (
+        select(wanted.c.dealer_id, wanted.c.ref, DealerVendor.vendor_id)
+        .join(
+            DealerVendor,
+            and_(DealerVendor.dealer_id == wanted.c.dealer_id, DealerVendor.custom_folder_name == wanted.c.ref),
+        )
+        .where(~exists().where(Vendor.code == wanted.c.ref))
+    )
+    resolved = union_all(by_code, by_folder).subquery("resolved")
+    own_or_shared = (
+        select(PriceFile.id.label("file_id"))
+        .where(
+            PriceFile.vendor_id == resolved.c.vendor_id,
+            or_(PriceFile.dealer_id == resolved.c.dealer_id, PriceFile.dealer_id.is_(None)),
+        )
+        .order_by(PriceFile.dealer_id.is_(None), PriceFile.uploaded_at.desc(), PriceFile.id.desc())
+        .limit(1)
+        .lateral("own_or_shared")
+    )
+    rows = db.execute(
+        select(resolved.c.dealer_id, resolved.c.ref, resolved.c.vendor_id, own_or_shared.c.file_id)
+        .select_from(resolved)
+        .outerjoin(own_or_shared, true())
+    ).all()
+    latest = {(row.dealer_id, row.ref): row.file_id for row in rows if row.file_id is not None}
+    unresolved = {row.vendor_id for row in rows if row.file_id is None}
+    if unresolved:
+        missing = values(column("vendor_id", Integer), name="missing").data([(v,) for v in sorted(unresolved)])
+        any_file = (
+            select(PriceFile.id.label("file_id"))
+            .where(PriceFile.vendor_id == missing.c.vendor_id)
+            .order_by(PriceFile.uploaded_at.desc(), PriceFile.id.desc())
+            .limit(1)
+            .lateral("any_file")
+        )
+        fallback = dict(db.execute(select(missing.c.vendor_id, any_file.c.file_id).join(any_file, true())).all())
+        for row in rows:
+            if row.file_id is None and row.vendor_id in fallback:
+                latest[(row.dealer_id, row.ref)] = fallback[row.vendor_id]
+    return [
+        [latest[(dealer_id, ref)] for ref in vendor_refs if (dealer_id, ref) in latest]
+        for dealer_id, vendor_refs in requests
+    ]
+
+
+def resolve_latest_files(db: Session, dealer_id: int, vendor_refs: list[str]) -> list[int]:
+    """
+    Map vendor codes (or this dealer's custom folder names) to the latest price file for each, in
+    one query: the dealer's own file first, then the shared file, then any file for the vendor.
+    Returns file ids in vendor_refs order; refs with no vendor or no file are left out.
+    """
+    return resolve_latest_files_bulk(db, [(dealer_id, vendor_refs)])[0]
 
 
 def get_link_by_token(db: Session, token: str) -> tuple[DownloadLink, PriceFile] | None:
-    """Validate token and return (link, price_file) or None."""
-    link = db.query(DownloadLink).filter(DownloadLink.token == token).first()
-    if not link:
-        return None
-    # Compare with timezone-aware UTC now (DB returns aware datetimes for DateTime(timezone=True))
-    if link.expires_at < _utc_now():
-        return None
-    pf = db.get(PriceFile, link.file_id)
-    if not pf:
+    """
+    Validate token and return (link, price_file) or None. One query; expiry, revocation and the
+    dealer being active are checked in SQL.
+    """
+    row = (
+        db.query(DownloadLink, PriceFile)
+        .join(PriceFile, PriceFile.id == DownloadLink.file_id)
+        .join(Dealer, Dealer.id == DownloadLink.dealer_id)
+        .filter(
+            DownloadLink.token == token,
+            DownloadLink.revoked_at.is_(None),
+            DownloadLink.expires_at > _utc_now(),
+            Dealer.active == True,
+        )
+        .first()
+    )
+    return (row[0], row[1]) if row else None
+
+
+class FileInfo(NamedTuple):
+    """The PriceFile columns the download path reads; rows are immutable once written."""
+    id: int
+    vendor_id: int
+    dealer_id: int | None
+    filename: str
+    file_path: str
+    blob_id: int | None
+    content_hash: str | None
+
+
+class DownloadGrant(NamedTuple):
+    """
+    A resolved download token, as cached per token. There is no downloaded flag: every served
+    download is queued for download_recorder, which sets a link's first downloaded_at itself, so
+    the download path never needs to know whether a link was used before.
+    """
+    link_id: int
+    dealer_id: int
+    expires: float  # unix seconds
+    file: FileInfo
+
+
+_file_info_cache: TTLCache[int, FileInfo] = TTLCache(maxsize=4096, ttl=settings.file_meta_cache_ttl_seconds)
+# Opaque tokens are resolved repeatedly (utility retries, browser prefetch); entries are dropped on
+# revoke/delete in this worker and re-checked against the revocation snapshot on every hit.
+_token_cache: TTLCache[str, DownloadGrant] = TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl_seconds)
+
+
+def _file_info(pf: PriceFile) -> FileInfo:
+    return FileInfo(pf.id, pf.vendor_id, pf.dealer_id, pf.filename, pf.file_path, pf.blob_id, pf.content_hash)
+
+
+def get_file_info(db: Session, file_id: int) -> FileInfo | None:
+    info = _file_info_cache.get(file_id)
+    if info is None:
+        pf = db.get(PriceFile, file_id)
+        if pf is None:
+            return None
+        info = _file_info(pf)
+        _file_info_cache.set(file_id, info)
+    return info
+
+
+def forget_file(file_id: int) -> None:
+    """Drop a deleted file, and cached tokens for it, from this worker's caches."""
+    _file_info_cache.pop(file_id)
+    _token_cache.pop_where(lambda _, grant: grant.file.id == file_id)
+
+
+def forget_dealer_links(dealer_id: int) -> None:
+    """Drop cached tokens of a deleted dealer (their links are gone with it)."""
+    _token_cache.pop_where(lambda _, grant: grant.dealer_id == dealer_id)
+
+
+def cache_stats() -> dict[str, dict[str, int]]:
+    return {"download_tokens": _token_cache.stats(), "file_metadata": _file_info_cache.stats()}
+
+
+def download_recorder_stats() -> dict[str, int]:
+    return download_recorder.stats()
+
+
+def resolve_download(db: Session, token: str) -> DownloadGrant | None:
+    """
+    Validate a download token, signed or opaque. A signed token whose MAC, expiry and revocation
+    status check out in memory (and whose file metadata is cached) costs no database round trip;
+    anything the in-memory state cannot vouch for falls back to the token lookup.
+    """
+    now = _utc_now().timestamp()
+    signed = verify_signed_download_token(token)
+    if signed is not None:
+        if signed.expires < now:
+            return None
+        verdict = revocation_service.check_link(signed.link_id, signed.dealer_id)
+        if verdict is False:
+            return None
+        if verdict:
+            info = get_file_info(db, signed.file_id)
+            return DownloadGrant(signed.link_id, signed.dealer_id, signed.expires, info) if info else None
+    grant = _token_cache.get(token)
+    if grant is not None:
+        if grant.expires >= now and revocation_service.check_link(grant.link_id, grant.dealer_id) is not False:
+            return grant
+        _token_cache.pop(token)
+    pair = get_link_by_token(db, token)
+    if not pair:
         return None
-    return link, pf
+    link, pf = pair
+    info = _file_info(pf)
+    _file_info_cache.set(pf.id, info)
+    grant = DownloadGrant(link.id, link.dealer_id, link.expires_at.timestamp(), info)
+    _token_cache.set(token, grant)
+    return grant
+
+
+def record_download(grant: DownloadGrant, status_code: int) -> None:
+    """Queue a served download for write-behind recording (history row, first downloaded_at)."""
+    download_recorder.record(grant.link_id, grant.file.id, grant.dealer_id, status_code)
+
+
+def _revoke_where(db: Session, *criteria) -> list[Row]:
+    """Revoke every unexpired, unrevoked link matching criteria in one UPDATE; the caller commits."""
+    return db.execute(
+        update(DownloadLink)
+        .where(*criteria, DownloadLink.revoked_at.is_(None), DownloadLink.expires_at > _utc_now())
+        .values(revoked_at=_utc_now())
+        .returning(DownloadLink.id, DownloadLink.token)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _forget_revoked(rows: list[Row]) -> list[int]:
+    """Apply committed revocations to this worker's token checks; returns the revoked ids."""
+    revoked = [row.id for row in rows]
+    revocation_service.record_revocations(revoked)
+    for row in rows:
+        _token_cache.pop(row.token)
+    return revoked
 
 
-def mark_downloaded(db: Session, link: DownloadLink) -> None:
-    if link.downloaded_at is None:
-        link.downloaded_at = _utc_now()
+def revoke_links(db: Session, link_ids: list[int]) -> list[int]:
+    """Revoke links; returns the ids actually revoked. Applied to this worker's token checks at once."""
+    rows = _revoke_where(db, DownloadLink.id.in_(link_ids))
+    db.commit()
+    return _forget_revoked(rows)
+
+
+def _link_filter(vendor_id: int | None, dealer_ids: list[int] | None, file_ids: list[int] | None) -> list:
+    criteria = []
+    if vendor_id is not None:
+        criteria.append(DownloadLink.file_id.in_(select(PriceFile.id).where(PriceFile.vendor_id == vendor_id)))
+    if dealer_ids is not None:
+        criteria.append(DownloadLink.dealer_id.in_(dealer_ids))
+    if file_ids is not None:
+        criteria.append(DownloadLink.file_id.in_(file_ids))
+    return criteria
+
+
+def revoke_links_matching(
+    db: Session,
+    vendor_id: int | None = None,
+    dealer_id: int | None = None,
+    file_ids: list[int] | None = None,
+) -> int:
+    """Revoke all active links for a vendor, a dealer and/or a set of files (filters combine) in one UPDATE."""
+    criteria = _link_filter(vendor_id, [dealer_id] if dealer_id is not None else None, file_ids)
+    if not criteria:
+        raise ValueError("Give a vendor, dealer or files to revoke links for")
+    rows = _revoke_where(db, *criteria)
+    db.commit()
+    return len(_forget_revoked(rows))
+
+
+class RegeneratedLinks(NamedTuple):
+    dealers: int
+    revoked: int
+    generated: int
+
+
+def regenerate_vendor_links(db: Session, vendor_id: int, dealer_ids: list[int] | None = None) -> RegeneratedLinks:
+    """
+    Reissue a vendor's links after a corrected upload, in one transaction: revoke the vendor's
+    active links (one UPDATE), then mint a link to the latest file for every active dealer assigned
+    to the vendor, link_regenerate_chunk_size dealers per INSERT. dealer_ids narrows both steps.
+    """
+    vendor = db.get(Vendor, vendor_id)
+    if not vendor:
+        raise ValueError("Vendor not found")
+    entitled = select(DealerVendor.dealer_id).join(Dealer, Dealer.id == DealerVendor.dealer_id).where(
+        DealerVendor.vendor_id == vendor_id, Dealer.active == True
+    )
+    if dealer_ids is not None:
+        entitled = entitled.where(DealerVendor.dealer_id.in_(dealer_ids))
+    dealers = sorted(set(db.scalars(entitled)))
+    try:
+        rows = _revoke_where(db, *_link_filter(vendor_id, dealer_ids, None))
+        generated = 0
+        size = settings.link_regenerate_chunk_size
+        for i in range(0, len(dealers), size):
+            chunk = dealers[i:i + size]
+            file_ids = resolve_latest_files_bulk(db, [(dealer_id, [vendor.code]) for dealer_id in chunk])
+            minted = _insert_links(db, [(dealer_id, ids) for dealer_id, ids in zip(chunk, file_ids) if ids])
+            generated += sum(len(links) for links in minted)
         db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return RegeneratedLinks(len(dealers), len(_forget_revoked(rows)), generated)
+
 
+class BundleEntry(NamedTuple):
+    grant: DownloadGrant
+    vendor_code: str
 
-def get_file_content(link: DownloadLink, price_file: PriceFile) -> tuple[Path, str]:
+
+class CreatedBundle(NamedTuple):
+    token: str
+    expires_at: datetime
+    link_count: int
+
+
+def _insert_bundles(db: Session, requests: list[tuple[int, list[tuple[int, datetime]]]]) -> list[CreatedBundle]:
+    """One INSERT for the bundles and one for their link rows, for (dealer_id, [(link_id, expires_at)]). Caller commits."""
+    values = [
+        {"dealer_id": dealer_id, "token": create_download_token(), "expires_at": max(exp for _, exp in links)}
+        for dealer_id, links in requests
+    ]
+    rows = db.execute(insert(DownloadBundle).returning(DownloadBundle.id, DownloadBundle.token), values).all()
+    bundle_ids = {row.token: row.id for row in rows}
+    db.execute(
+        insert(DownloadBundleLink),
+        [
+            {"bundle_id": bundle_ids[v["token"]], "link_id": link_id, "position": position}
+            for v, (_, links) in zip(values, requests)
+            for position, (link_id, _) in enumerate(links)
+        ],
+    )
+    return [CreatedBundle(v["token"], v["expires_at"], len(links)) for v, (_, links) in zip(values, requests)]
+
+
+def create_bundles_for_links(db: Session, link_sets: list[list[GeneratedLink]]) -> list[CreatedBundle]:
+    """Bundle freshly generated links, one bundle per list (each list belongs to one dealer)."""
+    requests = []
+    for links in link_sets:
+        unique = {link.id: link for link in links}.values()
+        requests.append((links[0].dealer_id, [(link.id, link.expires_at) for link in unique]))
+    if not requests:
+        return []
+    bundles = _insert_bundles(db, requests)
+    db.commit()
+    return bundles
+
+
+def create_bundle(db: Session, dealer_id: int, link_ids: list[int]) -> CreatedBundle:
+    """Bundle existing links of one dealer. Links that are unknown, another dealer's, expired or revoked are skipped."""
+    rows = db.execute(
+        select(DownloadLink.id, DownloadLink.expires_at).where(
+            DownloadLink.id.in_(link_ids),
+            DownloadLink.dealer_id == dealer_id,
+            DownloadLink.revoked_at.is_(None),
+            DownloadLink.expires_at > _utc_now(),
+        )
+    ).all()
+    live = {row.id: row.expires_at for row in rows}
+    ordered = [(link_id, live[link_id]) for link_id in dict.fromkeys(link_ids) if link_id in live]
+    if not ordered:
+        raise ValueError("No live links for this dealer")
+    bundle = _insert_bundles(db, [(dealer_id, ordered)])[0]
+    db.commit()
+    return bundle
+
+
+def resolve_bundle(db: Session, token: str) -> list[BundleEntry]:
+    """
+    The links of a bundle that can still be downloaded, in bundle order, from one query.
+    Per-link expiry and revocation apply exactly as for the links' own tokens; an unknown or
+    expired bundle, or one of an inactive dealer, resolves to no entries.
+    """
+    now = _utc_now()
+    rows = db.execute(
+        select(
+            DownloadLink.id,
+            DownloadLink.dealer_id,
+            DownloadLink.expires_at,
+            PriceFile.id,
+            PriceFile.vendor_id,
+            PriceFile.dealer_id,
+            PriceFile.filename,
+            PriceFile.file_path,
+            PriceFile.blob_id,
+            PriceFile.content_hash,
+            Vendor.code,
+        )
+        .select_from(DownloadBundle)
+        .join(DownloadBundleLink, DownloadBundleLink.bundle_id == DownloadBundle.id)
+        .join(DownloadLink, DownloadLink.id == DownloadBundleLink.link_id)
+        .join(PriceFile, PriceFile.id == DownloadLink.file_id)
+        .join(Vendor, Vendor.id == PriceFile.vendor_id)
+        .join(Dealer, Dealer.id == DownloadBundle.dealer_id)
+        .where(
+            DownloadBundle.token == token,
+            DownloadBundle.expires_at > now,
+            DownloadLink.revoked_at.is_(None),
+            DownloadLink.expires_at > now,
+            Dealer.active == True,
+        )
+        .order_by(DownloadBundleLink.position)
+    ).all()
+    return [
+        BundleEntry(DownloadGrant(row[0], row[1], row[2].timestamp(), FileInfo(*row[3:10])), row[10])
+        for row in rows
+        if not revocation_service.is_revoked(row[0])
+    ]
+
+
+def record_bundle_download(entries: list[BundleEntry]) -> None:
+    """A fully sent bundle counts as one download of each link in it."""
+    for entry in entries:
+        record_download(entry.grant, 200)
+
+
+def get_file_content(link: DownloadLink | None, price_file: PriceFile | FileInfo) -> tuple[Path, str]:
     """Return (full_path, filename) for streaming download."""
     path = get_full_path(price_file.file_path)
     return path, price_file.filename
 
 
+def is_delta_base(db: Session, price_file: PriceFile | FileInfo, base_sha256: str) -> bool:
+    """
+    True if base_sha256 is a stored earlier version in the same vendor/dealer series as price_file.
+    Ids follow upload order, so a base must have a lower id; a later version is never used.
+    """
+    q = db.query(PriceFile.id).filter(
+        PriceFile.vendor_id == price_file.vendor_id,
+        PriceFile.content_hash == base_sha256,
+        PriceFile.blob_id.isnot(None),
+        PriceFile.id < price_file.id,
+    )
+    if price_file.dealer_id is None:
+        q = q.filter(PriceFile.dealer_id.is_(None))
+    else:
+        q = q.filter(PriceFile.dealer_id == price_file.dealer_id)
+    return q.first() is not None
+
+
 def get_dealer_by_customer_number(db: Session, customer_number: str) -> Dealer | None:
     return db.query(Dealer).filter(Dealer.customer_number == customer_number, Dealer.active == True).first()
+
+
+def get_dealers_by_customer_numbers(db: Session, customer_numbers: list[str]) -> dict[str, Dealer]:
+    """Active dealers keyed by customer number, in one query."""
+    if not customer_numbers:
+        return {}
+    dealers = db.query(Dealer).filter(Dealer.customer_number.in_(set(customer_numbers)), Dealer.active == True).all()
+    return {d.customer_number: d for d in dealers}
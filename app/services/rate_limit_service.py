@@ -0,0 +1,118 @@
+"""
+Token-bucket rate limiting. A policy "<burst>/<seconds>" allows bursts of `burst` requests per key,
+refilled evenly over `seconds`. Buckets live in this worker's memory by default, or in Postgres
+(rate_limit_backend = "postgres") so that every worker draws from the same bucket.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import RateLimitBucket
+from app.utils.cache import TTLCache
+from app.config import get_settings
+
+settings = get_settings()
+
+MEMORY_MAX_KEYS = 100_000  # per policy; least recently used buckets are forgotten (i.e. refilled) first
+
+
+class RatePolicy(NamedTuple):
+    burst: int
+    seconds: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens refilled per second."""
+        return self.burst / self.seconds
+
+
+def parse_policy(spec: str) -> RatePolicy | None:
+    """'10/60' -> RatePolicy(10, 60.0); '' means no limit."""
+    if not spec.strip():
+        return None
+    burst, _, seconds = spec.partition("/")
+    policy = RatePolicy(int(burst), float(seconds))
+    if policy.burst < 1 or policy.seconds <= 0:
+        raise ValueError(f"Invalid rate limit policy: {spec!r}")
+    return policy
+
+
+# A bucket untouched for policy.seconds is full again, so each policy's buckets expire after that long.
+_memory_buckets: dict[RatePolicy, TTLCache[str, tuple[float, float]]] = {}
+_memory_lock = threading.Lock()
+
+
+def _take_memory(key: str, policy: RatePolicy) -> float:
+    with _memory_lock:
+        buckets = _memory_buckets.get(policy)
+        if buckets is None:
+            buckets = _memory_buckets[policy] = TTLCache(maxsize=MEMORY_MAX_KEYS, ttl=policy.seconds)
+        now = time.monotonic()
+        tokens, updated = buckets.get(key) or (float(policy.burst), now)
+        tokens = min(float(policy.burst), tokens + (now - updated) * policy.rate)
+        if tokens < 1:
+            buckets.set(key, (tokens, now))
+            return (1 - tokens) / policy.rate
+        buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+
+def _take_postgres(db: Session, key: str, policy: RatePolicy) -> float:
+    """
+    One upsert per request: refill, and take a token only if a whole one is there (the WHERE on
+    DO UPDATE). Concurrent requests for a key serialise on its row. No row back means refused.
+    """
+    refilled = func.least(
+        policy.burst,
+        RateLimitBucket.tokens + func.extract("epoch", func.now() - RateLimitBucket.updated_at) * policy.rate,
+    )
+    stmt = (
+        pg_insert(RateLimitBucket)
+        .values(key=key, tokens=policy.burst - 1, updated_at=func.now())
+        .on_conflict_do_update(
+            index_elements=[RateLimitBucket.key],
+            set_={"tokens": refilled - 1, "updated_at": func.now()},
+            where=refilled >= 1,
+        )
+        .returning(RateLimitBucket.tokens)
+    )
+    taken = db.execute(stmt).first()
+    if taken is not None:
+        db.commit()
+        return 0.0
+    tokens = db.execute(select(refilled).where(RateLimitBucket.key == key)).scalar()
+    db.commit()
+    return (1 - (tokens or 0.0)) / policy.rate
+
+
+_refused: dict[str, int] = {}
+
+
+def take(db: Session, scope: str, identity: str, policy: RatePolicy) -> float:
+    """Take a token from the (scope, identity) bucket. Returns 0 if allowed, else seconds until one is available."""
+    key = f"{scope}:{identity}"
+    if settings.rate_limit_backend == "postgres":
+        retry_after = _take_postgres(db, key, policy)
+    else:
+        retry_after = _take_memory(key, policy)
+    if retry_after:
+        _refused[scope] = _refused.get(scope, 0) + 1
+    return retry_after
+
+
+def delete_idle_buckets(db: Session, idle: timedelta) -> int:
+    """Shared buckets untouched for longer than any policy's window are full; dropping them changes nothing."""
+    cutoff = datetime.now(timezone.utc) - idle
+    return db.execute(delete(RateLimitBucket).where(RateLimitBucket.updated_at < cutoff)).rowcount
+
+
+def rate_limit_stats() -> dict:
+    """Requests refused per scope by this worker, and its in-memory bucket count."""
+    return {
+        "backend": settings.rate_limit_backend,
+        "memory_buckets": sum(len(buckets) for buckets in _memory_buckets.values()),
+        "refused": dict(_refused),
+    }
@@ -0,0 +1,81 @@
+"""
+Retention for download_links: links expired for more than link_retention_days are moved, in
+small batches, to download_links_archive (without their token) or dropped. Keeps the live table,
+and its token/slot indexes, sized to the links that can still be used. Bundles past retention go too.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import DownloadBundle, DownloadLink, DownloadLinkArchive, IdempotencyKey
+from app.services.rate_limit_service import delete_idle_buckets
+from app.utils.executors import run_in_io_executor
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_ARCHIVED_COLUMNS = ("id", "file_id", "dealer_id", "expires_at", "created_at", "downloaded_at", "revoked_at")
+
+
+def _purge_batch(db: Session, cutoff: datetime, batch_size: int, archive: bool) -> int:
+    """
+    One statement per batch: pick the oldest expired ids (SKIP LOCKED, so workers purging at the
+    same time take different rows), delete them and, when archiving, insert the returned rows.
+    """
+    doomed = (
+        select(DownloadLink.id)
+        .where(DownloadLink.expires_at < cutoff)
+        .order_by(DownloadLink.expires_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .cte("doomed")
+    )
+    removed = delete(DownloadLink).where(DownloadLink.id.in_(select(doomed.c.id)))
+    if not archive:
+        return db.execute(removed).rowcount
+    moved = removed.returning(*(getattr(DownloadLink, c) for c in _ARCHIVED_COLUMNS)).cte("moved")
+    return db.execute(
+        insert(DownloadLinkArchive).from_select(list(_ARCHIVED_COLUMNS), select(*(moved.c[c] for c in _ARCHIVED_COLUMNS)))
+    ).rowcount
+
+
+def purge_expired_links(db: Session) -> int:
+    """Purge everything past retention, committing per batch. Returns how many links were removed."""
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(days=settings.link_retention_days)
+    total = 0
+    while True:
+        count = _purge_batch(db, cutoff, settings.link_purge_batch_size, settings.link_archive_on_purge)
+        db.commit()
+        total += count
+        if count < settings.link_purge_batch_size:
+            break
+    db.execute(delete(DownloadBundle).where(DownloadBundle.expires_at < cutoff))
+    stale_keys = now - timedelta(hours=settings.idempotency_key_ttl_hours)
+    db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < stale_keys))
+    delete_idle_buckets(db, timedelta(days=1))  # longer than any rate limit window
+    db.commit()
+    return total
+
+
+def run_purge() -> int:
+    db = SessionLocal()
+    try:
+        return purge_expired_links(db)
+    finally:
+        db.close()
+
+
+async def purge_links_forever() -> None:
+    """Background task started with the app."""
+    while True:
+        await asyncio.sleep(settings.link_purge_interval_seconds)
+        try:
+            purged = await run_in_io_executor(run_purge)
+            if purged:
+                logger.info("Purged %d expired download links", purged)
+        except Exception:
+            logger.exception("Download link purge failed")
@@ -0,0 +1,111 @@
+"""
+In-memory view of revoked links and active dealers, so signed download tokens can be validated
+without a database round trip. Each worker reloads it every revocation_refresh_seconds;
+revocations made by this worker apply immediately, other workers pick them up on their next reload.
+"""
+import asyncio
+import logging
+import threading
+from typing import NamedTuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Dealer, DownloadLink
+from app.utils.executors import run_in_io_executor
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot(NamedTuple):
+    revoked_link_ids: frozenset[int]
+    active_dealer_ids: frozenset[int]
+    inactive_dealer_ids: frozenset[int]
+
+
+_snapshot: _Snapshot | None = None
+_local_revocations: set[int] = set()  # revoked in this process, not yet seen in a snapshot
+_local_dealer_status: dict[int, bool] = {}  # dealer active flags changed in this process, likewise
+_lock = threading.Lock()
+
+
+def load_snapshot(db: Session) -> None:
+    """Reload revoked (unexpired) link ids and the active and inactive dealer ids."""
+    global _snapshot
+    revoked = frozenset(
+        db.execute(
+            select(DownloadLink.id).where(DownloadLink.revoked_at.isnot(None), DownloadLink.expires_at > func.now())
+        ).scalars()
+    )
+    active: set[int] = set()
+    inactive: set[int] = set()
+    for dealer_id, is_active in db.execute(select(Dealer.id, Dealer.active)):
+        (active if is_active else inactive).add(dealer_id)
+    with _lock:
+        _local_revocations.difference_update(revoked)
+        for dealer_id, is_active in list(_local_dealer_status.items()):
+            if dealer_id in (active if is_active else inactive):
+                del _local_dealer_status[dealer_id]
+        _snapshot = _Snapshot(revoked, frozenset(active), frozenset(inactive))
+
+
+def refresh_revocations() -> None:
+    db = SessionLocal()
+    try:
+        load_snapshot(db)
+    finally:
+        db.close()
+
+
+async def refresh_revocations_forever() -> None:
+    """Background task started with the app."""
+    while True:
+        try:
+            await run_in_io_executor(refresh_revocations)
+        except Exception:
+            logger.exception("Revocation snapshot refresh failed")
+        await asyncio.sleep(settings.revocation_refresh_seconds)
+
+
+def record_revocations(link_ids: list[int]) -> None:
+    """Apply revocations made by this process right away."""
+    with _lock:
+        _local_revocations.update(link_ids)
+
+
+def record_dealer_status(dealer_id: int, active: bool) -> None:
+    """Apply a dealer (de)activation made by this process right away."""
+    with _lock:
+        _local_dealer_status[dealer_id] = active
+
+
+def is_revoked(link_id: int) -> bool:
+    """Revoked as far as this worker knows (its own revocations plus the last snapshot)."""
+    with _lock:
+        snapshot = _snapshot
+        if link_id in _local_revocations:
+            return True
+    return snapshot is not None and link_id in snapshot.revoked_link_ids
+
+
+def check_link(link_id: int, dealer_id: int) -> bool | None:
+    """
+    False if the link is revoked or its dealer is known to be inactive, True if neither and the
+    dealer is known to be active, None when the snapshot cannot tell (not loaded yet, or a dealer
+    newer than it) and the DB must decide.
+    """
+    with _lock:
+        snapshot = _snapshot
+        if link_id in _local_revocations:
+            return False
+        dealer_active = _local_dealer_status.get(dealer_id)
+    if dealer_active is False:
+        return False
+    if snapshot is None:
+        return None
+    if link_id in snapshot.revoked_link_ids or dealer_id in snapshot.inactive_dealer_ids:
+        return False
+    if dealer_active or dealer_id in snapshot.active_dealer_ids:
+        return True
+    return None
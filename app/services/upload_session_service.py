@@ -0,0 +1,184 @@
+"""Resumable upload sessions for the Wallace utility: partial uploads persisted on disk."""
+import asyncio
+import fcntl
+import json
+import logging
+import re
+import secrets
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple
+from app.utils.storage import ensure_storage_path
+from app.utils.executors import run_in_io_executor
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+class OffsetMismatch(ValueError):
+    """A chunk was sent for an offset past what the server has stored."""
+
+    def __init__(self, current_offset: int):
+        super().__init__(f"Expected offset <= {current_offset}")
+        self.current_offset = current_offset
+
+
+class SessionBusy(ValueError):
+    """Another request is already finalizing this session."""
+
+
+class UploadSession(NamedTuple):
+    id: str
+    vendor_id: int
+    dealer_id: int | None
+    filename: str
+    size: int
+    sha256: str | None
+    chunk_size: int
+    created_at: float
+    offset: int
+    updated_at: float
+
+
+def _sessions_root() -> Path:
+    root = ensure_storage_path() / "uploads"
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def _session_dir(session_id: str) -> Path | None:
+    if not _SESSION_ID.match(session_id):
+        return None
+    return _sessions_root() / session_id
+
+
+def create_session(
+    vendor_id: int, dealer_id: int | None, filename: str, size: int, sha256: str | None, chunk_size: int
+) -> UploadSession:
+    session_id = secrets.token_urlsafe(24)
+    folder = _sessions_root() / session_id
+    folder.mkdir()
+    meta = {
+        "vendor_id": vendor_id,
+        "dealer_id": dealer_id,
+        "filename": filename,
+        "size": size,
+        "sha256": sha256.lower() if sha256 else None,
+        "chunk_size": chunk_size,
+        "created_at": time.time(),
+    }
+    (folder / "data.part").touch()
+    (folder / "session.json").write_text(json.dumps(meta))
+    return get_session(session_id)
+
+
+def get_session(session_id: str) -> UploadSession | None:
+    folder = _session_dir(session_id)
+    if folder is None:
+        return None
+    try:
+        meta = json.loads((folder / "session.json").read_text())
+        part = (folder / "data.part").stat()
+    except (FileNotFoundError, ValueError):
+        return None
+    meta.setdefault("chunk_size", settings.upload_chunk_max_mb * 1024 * 1024)  # sessions created before chunk_size
+    return UploadSession(id=session_id, offset=part.st_size, updated_at=part.st_mtime, **meta)
+
+
+def get_part_path(session_id: str) -> Path:
+    return _session_dir(session_id) / "data.part"
+
+
+def write_chunk(session: UploadSession, index: int, offset: int, data: bytes) -> int:
+    """
+    Write chunk number index at offset and return the stored size. The offset must be
+    index * chunk_size, and only the last chunk may be shorter than chunk_size. offset may be
+    below the stored size (a retried chunk is written again) but not above it; a late retry of an
+    earlier chunk never cuts off the chunks stored after it. Locked so concurrent PUTs from
+    several workers cannot interleave.
+    """
+    if offset != index * session.chunk_size:
+        raise ValueError(f"Chunk {index} starts at offset {index * session.chunk_size}")
+    if len(data) > session.chunk_size or (len(data) < session.chunk_size and offset + len(data) != session.size):
+        raise ValueError(f"Chunks must be {session.chunk_size} bytes, except the last")
+    with open(get_part_path(session.id), "r+b") as part:
+        fcntl.flock(part, fcntl.LOCK_EX)
+        current = part.seek(0, 2)
+        if offset > current:
+            raise OffsetMismatch(current)
+        if offset + len(data) > session.size:
+            raise ValueError("Chunk runs past the declared file size")
+        part.seek(offset)
+        part.write(data)
+        return max(current, offset + len(data))
+
+
+@contextmanager
+def finalizing(session_id: str) -> Iterator[BinaryIO]:
+    """
+    Open a session's data for reading under an exclusive lock (SessionBusy if already held).
+    The session is removed when the block exits without error, so it is finalized once.
+    """
+    with open(get_part_path(session_id), "rb") as part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SessionBusy("Upload session is already being finalized")
+        yield part
+        delete_session(session_id)
+
+
+def delete_session(session_id: str) -> None:
+    folder = _session_dir(session_id)
+    if folder is not None:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def _remove_unless_locked(folder: Path) -> bool:
+    """Remove a session folder unless a chunk write or finalize holds its data lock."""
+    try:
+        part = open(folder / "data.part", "rb")
+    except FileNotFoundError:
+        shutil.rmtree(folder, ignore_errors=True)
+        return True
+    with part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        shutil.rmtree(folder, ignore_errors=True)
+        return True
+
+
+def reap_expired_sessions() -> int:
+    """
+    Delete sessions with no chunk written for upload_session_ttl_hours. Returns how many. Sessions
+    being written or finalized right now are skipped, and reaped on a later pass if still idle.
+    """
+    cutoff = time.time() - settings.upload_session_ttl_hours * 3600
+    reaped = 0
+    for folder in _sessions_root().iterdir():
+        try:
+            last_activity = max(p.stat().st_mtime for p in (folder, folder / "data.part") if p.exists())
+        except (FileNotFoundError, ValueError):
+            continue
+        if last_activity < cutoff and _remove_unless_locked(folder):
+            reaped += 1
+    return reaped
+
+
+async def reap_sessions_forever() -> None:
+    """Background task started with the app: periodically reap abandoned sessions."""
+    while True:
+        await asyncio.sleep(settings.upload_session_reap_interval_seconds)
+        try:
+            reaped = await run_in_io_executor(reap_expired_sessions)
+            if reaped:
+                logger.info("Reaped %d abandoned upload sessions", reaped)
+        except Exception:
+            logger.exception("Upload session reaper failed")
@@ -0,0 +1,378 @@
+"""HTTP download responses: byte ranges, strong ETags and conditional GET/HEAD for stored files."""
+import io
+import os
+import secrets
+import zipfile
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+from urllib.parse import quote
+
+import anyio
+from fastapi import Request
+from starlette.responses import FileResponse, Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16  # more than this and we serve the whole file rather than a fragmented multipart body
+# Already-compressed formats go into zip bundles stored: deflating them again costs CPU and saves nothing.
+ZIP_STORED_SUFFIXES = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar",
+    ".xlsx", ".xlsm", ".docx", ".pdf", ".jpg", ".jpeg", ".png",
+})
+
+
+def make_etag(content_hash: str | None, stat_result: os.stat_result) -> str:
+    """Strong ETag from the stored content hash; rows without one fall back to size + mtime."""
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'"{stat_result.st_size:x}-{int(stat_result.st_mtime * 1_000_000):x}"'
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition_type}; filename*=utf-8''{quoted}"
+    return f'{disposition_type}; filename="{filename}"'
+
+
+def negotiate_encoding(accept_encoding: str | None, offered: list[str]) -> str | None:
+    """
+    Pick a content-coding from Accept-Encoding among `offered` (server preference order).
+    Highest q wins, ties go to the server's order; None means send the identity bytes.
+    """
+    if not accept_encoding:
+        return None
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[name] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _etag_list(value: str) -> list[str]:
+    return [tag.strip() for tag in value.split(",") if tag.strip()]
+
+
+def _weak_match(header_value: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored."""
+    for tag in _etag_list(header_value):
+        if tag == "*" or tag.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+
+def _if_range_allows(header_value: str, etag: str, last_modified: str) -> bool:
+    """If-Range needs a strong ETag match, or an exact Last-Modified date."""
+    value = header_value.strip()
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag and not etag.startswith("W/")
+    return value == last_modified
+
+
+def parse_range_header(value: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse a `bytes=` Range header into sorted, coalesced inclusive (start, end) pairs.
+    Returns None when the header is malformed or unsupported (serve the full file),
+    and an empty list when no range is satisfiable (416).
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges: list[tuple[int, int]] = []
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+    for part in parts:
+        start_s, sep, end_s = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                suffix = int(end_s)
+                if suffix < 0:
+                    return None
+                if suffix == 0 or size == 0:
+                    continue
+                ranges.append((max(size - suffix, 0), size - 1))
+                continue
+            start = int(start_s)
+            end = int(end_s) if end_s else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FileRangeResponse(Response):
+    """206 response streaming one or more byte ranges of a file (multipart/byteranges for several)."""
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        ranges: list[tuple[int, int]],
+        size: int,
+        media_type: str,
+        headers: dict[str, str],
+    ) -> None:
+        self.path = path
+        self.status_code = 206
+        self.background = None
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.parts = [(b"", start, end)]
+            self.closing = b""
+            self.media_type = media_type
+            headers = {**headers, "content-range": f"bytes {start}-{end}/{size}"}
+        else:
+            boundary = secrets.token_hex(16)
+            self.parts = []
+            for i, (start, end) in enumerate(ranges):
+                part_header = (
+                    f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts.append(((b"\r\n" if i else b"") + part_header, start, end))
+            self.closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            self.media_type = f"multipart/byteranges; boundary={boundary}"
+        length = sum(len(prefix) + end - start + 1 for prefix, start, end in self.parts) + len(self.closing)
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for prefix, start, end in self.parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": self.closing, "more_body": False})
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """
+    FileResponse that hands the open file to the server via the `http.response.zerocopysend`
+    ASGI extension (os.sendfile) when the server advertises it; otherwise behaves exactly like
+    FileResponse (which itself prefers `http.response.pathsend`).
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            self.stat_result is None
+            or scope["method"].upper() == "HEAD"
+            or "http.response.zerocopysend" not in scope.get("extensions", {})
+        ):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        with open(self.path, "rb") as file:
+            await send({"type": "http.response.zerocopysend", "file": file, "count": self.stat_result.st_size})
+        if self.background is not None:
+            await self.background()
+
+
+def offload_headers(mode: str, relative_path: str, full_path: Path, internal_prefix: str) -> dict[str, str] | None:
+    """
+    Headers telling a fronting web server to send the bytes itself: nginx `X-Accel-Redirect` to
+    an `internal` location aliased to storage_path, or Apache/lighttpd `X-Sendfile` with the
+    absolute path. None for the in-process modes.
+    """
+    if mode == "x-accel-redirect":
+        return {"x-accel-redirect": f"{internal_prefix.rstrip('/')}/{quote(relative_path)}"}
+    if mode == "x-sendfile":
+        return {"x-sendfile": str(full_path.resolve())}
+    return None
+
+
+def file_download_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    content_hash: str | None = None,
+    media_type: str = "application/octet-stream",
+    encoded_variant: Callable[[str], Path | None] | None = None,
+    encodings: list[str] | None = None,
+    min_compress_size: int = 0,
+    offload: dict[str, str] | None = None,
+    zero_copy: bool = False,
+) -> Response:
+    """
+    Build the response for a stored file honouring If-None-Match (304), Range/If-Range (206/416)
+    and HEAD. Falls back to a plain 200 FileResponse.
+    With encoded_variant, full-body requests are served from a pre-compressed variant chosen from
+    Accept-Encoding (with its own ETag); ranges always address the identity bytes.
+    With offload headers (see offload_headers) the app still answers conditionals but leaves the
+    body, ranges included, to the fronting server; encoding negotiation is then that server's job.
+    zero_copy serves full bodies through ZeroCopyFileResponse.
+    """
+    if offload:
+        encoded_variant = None
+    file_response_class = ZeroCopyFileResponse if zero_copy else FileResponse
+    stat_result = path.stat()
+    size = stat_result.st_size
+    etag = make_etag(content_hash, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+        "content-disposition": content_disposition(filename),
+    }
+    range_header = request.headers.get("range")
+
+    if encoded_variant is not None and encodings:
+        headers["vary"] = "Accept-Encoding"
+        encoding = None
+        if not range_header and size >= min_compress_size:
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"), encodings)
+        variant = encoded_variant(encoding) if encoding else None
+        if variant is not None:
+            variant_stat = variant.stat()
+            # Incompressible content (already-zipped spreadsheets) is cheaper to send as-is.
+            if variant_stat.st_size < size:
+                variant_etag = f'{etag[:-1]}-{encoding}"'
+                if_none_match = request.headers.get("if-none-match")
+                if if_none_match is not None and _weak_match(if_none_match, variant_etag):
+                    return Response(
+                        status_code=304,
+                        headers={"etag": variant_etag, "last-modified": last_modified, "vary": "Accept-Encoding"},
+                    )
+                headers.update({"etag": variant_etag, "content-encoding": encoding})
+                return file_response_class(variant, headers=headers, media_type=media_type, stat_result=variant_stat)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _weak_match(if_none_match, etag):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k in ("etag", "last-modified", "vary")})
+
+    if offload:
+        return Response(headers={**headers, **offload}, media_type=media_type)
+
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or _if_range_allows(if_range, etag, last_modified)):
+        ranges = parse_range_header(range_header, size)
+        if ranges == []:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+        if ranges:
+            return FileRangeResponse(path, ranges, size, media_type, headers)
+
+    return file_response_class(path, headers=headers, media_type=media_type, stat_result=stat_result)
+
+
+def delta_download_response(
+    delta_path: Path,
+    filename: str,
+    base_sha256: str,
+    target_sha256: str,
+    im: str,
+) -> Response:
+    """
+    RFC 3229 style 226 IM Used response carrying a binary delta from base_sha256 to target_sha256.
+    ETag is the target instance's, so the client can verify what it reconstructs.
+    """
+    headers = {
+        "etag": f'"{target_sha256}"',
+        "im": im,
+        "delta-base": f'"{base_sha256}"',
+        "content-disposition": content_disposition(filename),
+        "cache-control": "no-transform",
+    }
+    return FileResponse(delta_path, status_code=226, headers=headers, media_type="application/octet-stream")
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable ZipFile target; drain() hands out what has been written since the last call."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(members: Iterable[tuple[str, Path]], on_complete: Callable[[], None] | None = None) -> Iterator[bytes]:
+    """
+    Yield a zip archive of (arcname, path) members while it is being built. Files are read
+    CHUNK_SIZE at a time and, the target not being seekable, each entry's CRC and sizes follow it
+    in a data descriptor, so memory stays at about a chunk and nothing is written to disk.
+    on_complete runs only once the last byte has been handed out.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for arcname, path in members:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            stored = os.path.splitext(arcname)[1].lower() in ZIP_STORED_SUFFIXES  # stored blobs have no suffix
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, "rb") as src, archive.open(info, "w") as dest:
+                while chunk := src.read(CHUNK_SIZE):
+                    dest.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            if data := sink.drain():
+                yield data
+    yield sink.drain()  # central directory
+    if on_complete is not None:
+        on_complete()
+
+
+def zip_download_response(
+    members: list[tuple[str, Path]],
+    filename: str,
+    on_complete: Callable[[], None] | None = None,
+) -> Response:
+    """Streamed zip of several stored files. Built on the fly, so there is no Content-Length, ETag or Range support."""
+    return StreamingResponse(
+        iter_zip(members, on_complete),
+        media_type="application/zip",
+        headers={"content-disposition": content_disposition(filename), "cache-control": "no-store"},
+    )
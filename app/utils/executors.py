@@ -0,0 +1,39 @@
+"""Dedicated thread pool for blocking disk and database work awaited from async handlers."""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+from app.config import get_settings
+
+T = TypeVar("T")
+
+_io_executor: ThreadPoolExecutor | None = None
+_io_executor_lock = threading.Lock()
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Return the process-wide I/O executor, sized by io_executor_workers (separate from AnyIO's pool)."""
+    global _io_executor
+    if _io_executor is None:
+        with _io_executor_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=get_settings().io_executor_workers,
+                    thread_name_prefix="file-io",
+                )
+    return _io_executor
+
+
+async def run_in_io_executor(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking callable on the I/O executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_io_executor() -> None:
+    global _io_executor
+    with _io_executor_lock:
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=True)
+            _io_executor = None
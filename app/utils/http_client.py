@@ -0,0 +1,24 @@
+"""Process-wide pooled httpx.AsyncClient for outbound calls from async handlers."""
+import httpx
+from app.config import get_settings
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client: opened at startup, or on first use outside the app (scripts)."""
+    global _client
+    if _client is None:
+        settings = get_settings()
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.outbound_http_timeout_seconds),
+            limits=httpx.Limits(max_connections=settings.outbound_http_max_connections, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
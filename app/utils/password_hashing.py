@@ -0,0 +1,137 @@
+"""
+bcrypt off the request threads. Hashing and verification run in a small dedicated process pool
+(password_hash_workers), so a burst of logins neither occupies AnyIO's shared thread pool nor
+competes with downloads for its cores. At most workers + password_hash_queue_size operations are
+admitted at a time; past that, callers get PasswordHashingBusy straight away (a 503) instead of
+queueing behind the burst.
+"""
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable
+from app.utils.executors import get_io_executor
+from app.utils.security import get_password_hash as _bcrypt_hash, verify_password as _bcrypt_verify
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class PasswordHashingBusy(RuntimeError):
+    """All workers are busy and the admission queue is full."""
+
+
+class _OpStats:
+    __slots__ = ("count", "failed", "rejected", "total_seconds", "max_seconds")
+
+    def __init__(self) -> None:
+        self.count = self.failed = self.rejected = 0
+        self.total_seconds = self.max_seconds = 0.0
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_capacity = max(settings.password_hash_workers, 1) + settings.password_hash_queue_size
+_slots = threading.BoundedSemaphore(_capacity)
+_stats = {"hash": _OpStats(), "verify": _OpStats()}
+_stats_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor | None:
+    """
+    The hashing pool, or None when password_hash_workers is 0 (e.g. in development): bcrypt then
+    runs on the calling thread for the sync API and on the I/O executor for the async one, never
+    on the event loop.
+    """
+    global _pool
+    if settings.password_hash_workers <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: forking a process that already runs threads can deadlock the child
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.password_hash_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def _record(op: str, seconds: float, failed: bool) -> None:
+    with _stats_lock:
+        stats = _stats[op]
+        stats.count += 1
+        stats.failed += failed
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+
+def _submit(op: str, func: Callable[..., Any], *args: Any, inline_executor: Executor | None = None) -> Future:
+    if not _slots.acquire(blocking=False):
+        with _stats_lock:
+            _stats[op].rejected += 1
+        raise PasswordHashingBusy("Too many password operations in progress, retry shortly")
+    started = time.perf_counter()
+
+    def done(future: Future) -> None:
+        _slots.release()
+        _record(op, time.perf_counter() - started, future.cancelled() or future.exception() is not None)
+
+    try:
+        pool = _get_pool() or inline_executor
+        if pool is not None:
+            future = pool.submit(func, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(done)
+    return future
+
+
+def hash_password(password: str) -> str:
+    return _submit("hash", _bcrypt_hash, password).result()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return _submit("verify", _bcrypt_verify, plain_password, hashed_password).result()
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_submit("hash", _bcrypt_hash, password, inline_executor=get_io_executor()))
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(
+        _submit("verify", _bcrypt_verify, plain_password, hashed_password, inline_executor=get_io_executor())
+    )
+
+
+def password_hashing_stats() -> dict[str, Any]:
+    """Admission and per-operation latency (submit to result, queueing included) for runtime-stats."""
+    with _stats_lock:
+        ops = {
+            op: {
+                "count": s.count,
+                "failed": s.failed,
+                "rejected": s.rejected,
+                "avg_ms": round(s.total_seconds / s.count * 1000, 1) if s.count else 0.0,
+                "max_ms": round(s.max_seconds * 1000, 1),
+            }
+            for op, s in _stats.items()
+        }
+    return {"workers": settings.password_hash_workers, "capacity": _capacity, **ops}
+
+
+def shutdown_password_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -1,5 +1,10 @@
-"""Security utilities: JWT, password hashing."""
+"""Security utilities: JWT, password hashing, download tokens."""
+import base64
+import hashlib
+import hmac
+import struct
 from datetime import datetime, timedelta
+from typing import NamedTuple
 import bcrypt
 from jose import JWTError, jwt
 from app.config import get_settings
@@ -43,3 +48,52 @@ def decode_token(token: str) -> dict | None:
 def create_download_token() -> str:
     import secrets
     return secrets.token_urlsafe(48)
+
+
+SIGNED_TOKEN_PREFIX = "s1."  # opaque tokens are urlsafe base64 and never contain "."
+_SIGNED_PAYLOAD = struct.Struct(">QIII")  # link id, file id, dealer id, expiry (unix seconds)
+_SIGNED_MAC_BYTES = 16
+
+
+class SignedDownloadToken(NamedTuple):
+    link_id: int
+    file_id: int
+    dealer_id: int
+    expires: int  # unix seconds
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _download_token_mac(signed_part: str) -> bytes:
+    key = (settings.download_token_secret or settings.jwt_secret).encode("utf-8")
+    return hmac.new(key, signed_part.encode("ascii"), hashlib.sha256).digest()[:_SIGNED_MAC_BYTES]
+
+
+def create_signed_download_token(link_id: int, file_id: int, dealer_id: int, expires_at: datetime) -> str:
+    """Self-describing HMAC token (53 chars, fits download_links.token): s1.<payload>.<mac>."""
+    payload = _SIGNED_PAYLOAD.pack(link_id, file_id, dealer_id, int(expires_at.timestamp()))
+    signed_part = SIGNED_TOKEN_PREFIX + _b64encode(payload)
+    return f"{signed_part}.{_b64encode(_download_token_mac(signed_part))}"
+
+
+def verify_signed_download_token(token: str) -> SignedDownloadToken | None:
+    """Decode a signed token if its MAC is valid (expiry is left to the caller). None otherwise."""
+    if not token.startswith(SIGNED_TOKEN_PREFIX):
+        return None
+    signed_part, sep, mac = token.rpartition(".")
+    if not sep:
+        return None
+    try:
+        given = _b64decode(mac)
+        fields = _SIGNED_PAYLOAD.unpack(_b64decode(signed_part[len(SIGNED_TOKEN_PREFIX):]))
+    except (ValueError, struct.error):
+        return None
+    if not hmac.compare_digest(given, _download_token_mac(signed_part)):
+        return None
+    return SignedDownloadToken(*fields)
@@ -1,10 +1,34 @@
 """File storage utilities."""
+import gzip
+import hashlib
+import logging
 import os
-import shutil
+import tempfile
+import threading
+from functools import partial
 from pathlib import Path
+from typing import BinaryIO, Callable, Hashable, Iterable, Iterator, NamedTuple
 from app.config import get_settings
+from app.utils.executors import get_io_executor
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised while streaming an upload once it exceeds the configured size limit."""
+
+
+class ChecksumMismatch(ValueError):
+    """Raised when uploaded bytes do not hash to the SHA-256 the client declared."""
+
+
+class StoredFile(NamedTuple):
+    relative_path: str
+    size: int
+    sha256: str
 
 
 def ensure_storage_path() -> Path:
@@ -13,20 +37,271 @@ def ensure_storage_path() -> Path:
     return path
 
 
-def get_file_path(vendor_code: str, dealer_id: int | None, filename: str) -> Path:
+def get_blob_relative_path(sha256: str) -> str:
+    """Blobs are sharded two levels deep by hash prefix: blobs/ab/cd/abcd..."""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def iter_file_chunks(fileobj: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a file-like object's contents in chunks of at most chunk_size bytes."""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _hash_only(chunks: Iterable[bytes], max_size: int | None) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+        digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+class StagedUpload(NamedTuple):
+    tmp_path: Path | None  # None when identical content was already stored and has only been verified
+    size: int
+    sha256: str
+
+
+def stage_upload_stream(
+    chunks: Iterable[bytes],
+    max_size: int | None = None,
+    expected_sha256: str | None = None,
+) -> StagedUpload:
+    """
+    Stream chunks to a temp file under blobs/tmp, hashing on the fly. Raises UploadTooLarge as
+    soon as max_size is exceeded and ChecksumMismatch if expected_sha256 does not match. When the
+    declared blob is already stored the stream is only hashed and nothing is written.
+    Follow with commit_staged_upload() and always discard_staged_upload().
+    """
     base = ensure_storage_path()
-    if dealer_id:
-        folder = base / vendor_code / str(dealer_id)
-    else:
-        folder = base / vendor_code
-    folder.mkdir(parents=True, exist_ok=True)
-    return folder / filename
+    expected = expected_sha256.lower() if expected_sha256 else None
+    if expected and (base / get_blob_relative_path(expected)).is_file():
+        size, sha256 = _hash_only(chunks, max_size)
+        if sha256 != expected:
+            raise ChecksumMismatch("Uploaded content does not match the declared SHA-256")
+        return StagedUpload(None, size, sha256)
+
+    tmp_dir = base / "blobs" / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=tmp_dir, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in chunks:
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        if expected and sha256 != expected:
+            raise ChecksumMismatch("Uploaded content does not match the declared SHA-256")
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return StagedUpload(Path(tmp_name), size, sha256)
+
+
+def commit_staged_upload(staged: StagedUpload) -> StoredFile:
+    """Atomically rename a staged upload to its hash path, unless identical content is already there."""
+    relative_path = get_blob_relative_path(staged.sha256)
+    final = get_full_path(relative_path)
+    if staged.tmp_path is None:
+        if not final.is_file():
+            # The only copy was removed by a concurrent delete after staging verified it.
+            raise FileNotFoundError(relative_path)
+    elif not final.is_file():
+        final.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged.tmp_path, final)
+    return StoredFile(relative_path, staged.size, staged.sha256)
+
+
+def discard_staged_upload(staged: StagedUpload) -> None:
+    if staged.tmp_path is not None:
+        staged.tmp_path.unlink(missing_ok=True)
+
+
+class _BuildQueue:
+    """
+    Derived files (compressed variants, deltas) built off the request path: keyed jobs waiting in
+    arrival order, worked through one at a time by a single task on the I/O executor. A key already
+    waiting is not added twice, and jobs beyond max_pending are dropped (the next request for them
+    schedules them again). The job at the head stays queued while it runs.
+    """
+
+    def __init__(self, name: str, max_pending: int):
+        self.name, self.max_pending = name, max_pending
+        self._jobs: dict[Hashable, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._running = False
+
+    def schedule(self, key: Hashable, job: Callable[[], None]) -> None:
+        with self._lock:
+            if key in self._jobs or len(self._jobs) >= self.max_pending:
+                return
+            self._jobs[key] = job
+            if self._running:
+                return
+            self._running = True
+        try:
+            get_io_executor().submit(self._run)
+        except RuntimeError:  # executor shut down
+            with self._lock:
+                self._jobs.clear()
+                self._running = False
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._jobs:
+                    self._running = False
+                    return
+                key, job = next(iter(self._jobs.items()))
+            try:
+                job()
+            except Exception:
+                logger.exception("Building %s %s failed", self.name, key)
+            finally:
+                with self._lock:
+                    self._jobs.pop(key, None)
+
+
+def _write_atomically(dest: Path, build: Callable[[Path], None], prefix: str) -> None:
+    """build() into a temp file next to dest, then rename it into place."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=dest.parent, prefix=prefix, suffix=".part")
+    os.close(fd)
+    try:
+        build(Path(tmp_name))
+        os.replace(tmp_name, dest)
+    finally:
+        Path(tmp_name).unlink(missing_ok=True)
+
+
+VARIANT_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+_variant_builds = _BuildQueue("variant", settings.variant_queue_size)
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _compress_file(src: Path, dest: Path, encoding: str) -> None:
+    with open(src, "rb") as fin, open(dest, "wb") as fout:
+        if encoding == "gzip":
+            # mtime=0 keeps the variant byte-identical across regenerations
+            with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=6, mtime=0) as gz:
+                for chunk in iter_file_chunks(fin):
+                    gz.write(chunk)
+        else:
+            import zstandard
+            zstandard.ZstdCompressor(level=10).copy_stream(fin, fout, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+
+def _write_variant(src: Path, dest: Path, encoding: str) -> None:
+    if dest.is_file() or not src.is_file():
+        return
+    _write_atomically(dest, lambda tmp: _compress_file(src, tmp, encoding), ".variant-")
+
+
+def get_encoded_variant(relative_path: str, encoding: str, build: bool = True) -> Path | None:
+    """
+    Return the on-disk gzip/zstd variant of a blob. Variants sit next to the blob
+    (<sha256>.gz / <sha256>.zst) and are immutable like it. A missing variant is compressed in the
+    background, once however many downloads ask for it, and None is returned meanwhile so the
+    caller sends the raw bytes; build=False only looks. Also None for unknown encodings, non-blob
+    paths or when zstandard is not installed.
+    """
+    suffix = VARIANT_SUFFIXES.get(encoding)
+    if suffix is None or not relative_path.startswith("blobs/"):
+        return None
+    if encoding == "zstd" and not zstd_available():
+        return None
+    src = get_full_path(relative_path)
+    dest = src.with_name(src.name + suffix)
+    if dest.is_file():
+        return dest
+    if build and src.is_file():
+        _variant_builds.schedule(dest, partial(_write_variant, src, dest, encoding))
+    return None
+
+
+DELTA_ENCODING = "zstd-patch"
+# One queue, so one build at a time: a build holds the whole base file in memory.
+_delta_builds = _BuildQueue("delta", settings.delta_queue_size)
+
+
+def _delta_path(base_sha256: str, target_sha256: str) -> Path:
+    return ensure_storage_path() / "deltas" / base_sha256[:2] / f"{base_sha256}-{target_sha256}.zpatch"
+
+
+def _build_delta(base: Path, target: Path, dest: Path) -> None:
+    """zstd --patch-from: compress target using the whole base file as a raw-content dictionary."""
+    import zstandard
+    dictionary = zstandard.ZstdCompressionDict(base.read_bytes(), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    window_log = max(zstandard.WINDOWLOG_MIN, (max(base.stat().st_size, target.stat().st_size) - 1).bit_length())
+    params = zstandard.ZstdCompressionParameters.from_level(19, window_log=window_log, enable_ldm=True)
+    compressor = zstandard.ZstdCompressor(dict_data=dictionary, compression_params=params)
+    with open(target, "rb") as fin, open(dest, "wb") as fout:
+        compressor.copy_stream(fin, fout, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+
+
+def _write_delta(base_sha256: str, target_sha256: str) -> None:
+    dest = _delta_path(base_sha256, target_sha256)
+    base = get_full_path(get_blob_relative_path(base_sha256))
+    target = get_full_path(get_blob_relative_path(target_sha256))
+    if dest.is_file() or not base.is_file() or not target.is_file():
+        return
+    _write_atomically(dest, lambda tmp: _build_delta(base, target, tmp), ".delta-")
+
+
+def get_delta(base_sha256: str, target_sha256: str, build: bool = True) -> Path | None:
+    """
+    Return the cached binary delta turning blob base_sha256 into blob target_sha256
+    (deltas/<base[:2]>/<base>-<target>.zpatch). Clients apply it with `zstd -d --patch-from=<base>`
+    or an equivalent raw-dictionary decompressor. A missing delta is never built on the calling
+    thread: with build it is queued for the background builder and None is returned, so the caller
+    serves the full file until the delta is ready. Also None when zstandard is missing or either
+    blob is absent or larger than delta_max_file_mb.
+    """
+    if not zstd_available():
+        return None
+    dest = _delta_path(base_sha256, target_sha256)
+    if dest.is_file():
+        return dest
+    if not build:
+        return None
+    base = get_full_path(get_blob_relative_path(base_sha256))
+    target = get_full_path(get_blob_relative_path(target_sha256))
+    if not base.is_file() or not target.is_file():
+        return None
+    limit = settings.delta_max_file_mb * 1024 * 1024
+    if base.stat().st_size > limit or target.stat().st_size > limit:
+        return None
+    _delta_builds.schedule((base_sha256, target_sha256), partial(_write_delta, base_sha256, target_sha256))
+    return None
 
 
-def save_upload_file(file_content: bytes, vendor_code: str, dealer_id: int | None, filename: str) -> str:
-    path = get_file_path(vendor_code, dealer_id, filename)
-    path.write_bytes(file_content)
-    return str(path.relative_to(ensure_storage_path())).replace("\\", "/")
+def delete_deltas(sha256: str) -> None:
+    """Drop cached deltas that start or end at a blob being removed."""
+    root = ensure_storage_path() / "deltas"
+    if not root.is_dir():
+        return
+    for path in (root / sha256[:2]).glob(f"{sha256}-*.zpatch"):
+        path.unlink(missing_ok=True)
+    for path in root.glob(f"*/*-{sha256}.zpatch"):
+        path.unlink(missing_ok=True)
 
 
 def get_full_path(relative_path: str) -> Path:
@@ -35,6 +310,8 @@ def get_full_path(relative_path: str) -> Path:
 
 def delete_file(relative_path: str) -> bool:
     path = get_full_path(relative_path)
+    for suffix in VARIANT_SUFFIXES.values():
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
     if path.exists():
         path.unlink()
         return True
@@ -0,0 +1,25 @@
+"""price_files: content_hash and size
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('price_files', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('price_files', sa.Column('size', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('price_files', 'size')
+    op.drop_column('price_files', 'content_hash')
@@ -0,0 +1,42 @@
+"""file_blobs content-addressed store; price_files.blob_id
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('storage_path', sa.String(length=500), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_file_blobs_id'), 'file_blobs', ['id'], unique=False)
+    op.create_index(op.f('ix_file_blobs_sha256'), 'file_blobs', ['sha256'], unique=True)
+    op.add_column('price_files', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_price_files_blob_id'), 'price_files', ['blob_id'], unique=False)
+    op.create_foreign_key('price_files_blob_id_fkey', 'price_files', 'file_blobs', ['blob_id'], ['id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('price_files_blob_id_fkey', 'price_files', type_='foreignkey')
+    op.drop_index(op.f('ix_price_files_blob_id'), table_name='price_files')
+    op.drop_column('price_files', 'blob_id')
+    op.drop_index(op.f('ix_file_blobs_sha256'), table_name='file_blobs')
+    op.drop_index(op.f('ix_file_blobs_id'), table_name='file_blobs')
+    op.drop_table('file_blobs')
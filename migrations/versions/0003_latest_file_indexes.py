@@ -0,0 +1,26 @@
+"""indexes for latest-price-file-per-vendor resolution
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_price_files_vendor_dealer_uploaded', 'price_files', ['vendor_id', 'dealer_id', 'uploaded_at'], unique=False
+    )
+    op.create_index('ix_dealer_vendors_dealer_folder', 'dealer_vendors', ['dealer_id', 'custom_folder_name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dealer_vendors_dealer_folder', table_name='dealer_vendors')
+    op.drop_index('ix_price_files_vendor_dealer_uploaded', table_name='price_files')
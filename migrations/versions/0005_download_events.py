@@ -0,0 +1,36 @@
+"""download_events history table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'download_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('link_id', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('dealer_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.SmallInteger(), nullable=False),
+        sa.Column('downloaded_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_download_events_link_id'), 'download_events', ['link_id'], unique=False)
+    op.create_index('ix_download_events_dealer_at', 'download_events', ['dealer_id', 'downloaded_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_download_events_dealer_at', table_name='download_events')
+    op.drop_index(op.f('ix_download_events_link_id'), table_name='download_events')
+    op.drop_table('download_events')
@@ -0,0 +1,45 @@
+"""reusable download links (partial unique slot index); idempotency_keys
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'download_links', sa.Column('reusable', sa.Boolean(), server_default=sa.text('false'), nullable=False)
+    )
+    op.create_index(
+        'uq_download_links_reusable_slot',
+        'download_links',
+        ['dealer_id', 'file_id'],
+        unique=True,
+        postgresql_where=sa.text('reusable AND downloaded_at IS NULL AND revoked_at IS NULL'),
+    )
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('scope', sa.String(length=50), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('scope', 'key'),
+    )
+    op.create_index(op.f('ix_idempotency_keys_created_at'), 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_idempotency_keys_created_at'), table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
+    op.drop_index('uq_download_links_reusable_slot', table_name='download_links')
+    op.drop_column('download_links', 'reusable')
@@ -0,0 +1,37 @@
+"""download_links.expires_at index; download_links_archive
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_download_links_expires_at'), 'download_links', ['expires_at'], unique=False)
+    op.create_table(
+        'download_links_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('dealer_id', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('downloaded_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_download_links_archive_dealer_id'), 'download_links_archive', ['dealer_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_download_links_archive_dealer_id'), table_name='download_links_archive')
+    op.drop_table('download_links_archive')
+    op.drop_index(op.f('ix_download_links_expires_at'), table_name='download_links')
@@ -0,0 +1,48 @@
+"""download_bundles and download_bundle_links
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'download_bundles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('dealer_id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['dealer_id'], ['dealers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_download_bundles_id'), 'download_bundles', ['id'], unique=False)
+    op.create_index(op.f('ix_download_bundles_token'), 'download_bundles', ['token'], unique=True)
+    op.create_index(op.f('ix_download_bundles_expires_at'), 'download_bundles', ['expires_at'], unique=False)
+    op.create_table(
+        'download_bundle_links',
+        sa.Column('bundle_id', sa.Integer(), nullable=False),
+        sa.Column('link_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['bundle_id'], ['download_bundles.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['link_id'], ['download_links.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('bundle_id', 'link_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('download_bundle_links')
+    op.drop_index(op.f('ix_download_bundles_expires_at'), table_name='download_bundles')
+    op.drop_index(op.f('ix_download_bundles_token'), table_name='download_bundles')
+    op.drop_index(op.f('ix_download_bundles_id'), table_name='download_bundles')
+    op.drop_table('download_bundles')
@@ -0,0 +1,25 @@
+"""lower(email) indexes for the unified admin/dealer identity lookup
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_admins_email_lower', 'admins', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_dealers_email_lower', 'dealers', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_dealers_email_lower', table_name='dealers')
+    op.drop_index('ix_admins_email_lower', table_name='admins')
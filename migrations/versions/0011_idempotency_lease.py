@@ -0,0 +1,34 @@
+"""idempotency_keys: claimed_at lease for abandoned claims; caller-scoped keys
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'idempotency_keys',
+        sa.Column('claimed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.alter_column(
+        'idempotency_keys', 'scope', existing_type=sa.String(length=50), type_=sa.String(length=100), existing_nullable=False
+    )
+
+
+def downgrade() -> None:
+    # Caller-scoped keys do not fit the old width; they are only replay records, so drop them.
+    op.execute("DELETE FROM idempotency_keys WHERE length(scope) > 50")
+    op.alter_column(
+        'idempotency_keys', 'scope', existing_type=sa.String(length=100), type_=sa.String(length=50), existing_nullable=False
+    )
+    op.drop_column('idempotency_keys', 'claimed_at')
@@ -0,0 +1,131 @@
+"""
+Benchmark login throughput: the previous two-lookup path (admin by email, then dealer by email,
+each followed by a bcrypt check; kept here as _login_before) against the single identity lookup
+behind /api/auth/login (authenticate_async).
+
+Creates --dealers bench dealers hashed with --rounds bcrypt rounds (low, so the database side
+shows next to bcrypt), then runs --logins logins per path at --concurrency, --miss-ratio of them
+for unknown emails. Latency is reported separately for known and unknown emails: the new path
+takes as long to refuse an unknown email as a production-cost (12 round) hash takes to check, so
+with misses and a low --rounds its throughput drops by design; compare lookups with --miss-ratio 0.
+
+    python scripts/bench_login.py --dealers 1000 --logins 5000 --concurrency 16 --rounds 4
+
+Bench dealers use the customer-number prefix BENCH-LOGIN-; --cleanup removes them afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from sqlalchemy import delete, insert
+from app.database import SessionLocal, engine
+from app.models import Admin, Dealer
+from app.services.auth_service import authenticate_async
+from app.utils.executors import run_in_io_executor, shutdown_io_executor
+from app.utils.password_hashing import shutdown_password_pool, verify_password
+
+BENCH_PREFIX = "BENCH-LOGIN-"
+PASSWORD = "bench-password"
+
+
+def _email(n: int) -> str:
+    return f"bench-login-{n}@example.invalid"
+
+
+def fill(dealers: int, rounds: int) -> None:
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+    with engine.begin() as conn:
+        conn.execute(delete(Dealer).where(Dealer.customer_number.like(f"{BENCH_PREFIX}%")))
+        conn.execute(insert(Dealer), [
+            {"name": f"Login bench {n}", "email": _email(n), "password_hash": password_hash,
+             "customer_number": f"{BENCH_PREFIX}{n}", "active": True}
+            for n in range(dealers)
+        ])
+
+
+def _login_before(email: str) -> bool:
+    """The login path this replaced: up to two lookups, unknown emails refused without bcrypt."""
+    db = SessionLocal()
+    try:
+        admin = db.query(Admin).filter(Admin.email == email).first()
+        if admin and verify_password(PASSWORD, admin.password_hash):
+            return True
+        dealer = db.query(Dealer).filter(Dealer.email == email).first()
+        return bool(dealer and dealer.active and verify_password(PASSWORD, dealer.password_hash))
+    finally:
+        db.close()
+
+
+async def _login_after(email: str) -> bool:
+    db = SessionLocal()
+    try:
+        return await authenticate_async(db, email, PASSWORD) is not None
+    finally:
+        db.close()
+
+
+async def run(path: str, attempts: list[tuple[str, bool]], concurrency: int) -> None:
+    gate = asyncio.Semaphore(concurrency)
+    timings: dict[bool, list[float]] = {True: [], False: []}
+
+    async def one(email: str, known: bool) -> None:
+        async with gate:
+            t0 = time.perf_counter()
+            if path == "before":
+                ok = await run_in_io_executor(_login_before, email)
+            else:
+                ok = await _login_after(email)
+            timings[known].append((time.perf_counter() - t0) * 1000)
+            assert ok == known, email
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(email, known) for email, known in attempts))
+    elapsed = time.perf_counter() - t0
+    print(f"  {path}: {len(attempts) / elapsed:,.0f} logins/s")
+    for known, label in ((True, "known"), (False, "unknown")):
+        ms = sorted(timings[known])
+        if ms:
+            pct = lambda p: ms[min(len(ms) - 1, int(len(ms) * p))]
+            print(f"    {label:>7} emails: p50 {pct(0.50):.1f} ms, p95 {pct(0.95):.1f} ms ({len(ms)})")
+
+
+def cleanup() -> None:
+    with engine.begin() as conn:
+        conn.execute(delete(Dealer).where(Dealer.customer_number.like(f"{BENCH_PREFIX}%")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dealers", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost of the bench dealers' hashes")
+    parser.add_argument("--miss-ratio", type=float, default=0.0, help="share of logins with unknown emails")
+    parser.add_argument("--skip-fill", action="store_true", help="reuse dealers from a previous run")
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_fill:
+        print(f"Creating {args.dealers:,} bench dealers (bcrypt rounds {args.rounds})...")
+        fill(args.dealers, args.rounds)
+    attempts = [
+        (f"unknown-{n}@example.invalid", False) if random.random() < args.miss_ratio
+        else (_email(random.randrange(args.dealers)), True)
+        for n in range(args.logins)
+    ]
+    print(f"{args.logins:,} logins at concurrency {args.concurrency}:")
+    for path in ("before", "after"):
+        asyncio.run(run(path, attempts, args.concurrency))
+    if args.cleanup:
+        cleanup()
+    shutdown_io_executor()
+    shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    main()
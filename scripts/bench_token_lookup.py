@@ -0,0 +1,127 @@
+"""
+Benchmark download-token lookup latency against a large download_links history (PostgreSQL).
+
+Fills download_links with --rows synthetic links (all but --live of them long expired), times
+get_link_by_token for random live tokens, then optionally runs the retention purge and times again.
+
+    python scripts/bench_token_lookup.py --rows 50000000 --live 200000 --purge
+
+Bench rows belong to a dedicated dealer/vendor/file (customer number BENCH-TOKENS); --cleanup
+removes them afterwards.
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app.database import SessionLocal, engine
+from app.models import Dealer, Vendor, PriceFile
+from app.services.link_service import get_link_by_token
+from app.services.retention_service import purge_expired_links
+
+BENCH_CUSTOMER = "BENCH-TOKENS"
+FILL_CHUNK = 1_000_000
+
+
+def _bench_file(db) -> tuple[int, int]:
+    dealer = db.query(Dealer).filter(Dealer.customer_number == BENCH_CUSTOMER).first()
+    if dealer is None:
+        dealer = Dealer(name="Token benchmark", email="bench-tokens@example.invalid", password_hash="!",
+                        customer_number=BENCH_CUSTOMER, active=True)
+        vendor = Vendor(code="BENCH_TOKENS", name="Token benchmark")
+        db.add_all([dealer, vendor])
+        db.flush()
+        db.add(PriceFile(vendor_id=vendor.id, dealer_id=dealer.id, filename="bench.csv", file_path="bench/none"))
+        db.commit()
+    pf = db.query(PriceFile).filter(PriceFile.dealer_id == dealer.id).first()
+    return dealer.id, pf.id
+
+
+def fill(rows: int, live: int, dealer_id: int, file_id: int) -> None:
+    """Server-side generate_series inserts; tokens are 'bench-<n>-<md5>' so live ones can be sampled."""
+    expired = rows - live
+    with engine.begin() as conn:
+        for start in range(0, rows, FILL_CHUNK):
+            stop = min(start + FILL_CHUNK, rows)
+            conn.execute(text("""
+                INSERT INTO download_links (file_id, dealer_id, token, expires_at, created_at, downloaded_at)
+                SELECT :file_id, :dealer_id, 'bench-' || n || '-' || md5(n::text),
+                       CASE WHEN n < :expired THEN now() - interval '60 days' - (n % 365) * interval '1 day'
+                            ELSE now() + interval '7 days' END,
+                       now() - interval '67 days',
+                       CASE WHEN n % 3 = 0 THEN now() - interval '65 days' END
+                FROM generate_series(:start, :stop - 1) AS n
+            """), {"file_id": file_id, "dealer_id": dealer_id, "expired": expired, "start": start, "stop": stop})
+            print(f"  inserted {stop:,}/{rows:,}", flush=True)
+        conn.execute(text("ANALYZE download_links"))
+
+
+def time_lookups(rows: int, live: int, lookups: int) -> None:
+    tokens = [
+        f"bench-{n}-{hashlib.md5(str(n).encode()).hexdigest()}"
+        for n in random.sample(range(rows - live, rows), min(lookups, live))
+    ]
+    db = SessionLocal()
+    timings = []
+    try:
+        for token in tokens:
+            t0 = time.perf_counter()
+            assert get_link_by_token(db, token) is not None
+            timings.append((time.perf_counter() - t0) * 1000)
+            db.rollback()
+    finally:
+        db.close()
+    timings.sort()
+    pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))]
+    print(f"  {len(timings)} lookups: mean {statistics.mean(timings):.3f} ms, "
+          f"p50 {pct(0.50):.3f} ms, p95 {pct(0.95):.3f} ms, p99 {pct(0.99):.3f} ms")
+    with engine.connect() as conn:
+        size = conn.execute(text(
+            "SELECT pg_size_pretty(pg_total_relation_size('download_links')), "
+            "pg_size_pretty(pg_relation_size('ix_download_links_token')), count(*) FROM download_links"
+        )).one()
+    print(f"  download_links: {size[2]:,} rows, {size[0]} total, token index {size[1]}")
+
+
+def cleanup(dealer_id: int) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM download_links WHERE dealer_id = :d"), {"d": dealer_id})
+        conn.execute(text("DELETE FROM download_links_archive WHERE dealer_id = :d"), {"d": dealer_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--live", type=int, default=200_000, help="unexpired links among --rows")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--skip-fill", action="store_true", help="reuse rows from a previous run")
+    parser.add_argument("--purge", action="store_true", help="run the retention purge and time again")
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    dealer_id, file_id = _bench_file(db)
+    if not args.skip_fill:
+        print(f"Filling {args.rows:,} links ({args.live:,} live)...")
+        fill(args.rows, args.live, dealer_id, file_id)
+    print("Token lookups with full history:")
+    time_lookups(args.rows, args.live, args.lookups)
+    if args.purge:
+        t0 = time.perf_counter()
+        purged = purge_expired_links(db)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM ANALYZE download_links"))
+        print(f"Purged {purged:,} links in {time.perf_counter() - t0:.1f} s. Token lookups after purge:")
+        time_lookups(args.rows, args.live, args.lookups)
+    if args.cleanup:
+        cleanup(dealer_id)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Shared fixtures. The services rely on PostgreSQL-only SQL (ON CONFLICT, LATERAL, VALUES lists,
+sequences), so database tests run against TEST_DATABASE_URL, a throwaway database whose public
+schema is recreated, and are skipped when it is not set.
+"""
+import asyncio
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+# Settings are read once at import, so point the app at the test database and a scratch storage
+# directory before anything imports it.
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ.setdefault("STORAGE_PATH", tempfile.mkdtemp(prefix="price-files-test-"))
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")  # no bcrypt process pool per test run
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import text
+    from app import models  # noqa: F401 - register all models with Base.metadata
+    from app.database import Base, engine
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    from sqlalchemy import text
+    from app.database import Base, SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+@pytest.fixture
+def count_queries(engine):
+    """count_queries() is a context manager collecting the SQL statements run inside its block."""
+
+    @contextmanager
+    def count_queries():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return count_queries
+
+
+@pytest.fixture
+def client(db):
+    """A TestClient with the app started (startup seeds the default admin) on the test database."""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services import rate_limit_service
+
+    rate_limit_service._memory_buckets.clear()  # every test starts with full per-IP buckets
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def admin_headers(client):
+    """Bearer headers for the seeded admin."""
+    res = client.post("/api/auth/login", json={"email": "admin@wallacedms.com", "password": "admin123"})
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+@pytest.fixture
+def dealer(db):
+    from app.models import Dealer
+
+    dealer = Dealer(name="Dealer", email="dealer@example.com", password_hash="x", customer_number="C1")
+    db.add(dealer)
+    db.commit()
+    return dealer
+
+
+@pytest.fixture
+def vendor(db):
+    from app.models import Vendor
+
+    vendor = Vendor(code="KEL", name="Kelley")
+    db.add(vendor)
+    db.commit()
+    return vendor
+
+
+@pytest.fixture
+def asgi_get(client):
+    """
+    A coroutine function sending one GET straight to the ASGI app and returning (status, body), for
+    tests that hold several requests open at once on the app's event loop (run them with
+    client.portal.call). on_body is awaited after each body chunk, so a test can stall a response
+    mid-stream like a slow client.
+    """
+    from app.main import app
+
+    async def asgi_get(path: str, headers: dict[str, str] | None = None, on_body=None) -> tuple[int, bytes]:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "client": ("testclient", 50000),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        }
+        received, body = False, []
+        result = {}
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await asyncio.Event().wait()  # the client never disconnects
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                result["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+                if on_body is not None:
+                    await on_body()
+
+        await app(scope, receive, send)
+        return result["status"], b"".join(body)
+
+    return asgi_get
@@ -0,0 +1,136 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.dependencies import RateLimit, get_current_user
+from app.services import auth_service
+from app.services.auth_service import resolve_principal
+from app.services.rate_limit_service import RatePolicy
+from app.utils import password_hashing
+
+ADMIN_LOGIN = {"email": "admin@wallacedms.com", "password": "admin123"}
+
+
+def test_login_is_503_while_the_hashing_pool_is_saturated(client, monkeypatch):
+    monkeypatch.setattr(password_hashing, "_slots", threading.BoundedSemaphore(1))
+    password_hashing._slots.acquire()  # the one slot is busy
+    rejected = password_hashing.password_hashing_stats()["verify"]["rejected"]
+
+    busy = client.post("/api/auth/login", json=ADMIN_LOGIN)
+    password_hashing._slots.release()
+    after = client.post("/api/auth/login", json=ADMIN_LOGIN)
+
+    assert busy.status_code == 503
+    assert busy.headers["retry-after"] == "1"
+    assert password_hashing.password_hashing_stats()["verify"]["rejected"] == rejected + 1
+    assert after.status_code == 200
+
+
+@pytest.fixture
+def dealer_token(client, db):
+    from app.models import Dealer
+    from app.services.auth_service import hash_password
+
+    dealer = Dealer(
+        name="Dealer", email="dealer@example.com", password_hash=hash_password("old-pass"), customer_number="C1"
+    )
+    db.add(dealer)
+    db.commit()
+    res = client.post("/api/auth/login", json={"email": "dealer@example.com", "password": "old-pass"})
+    return dealer.id, res.json()["access_token"]
+
+
+def test_deactivating_a_dealer_drops_its_cached_principal(client, admin_headers, db, dealer_token):
+    dealer_id, token = dealer_token
+    assert get_current_user(resolve_principal(db, token)).active  # now cached
+
+    client.put(f"/api/dealers/{dealer_id}", json={"active": False}, headers=admin_headers)
+
+    with pytest.raises(HTTPException) as exc:
+        get_current_user(resolve_principal(db, token))
+    assert exc.value.status_code == 403
+
+
+def test_changing_a_dealers_password_drops_its_cached_principal(client, admin_headers, db, dealer_token):
+    dealer_id, token = dealer_token
+    resolve_principal(db, token)
+    assert auth_service._principal_cache.get(token) is not None
+
+    client.put(f"/api/dealers/{dealer_id}", json={"password": "new-pass"}, headers=admin_headers)
+
+    assert auth_service._principal_cache.get(token) is None
+    old = client.post("/api/auth/login", json={"email": "dealer@example.com", "password": "old-pass"})
+    new = client.post("/api/auth/login", json={"email": "dealer@example.com", "password": "new-pass"})
+    assert (old.status_code, new.status_code) == (401, 200)
+
+
+def _rate_limit(router, path):
+    route = next(r for r in router.routes if r.path == path)
+    return next(d.dependency for d in route.dependencies if isinstance(d.dependency, RateLimit))
+
+
+def test_logins_past_the_burst_get_429_with_retry_after(client, monkeypatch):
+    from app.routers.auth import router
+
+    monkeypatch.setattr(_rate_limit(router, "/api/auth/login"), "policy", RatePolicy(2, 60))
+    unknown = {"email": "nobody@example.com", "password": "x"}
+
+    statuses = [client.post("/api/auth/login", json=unknown).status_code for _ in range(2)]
+    refused = client.post("/api/auth/login", json=unknown)
+
+    assert statuses == [401, 401]
+    assert refused.status_code == 429
+    assert refused.headers["retry-after"] == "30"
+
+
+def test_invalid_api_keys_do_not_draw_from_the_wallace_bucket(client, monkeypatch):
+    from app.config import get_settings
+    from app.routers.wallace import router
+
+    monkeypatch.setattr(_rate_limit(router, "/api/wallace/get-links"), "policy", RatePolicy(1, 60))
+    body = {"customer_number": "unknown", "vendors": ["KEL"]}
+
+    bad_keys = [
+        client.post("/api/wallace/get-links", json=body, headers={"X-API-Key": f"made-up-{i}"}).status_code
+        for i in range(3)
+    ]
+    good = [
+        client.post("/api/wallace/get-links", json=body, headers={"X-API-Key": get_settings().wallace_api_key})
+        for _ in range(2)
+    ]
+
+    assert bad_keys == [401, 401, 401]
+    assert [res.status_code for res in good] == [404, 429]
+    assert good[1].headers["retry-after"] == "60"
+
+
+@pytest.mark.parametrize(
+    "email, password, status_code, checked_hash",
+    [
+        ("admin@wallacedms.com", "admin123", 200, "admin"),
+        ("admin@wallacedms.com", "wrong", 401, "admin"),
+        ("nobody@example.com", "admin123", 401, "dummy"),
+    ],
+)
+def test_login_is_one_lookup_and_always_one_bcrypt_check(
+    client, count_queries, monkeypatch, db, email, password, status_code, checked_hash
+):
+    from app.models import Admin
+
+    hashes = {"admin": db.query(Admin.password_hash).scalar(), "dummy": auth_service._DUMMY_HASH}
+    checked = []
+    verify = auth_service.verify_password_async
+
+    async def recording_verify(plain_password, hashed_password):
+        checked.append(hashed_password)
+        return await verify(plain_password, hashed_password)
+
+    monkeypatch.setattr(auth_service, "verify_password_async", recording_verify)
+
+    with count_queries() as statements:
+        res = client.post("/api/auth/login", json={"email": email, "password": password})
+
+    assert res.status_code == status_code
+    assert len(statements) == 1, statements
+    assert checked == [hashes[checked_hash]]
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from sqlalchemy import select, update
+
+from app.models import DownloadEvent, DownloadLink, PriceFile
+from app.services.download_recorder import DownloadRecorder
+from app.services.link_service import generate_links
+
+
+@pytest.fixture
+def link_ids(db, dealer, vendor):
+    files = [PriceFile(vendor_id=vendor.id, filename=f"p{i}.csv", file_path=f"legacy/p{i}.csv") for i in range(3)]
+    db.add_all(files)
+    db.commit()
+    return [link.id for link in generate_links(db, dealer.id, [pf.id for pf in files], "http://testserver")]
+
+
+def _record(recorder, link_id, status=200):
+    recorder.record(link_id, 1, 1, status)
+    time.sleep(0.001)  # distinct downloaded_at per event
+
+
+def test_flush_writes_events_in_batches_and_sets_first_downloaded_at(monkeypatch, db, link_ids):
+    first, second, already_downloaded = link_ids
+    earlier = db.execute(
+        update(DownloadLink)
+        .where(DownloadLink.id == already_downloaded)
+        .values(downloaded_at=DownloadLink.created_at)
+        .returning(DownloadLink.downloaded_at)
+    ).scalar_one()
+    db.commit()
+    recorder = DownloadRecorder(maxsize=100, batch_size=3, flush_interval=60)
+    batches = []
+    write = recorder._write
+    monkeypatch.setattr(recorder, "_write", lambda batch: (batches.append(len(batch)), write(batch)))
+    for link_id in (first, second, first, already_downloaded):
+        _record(recorder, link_id, 206 if link_id == second else 200)
+
+    recorder.flush()
+
+    assert batches == [3, 1]
+    assert recorder.stats() == {"queued": 0, "recorded": 4, "dropped": 0, "failed": 0}
+    events = db.execute(
+        select(DownloadEvent.link_id, DownloadEvent.status, DownloadEvent.downloaded_at).order_by(DownloadEvent.id)
+    ).all()
+    assert [(e.link_id, e.status) for e in events] == [(first, 200), (second, 206), (first, 200), (already_downloaded, 200)]
+    downloaded_at = dict(db.execute(select(DownloadLink.id, DownloadLink.downloaded_at)).all())
+    assert downloaded_at == {first: events[0].downloaded_at, second: events[1].downloaded_at, already_downloaded: earlier}
+
+
+def test_events_past_the_queue_size_are_dropped(link_ids):
+    recorder = DownloadRecorder(maxsize=2, batch_size=10, flush_interval=60)
+    for _ in range(3):
+        recorder.record(link_ids[0], 1, 1, 200)
+
+    assert recorder.stats()["dropped"] == 1
+
+
+def test_background_thread_flushes_a_full_batch_without_waiting_for_the_interval(db, link_ids):
+    recorder = DownloadRecorder(maxsize=100, batch_size=2, flush_interval=60)
+    recorder.start()
+    try:
+        recorder.record(link_ids[0], 1, 1, 200)
+        recorder.record(link_ids[1], 1, 1, 200)
+        deadline = time.monotonic() + 5
+        while recorder.recorded < 2:
+            assert time.monotonic() < deadline, "batch was not flushed"
+            time.sleep(0.01)
+    finally:
+        recorder.stop()
+
+    assert db.scalar(select(DownloadEvent.id).limit(1)) is not None
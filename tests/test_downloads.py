@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import io
+import time
+import zipfile
+
+import pytest
+import zstandard
+
+from app.routers import links as links_router
+from app.services.file_service import create_price_file
+from app.services.link_service import generate_links
+from app.utils import storage
+
+
+def _token(db, dealer, vendor, content):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    file_id = create_price_file(db, vendor_id, dealer_id, "prices.csv", [content], "test").id
+    return generate_links(db, dealer_id, [file_id], "http://testserver")[0].token
+
+
+@pytest.mark.parametrize("downloads", [1, 12])
+def test_stalled_downloads_hold_no_pooled_connections(client, asgi_get, engine, db, dealer, vendor, monkeypatch, downloads):
+    # More stalled downloads than pool_size + max_overflow would time out if each held a connection.
+    monkeypatch.setattr(links_router, "record_download", lambda grant, status_code: None)
+    content = b"x" * (512 * 1024)
+    path = f"/api/links/download/{_token(db, dealer, vendor, content)}"
+    idle = engine.pool.checkedout()
+
+    async def stall_downloads():
+        resume = asyncio.Event()
+        stalled = 0
+
+        async def slow_client():
+            nonlocal stalled
+            if not resume.is_set():
+                stalled += 1
+                await resume.wait()
+
+        async def all_stalled():
+            while stalled < downloads:
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(asgi_get(path, on_body=slow_client)) for _ in range(downloads)]
+        await asyncio.wait_for(all_stalled(), 10)
+        checked_out = engine.pool.checkedout()
+        resume.set()
+        return checked_out, await asyncio.gather(*tasks)
+
+    checked_out, responses = client.portal.call(stall_downloads)
+
+    assert checked_out == idle
+    assert responses == [(200, content)] * downloads
+
+
+def _versions(db, dealer, vendor, *contents):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    files = [create_price_file(db, vendor_id, dealer_id, "prices.csv", [c], "test") for c in contents]
+    tokens = [link.token for link in generate_links(db, dealer_id, [pf.id for pf in files], "http://testserver")]
+    return [(pf.content_hash, token) for pf, token in zip(files, tokens)]
+
+
+def test_delta_is_served_against_an_earlier_version_only(client, db, dealer, vendor):
+    older = b"".join(b"%06d,item,%d.00\n" % (i, i % 97) for i in range(20000))
+    newer = older.replace(b"item,5", b"item,6")
+    (older_hash, older_token), (newer_hash, newer_token) = _versions(db, dealer, vendor, older, newer)
+    # Deltas both ways already built, so only the choice of base decides what is served.
+    storage._write_delta(older_hash, newer_hash)
+    storage._write_delta(newer_hash, older_hash)
+
+    forward = client.get(f"/api/links/download/{newer_token}", params={"base": older_hash})
+    backward = client.get(f"/api/links/download/{older_token}", params={"base": newer_hash})
+
+    assert forward.status_code == 226
+    assert forward.headers["im"] == storage.DELTA_ENCODING
+    assert backward.status_code == 200
+    assert backward.content == older
+
+
+CONTENT = bytes(range(256)) * 4
+IDENTITY = {"accept-encoding": "identity"}
+
+
+@pytest.fixture
+def download_url(db, dealer, vendor):
+    return f"/api/links/download/{_token(db, dealer, vendor, CONTENT)}"
+
+
+def test_single_range(client, download_url):
+    res = client.get(download_url, headers={**IDENTITY, "range": "bytes=10-19"})
+
+    assert res.status_code == 206
+    assert res.headers["content-range"] == "bytes 10-19/1024"
+    assert res.content == CONTENT[10:20]
+
+
+def test_multiple_ranges_come_back_as_multipart_byteranges(client, download_url):
+    res = client.get(download_url, headers={**IDENTITY, "range": "bytes=0-3,-4"})
+
+    assert res.status_code == 206
+    media_type, _, boundary = res.headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    parts = res.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert [part.split(b"\r\n\r\n", 1)[1].removesuffix(b"\r\n") for part in parts[1:-1]] == [CONTENT[:4], CONTENT[-4:]]
+    assert b"Content-Range: bytes 1020-1023/1024" in parts[2]
+
+
+def test_unsatisfiable_range_is_416(client, download_url):
+    res = client.get(download_url, headers={**IDENTITY, "range": "bytes=5000-"})
+
+    assert res.status_code == 416
+    assert res.headers["content-range"] == "bytes */1024"
+
+
+def test_if_none_match_with_the_content_hash_is_304(client, download_url):
+    etag = client.head(download_url, headers=IDENTITY).headers["etag"]
+
+    res = client.get(download_url, headers={**IDENTITY, "if-none-match": etag})
+
+    assert etag == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+    assert res.status_code == 304
+    assert res.content == b""
+
+
+@pytest.mark.parametrize("current, status_code", [(True, 206), (False, 200)])
+def test_if_range_resumes_only_the_same_content(client, download_url, current, status_code):
+    etag = f'"{hashlib.sha256(CONTENT if current else b"old").hexdigest()}"'
+
+    res = client.get(download_url, headers={**IDENTITY, "range": "bytes=1000-", "if-range": etag})
+
+    assert res.status_code == status_code
+    assert res.content == (CONTENT[1000:] if current else CONTENT)
+
+
+def test_head_reports_the_file_without_a_body(client, download_url):
+    res = client.head(download_url, headers=IDENTITY)
+
+    assert res.status_code == 200
+    assert res.headers["content-length"] == "1024"
+    assert res.headers["accept-ranges"] == "bytes"
+    assert res.content == b""
+
+
+def _wait_for(path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        assert time.monotonic() < deadline, f"{path} was never built"
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [("gzip", "gzip"), ("gzip;q=0.5, zstd", "zstd"), ("zstd;q=0, gzip", "gzip"), ("identity", None)],
+)
+def test_built_variant_is_served_for_the_negotiated_encoding(client, db, dealer, vendor, accept_encoding, encoding):
+    content = f"{accept_encoding}\n".encode() + b"code,description,price\n" * 2000  # a blob of its own
+    url = f"/api/links/download/{_token(db, dealer, vendor, content)}"
+    blob = storage.get_full_path(storage.get_blob_relative_path(hashlib.sha256(content).hexdigest()))
+
+    first = client.get(url, headers={"accept-encoding": accept_encoding})
+    if encoding is not None:
+        _wait_for(blob.with_name(blob.name + storage.VARIANT_SUFFIXES[encoding]))
+    res = client.get(url, headers={"accept-encoding": accept_encoding})
+
+    assert "content-encoding" not in first.headers  # the first request only queues the variant
+    assert first.content == content
+    assert res.headers.get("content-encoding") == encoding
+    assert res.headers["vary"] == "Accept-Encoding"
+    body = zstandard.ZstdDecompressor().decompressobj().decompress(res.content) if encoding == "zstd" else res.content
+    assert body == content
+    if encoding is not None:
+        assert res.headers["etag"] == f'"{hashlib.sha256(content).hexdigest()}-{encoding}"'
+
+
+@pytest.mark.parametrize("mode", ["x-accel-redirect", "x-sendfile", ""])
+def test_offload_leaves_the_body_to_the_fronting_server(client, monkeypatch, download_url, mode):
+    monkeypatch.setattr(links_router.settings, "download_offload", mode)
+    blob = storage.get_blob_relative_path(hashlib.sha256(CONTENT).hexdigest())
+
+    res = client.get(download_url, headers=IDENTITY)
+
+    assert res.status_code == 200
+    assert res.headers["etag"] == f'"{hashlib.sha256(CONTENT).hexdigest()}"'
+    assert res.headers.get("x-accel-redirect") == (f"/protected-storage/{blob}" if mode == "x-accel-redirect" else None)
+    assert res.headers.get("x-sendfile") == (
+        str(storage.get_full_path(blob).resolve()) if mode == "x-sendfile" else None
+    )
+    assert res.content == (b"" if mode else CONTENT)
+
+
+def test_bundle_zips_each_file_under_its_vendor_numbering_repeated_names(client, admin_headers, db, dealer, vendor):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    contents = [b"first", b"second", b"third"]
+    names = ["prices.csv", "prices.csv", "README"]
+    file_ids = [
+        create_price_file(db, vendor_id, dealer_id, name, [content], "test").id
+        for name, content in zip(names, contents)
+    ]
+    link_ids = [link.id for link in generate_links(db, dealer_id, file_ids, "http://testserver")]
+
+    created = client.post(
+        "/api/links/bundles", json={"dealer_id": dealer_id, "link_ids": link_ids}, headers=admin_headers
+    )
+    res = client.get(f"/api/links/bundle/{created.json()['token']}")
+
+    assert created.json()["link_count"] == 3
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(res.content)) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == {
+            "KEL/prices.csv": b"first",
+            "KEL/prices (2).csv": b"second",
+            "KEL/README": b"third",
+        }
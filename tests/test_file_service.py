@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import Dealer, FileBlob, PriceFile
+from app.services.file_service import (
+    create_price_file,
+    create_price_file_async,
+    delete_price_file,
+    delete_price_files,
+    remove_deleted_files,
+)
+from app.services.link_service import generate_links
+from app.utils.storage import get_full_path
+
+
+def _upload(db, vendor_id, dealer_id, content):
+    return create_price_file(db, vendor_id, dealer_id, "prices.csv", [content], "test").id
+
+
+def _ref_counts(db):
+    db.expire_all()
+    return {blob.sha256[:8]: blob.ref_count for blob in db.scalars(select(FileBlob))}
+
+
+# create_price_file releases the session, detaching the fixtures, so their ids are read up front.
+
+
+def test_identical_uploads_share_one_blob(db, dealer, vendor):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    first = _upload(db, vendor_id, None, b"same bytes")
+    second = _upload(db, vendor_id, dealer_id, b"same bytes")
+
+    assert list(_ref_counts(db).values()) == [2]
+    delete_price_file(db, db.get(PriceFile, first))
+    assert list(_ref_counts(db).values()) == [1]
+    path = get_full_path(db.get(PriceFile, second).file_path)
+    delete_price_file(db, db.get(PriceFile, second))
+    assert _ref_counts(db) == {}
+    assert not path.exists()
+
+
+def test_rolled_back_deletion_keeps_rows_and_bytes(db, vendor):
+    file_id = _upload(db, vendor.id, None, b"kept")
+    path = get_full_path(db.get(PriceFile, file_id).file_path)
+
+    delete_price_files(db, PriceFile.id == file_id)
+    db.rollback()
+
+    assert db.get(PriceFile, file_id) is not None
+    assert list(_ref_counts(db).values()) == [1]
+    assert path.exists()
+
+
+def test_bytes_of_a_blob_uploaded_again_since_the_delete_are_kept(db, vendor):
+    vendor_id = vendor.id
+    first = _upload(db, vendor_id, None, b"uploaded twice")
+    path = get_full_path(db.get(PriceFile, first).file_path)
+    deleted = delete_price_files(db, PriceFile.id == first)
+    db.commit()
+
+    second = _upload(db, vendor_id, None, b"uploaded twice")
+    remove_deleted_files(db, deleted)
+
+    assert path.exists()
+    assert get_full_path(db.get(PriceFile, second).file_path) == path
+
+
+def test_deleting_a_dealer_releases_its_files_blobs(client, admin_headers, db, dealer, vendor):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    shared = _upload(db, vendor_id, None, b"shared")
+    _upload(db, vendor_id, dealer_id, b"shared")
+    own = _upload(db, vendor_id, dealer_id, b"dealer only")
+    own_path = get_full_path(db.get(PriceFile, own).file_path)
+
+    res = client.delete(f"/api/dealers/{dealer_id}", headers=admin_headers)
+
+    assert res.status_code == 204
+    db.expire_all()
+    assert db.get(Dealer, dealer_id) is None
+    assert [pf.id for pf in db.scalars(select(PriceFile))] == [shared]
+    assert list(_ref_counts(db).values()) == [1]
+    assert not own_path.exists()
+
+
+def test_deleting_a_vendor_releases_its_files_blobs(client, admin_headers, db, dealer, vendor):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    paths = [get_full_path(db.get(PriceFile, _upload(db, vendor_id, d, b"v")).file_path) for d in (None, dealer_id)]
+
+    res = client.delete(f"/api/vendors/{vendor_id}", headers=admin_headers)
+
+    assert res.status_code == 204
+    assert _ref_counts(db) == {}
+    assert db.scalars(select(PriceFile)).all() == []
+    assert not any(path.exists() for path in paths)
+
+
+def test_requests_are_served_during_a_large_upload(client, asgi_get, db, dealer, vendor):
+    vendor_id, dealer_id = vendor.id, dealer.id
+    small = _upload(db, vendor_id, dealer_id, b"small file")
+    token = generate_links(db, dealer_id, [small], "http://testserver")[0].token
+    halfway, finish = threading.Event(), threading.Event()
+
+    def large_body():
+        for i in range(32):
+            yield b"x" * (1024 * 1024)
+            if i == 15:
+                halfway.set()
+                finish.wait(10)
+
+    async def serve_while_uploading():
+        upload_db = SessionLocal()
+        try:
+            upload = asyncio.create_task(
+                create_price_file_async(upload_db, vendor_id, dealer_id, "large.csv", large_body(), "test")
+            )
+            await asyncio.wait_for(asyncio.to_thread(halfway.wait), 10)
+            health = await asyncio.wait_for(asgi_get("/api/health"), 5)
+            download = await asyncio.wait_for(asgi_get(f"/api/links/download/{token}"), 5)
+            uploading = not upload.done()
+            finish.set()
+            return health, download, uploading, (await upload).size
+        finally:
+            finish.set()
+            upload_db.close()
+
+    health, download, uploading, size = client.portal.call(serve_while_uploading)
+
+    assert health == (200, b'{"status":"ok"}')
+    assert download == (200, b"small file")
+    assert uploading
+    assert size == 32 * 1024 * 1024
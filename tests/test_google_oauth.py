@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from app.config import get_settings
+from app.services import google_oauth_service
+
+CLIENT_ID = "test-client-id"
+
+
+class StubGoogle:
+    """Google's token and JWKS endpoints on a local port; tests adjust the token it hands out."""
+
+    def __init__(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": "key-1", "use": "sig"}
+        self.claims = {"email": "dealer@example.com", "email_verified": True, "aud": CLIENT_ID}
+        self.kid = "key-1"
+        self.token_body: bytes | None = None  # overrides the token endpoint's response
+        self.calls = {"token": 0, "certs": 0}
+
+    def id_token(self) -> str:
+        now = int(time.time())
+        claims = {"iss": "https://accounts.google.com", "sub": "1", "iat": now, "exp": now + 300, **self.claims}
+        return jwt.encode(claims, self.private_pem, algorithm="RS256", headers={"kid": self.kid})
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body: bytes, headers: dict[str, str] | None = None):
+                self.send_response(200)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.calls["certs"] += 1
+                self._send(json.dumps({"keys": [stub.jwk]}).encode(), {"cache-control": "public, max-age=3600"})
+
+            def do_POST(self):
+                stub.calls["token"] += 1
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                body = stub.token_body
+                if body is None:
+                    body = json.dumps({"id_token": stub.id_token(), "access_token": "access"}).encode()
+                self._send(body)
+
+        return Handler
+
+
+@pytest.fixture
+def google(monkeypatch):
+    stub = StubGoogle()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    settings = get_settings()
+    monkeypatch.setattr(settings, "google_client_id", CLIENT_ID)
+    monkeypatch.setattr(settings, "google_client_secret", "secret")
+    monkeypatch.setattr(settings, "google_token_url", f"{base}/token")
+    monkeypatch.setattr(settings, "google_jwks_url", f"{base}/certs")
+    monkeypatch.setattr(settings, "google_jwks_min_refresh_seconds", 0)
+    monkeypatch.setattr(google_oauth_service, "_jwks", google_oauth_service._Jwks())
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+def _callback(client):
+    return client.get("/api/auth/google/callback", params={"code": "auth-code"})
+
+
+def test_valid_login_issues_tokens(client, google, dealer):
+    res = _callback(client)
+
+    assert res.status_code == 200
+    assert "access_token=" in res.text and "refresh_token=" in res.text
+
+
+def test_signing_keys_are_cached(client, google, dealer):
+    assert _callback(client).status_code == 200
+    assert _callback(client).status_code == 200
+
+    assert google.calls == {"token": 2, "certs": 1}
+
+
+def test_unknown_kid_is_rejected_after_one_refetch(client, google, dealer):
+    assert _callback(client).status_code == 200
+    google.kid = "key-2"
+
+    res = _callback(client)
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Unknown Google signing key"
+    assert google.calls["certs"] == 2
+
+
+def test_wrong_audience_is_rejected(client, google, dealer):
+    google.claims["aud"] = "someone-elses-client"
+
+    res = _callback(client)
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Invalid id_token from Google"
+
+
+def test_unknown_user_is_forbidden(client, google, dealer):
+    google.claims["email"] = "nobody@example.com"
+
+    res = _callback(client)
+
+    assert res.status_code == 403
+
+
+def test_non_json_token_response_is_rejected(client, google):
+    google.token_body = b"<html>oops</html>"
+
+    res = _callback(client)
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Invalid token response from Google"
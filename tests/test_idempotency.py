@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app.config import get_settings
+from app.models import DownloadLink, IdempotencyKey, PriceFile
+from app.services import idempotency_service as idempotency
+
+settings = get_settings()
+
+
+@pytest.fixture
+def file_ids(db, vendor):
+    files = [PriceFile(vendor_id=vendor.id, filename=f"p{i}.csv", file_path=f"legacy/p{i}.csv") for i in range(2)]
+    db.add_all(files)
+    db.commit()
+    return [pf.id for pf in files]
+
+
+def _generate(client, admin_headers, dealer_id, file_ids, key="retry-1"):
+    return client.post(
+        "/api/links/generate",
+        json={"dealer_id": dealer_id, "file_ids": file_ids},
+        headers={**admin_headers, "Idempotency-Key": key},
+    )
+
+
+def test_repeated_key_replays_the_first_response(client, admin_headers, db, dealer, file_ids):
+    first = _generate(client, admin_headers, dealer.id, file_ids)
+    retry = _generate(client, admin_headers, dealer.id, file_ids)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert db.scalar(select(func.count()).select_from(DownloadLink)) == len(file_ids)
+
+
+def test_repeated_key_with_a_different_body_is_422(client, admin_headers, dealer, file_ids):
+    _generate(client, admin_headers, dealer.id, file_ids)
+
+    res = _generate(client, admin_headers, dealer.id, file_ids[:1])
+
+    assert res.status_code == 422
+
+
+def test_unfinished_claim_is_taken_over_once_its_lease_has_run_out(db):
+    old_lease, _ = idempotency.claim(db, "test", "key", "fingerprint")
+    with pytest.raises(idempotency.IdempotencyInProgress):
+        idempotency.claim(db, "test", "key", "fingerprint")
+    db.execute(
+        update(IdempotencyKey).values(
+            claimed_at=IdempotencyKey.claimed_at - timedelta(seconds=settings.idempotency_lease_seconds + 1)
+        )
+    )
+    db.commit()
+
+    new_lease, _ = idempotency.claim(db, "test", "key", "fingerprint")
+    idempotency.complete(db, "test", "key", old_lease, "late")  # the original request finishing after all
+    idempotency.complete(db, "test", "key", new_lease, "result")
+
+    assert new_lease is not None and new_lease > old_lease
+    assert idempotency.claim(db, "test", "key", "fingerprint") == idempotency.Claim(None, "result")
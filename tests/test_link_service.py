@@ -0,0 +1,215 @@
+import pytest
+
+from app.models import PriceFile
+from app.services.link_service import generate_links
+
+
+def _price_files(db, vendor, count):
+    files = [
+        PriceFile(vendor_id=vendor.id, filename=f"prices-{i}.csv", file_path=f"legacy/prices-{i}.csv")
+        for i in range(count)
+    ]
+    db.add_all(files)
+    db.commit()
+    return [pf.id for pf in files]
+
+
+@pytest.mark.parametrize("file_count", [1, 50])
+def test_generate_links_query_count_does_not_grow_with_files(count_queries, db, dealer, vendor, file_count):
+    file_ids = _price_files(db, vendor, file_count)
+    dealer_id = dealer.id
+    db.expire_all()
+
+    with count_queries() as statements:
+        links = generate_links(db, dealer_id, file_ids, "http://testserver")
+
+    assert [link.file_id for link in links] == file_ids
+    # The dealer, the files joined to their vendors, one multi-row INSERT ... RETURNING.
+    assert len(statements) == 3, statements
+
+
+def test_generate_links_skips_other_dealers_files(db, dealer, vendor):
+    from app.models import Dealer
+
+    other = Dealer(name="Other", email="other@example.com", password_hash="x", customer_number="C2")
+    db.add(other)
+    db.commit()
+    own, = _price_files(db, vendor, 1)
+    foreign = PriceFile(vendor_id=vendor.id, dealer_id=other.id, filename="theirs.csv", file_path="legacy/theirs.csv")
+    db.add(foreign)
+    db.commit()
+
+    links = generate_links(db, dealer.id, [own, foreign.id, 999], "http://testserver")
+
+    assert [link.file_id for link in links] == [own]
+
+
+@pytest.fixture
+def revocations(monkeypatch):
+    from app.services import revocation_service
+
+    monkeypatch.setattr(revocation_service, "_snapshot", None)
+    monkeypatch.setattr(revocation_service, "_local_revocations", set())
+    monkeypatch.setattr(revocation_service, "_local_dealer_status", {})
+    return revocation_service
+
+
+def _deactivate(db, dealer_id):
+    from app.models import Dealer
+
+    db.get(Dealer, dealer_id).active = False
+    db.commit()
+
+
+@pytest.mark.parametrize("token_format", ["opaque", "signed"])
+def test_links_of_inactive_dealers_do_not_resolve(monkeypatch, revocations, db, dealer, vendor, token_format):
+    from app.config import get_settings
+    from app.services.link_service import resolve_download
+
+    monkeypatch.setattr(get_settings(), "download_token_format", token_format)
+    file_ids = _price_files(db, vendor, 1)
+    dealer_id = dealer.id
+    token = generate_links(db, dealer_id, file_ids, "http://testserver")[0].token
+    assert resolve_download(db, token) is not None
+
+    _deactivate(db, dealer_id)
+    revocations.refresh_revocations()
+
+    assert revocations.check_link(0, dealer_id) is False
+    assert resolve_download(db, token) is None
+
+
+def test_deactivating_a_dealer_applies_at_once_in_this_worker(client, revocations, db, dealer, vendor):
+    from app.services.link_service import resolve_download
+
+    file_ids = _price_files(db, vendor, 1)
+    dealer_id = dealer.id
+    token = generate_links(db, dealer_id, file_ids, "http://testserver")[0].token
+    revocations.refresh_revocations()
+    assert resolve_download(db, token) is not None  # now cached
+    login = client.post("/api/auth/login", json={"email": "admin@wallacedms.com", "password": "admin123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    res = client.put(f"/api/dealers/{dealer_id}", json={"active": False}, headers=headers)
+
+    assert res.status_code == 200
+    assert resolve_download(db, token) is None
+    assert client.get(f"/api/links/download/{token}").status_code == 404
+
+
+@pytest.fixture
+def signed_link(monkeypatch, revocations, db, dealer, vendor):
+    from app.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "download_token_format", "signed")
+    file_ids = _price_files(db, vendor, 1)
+    link = generate_links(db, dealer.id, file_ids, "http://testserver")[0]
+    revocations.refresh_revocations()
+    return link
+
+
+def test_signed_token_resolves_in_memory(count_queries, db, signed_link):
+    from app.services.link_service import resolve_download
+
+    resolve_download(db, signed_link.token)  # loads the file's metadata into the cache
+
+    with count_queries() as statements:
+        grant = resolve_download(db, signed_link.token)
+
+    assert (grant.link_id, grant.file.id) == (signed_link.id, signed_link.file_id)
+    assert statements == []
+
+
+def test_signed_token_with_a_bad_mac_is_refused(db, dealer, signed_link):
+    from app.services.link_service import resolve_download
+    from app.utils.security import create_signed_download_token
+
+    # Another dealer's payload carrying this token's MAC.
+    other = create_signed_download_token(signed_link.id, signed_link.file_id, dealer.id + 1, signed_link.expires_at)
+    forged = other.rpartition(".")[0] + "." + signed_link.token.rpartition(".")[2]
+
+    assert resolve_download(db, forged) is None
+    assert resolve_download(db, signed_link.token[:-4] + "AAAA") is None
+
+
+def test_signed_token_revoked_in_the_snapshot_is_refused_without_a_query(count_queries, revocations, db, signed_link):
+    from sqlalchemy import func, update
+    from app.models import DownloadLink
+    from app.services.link_service import resolve_download
+
+    assert resolve_download(db, signed_link.token) is not None
+    # Revoked by another worker: this one only learns of it from the next snapshot.
+    db.execute(update(DownloadLink).where(DownloadLink.id == signed_link.id).values(revoked_at=func.now()))
+    db.commit()
+    assert resolve_download(db, signed_link.token) is not None
+    revocations.refresh_revocations()
+
+    with count_queries() as statements:
+        assert resolve_download(db, signed_link.token) is None
+    assert statements == []
+
+
+@pytest.fixture
+def kelley_links(revocations, db, dealer, vendor):
+    """
+    Links to vendor KEL's shared file for two assigned dealers (one link already revoked), a link
+    to another vendor's file, and a newer KEL file nobody has a link to yet.
+    """
+    from datetime import datetime, timezone
+    from app.models import Dealer, DealerVendor, DownloadLink, Vendor
+
+    other_dealer = Dealer(name="Other", email="other@example.com", password_hash="x", customer_number="C2")
+    retired = Dealer(name="Retired", email="retired@example.com", password_hash="x", customer_number="C3", active=False)
+    other_vendor = Vendor(code="SIL", name="Silver")
+    db.add_all([other_dealer, retired, other_vendor])
+    db.flush()
+    db.add_all([DealerVendor(dealer_id=d.id, vendor_id=vendor.id) for d in (dealer, other_dealer, retired)])
+    db.commit()
+    kel_old, = _price_files(db, vendor, 1)
+    sil, = _price_files(db, other_vendor, 1)
+    kel_new, = _price_files(db, vendor, 1)
+    ids = {"dealer": dealer.id, "other_dealer": other_dealer.id, "vendor": vendor.id, "kel_new": kel_new}
+    generate_links(db, ids["dealer"], [kel_old, sil], "http://testserver")
+    revoked = generate_links(db, ids["other_dealer"], [kel_old], "http://testserver")[0]
+    generate_links(db, ids["other_dealer"], [kel_old], "http://testserver")
+    db.get(DownloadLink, revoked.id).revoked_at = datetime.now(timezone.utc)
+    db.commit()
+    return ids
+
+
+def test_revoke_bulk_counts_only_links_it_revoked(client, admin_headers, kelley_links):
+    def revoke(**filters):
+        return client.post("/api/links/revoke-bulk", json=filters, headers=admin_headers)
+
+    assert revoke(vendor_id=kelley_links["vendor"]).json() == {"revoked": 2}
+    assert revoke(vendor_id=kelley_links["vendor"]).json() == {"revoked": 0}
+    assert revoke(dealer_id=kelley_links["dealer"]).json() == {"revoked": 1}
+    assert revoke().status_code == 400
+
+
+def test_regenerate_reissues_the_latest_file_to_active_assigned_dealers(client, admin_headers, db, kelley_links):
+    from sqlalchemy import select
+    from app.models import DownloadLink
+
+    res = client.post("/api/links/regenerate", json={"vendor_id": kelley_links["vendor"]}, headers=admin_headers)
+
+    assert res.json() == {"dealers": 2, "revoked": 2, "generated": 2}
+    db.expire_all()
+    active = db.execute(
+        select(DownloadLink.dealer_id, DownloadLink.file_id).where(DownloadLink.revoked_at.is_(None))
+    ).all()
+    kel_new = kelley_links["kel_new"]
+    assert sorted(link for link in active if link.file_id == kel_new) == sorted(
+        [(kelley_links["dealer"], kel_new), (kelley_links["other_dealer"], kel_new)]
+    )
+    assert len(active) == 3  # plus the untouched link to the other vendor's file
+
+
+def test_regenerate_for_some_dealers_leaves_the_others_alone(client, admin_headers, kelley_links):
+    res = client.post(
+        "/api/links/regenerate",
+        json={"vendor_id": kelley_links["vendor"], "dealer_ids": [kelley_links["dealer"]]},
+        headers=admin_headers,
+    )
+
+    assert res.json() == {"dealers": 1, "revoked": 1, "generated": 1}
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import json
+import zipfile
+
+import pytest
+from sqlalchemy import select
+
+from app.config import get_settings
+from app.models import DealerVendor, PriceFile, Vendor
+
+settings = get_settings()
+
+
+def _upload_batch(client, manifest, files=(), archive=None):
+    parts = [("files", (name, content)) for name, content in files]
+    if archive is not None:
+        parts.append(("archive", ("batch.zip", archive)))
+    return client.post(
+        "/api/files/upload-batch",
+        data={"manifest": json.dumps(manifest)},
+        files=parts or None,
+        headers={"X-API-Key": settings.wallace_api_key},
+    )
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def folder_vendor(db, dealer):
+    """A second vendor the dealer files under its own folder name, "SILVER"."""
+    vendor = Vendor(code="SIL", name="Silver")
+    db.add(vendor)
+    db.flush()
+    db.add(DealerVendor(dealer_id=dealer.id, vendor_id=vendor.id, custom_folder_name="SILVER"))
+    db.commit()
+    return vendor
+
+
+def _stored(db):
+    db.expire_all()
+    return {pf.filename: (pf.vendor_id, pf.dealer_id) for pf in db.scalars(select(PriceFile))}
+
+
+def test_each_entry_gets_its_own_outcome_and_good_entries_are_committed(client, db, dealer, vendor, folder_vendor):
+    vendor_id, dealer_id, folder_vendor_id = vendor.id, dealer.id, folder_vendor.id
+    manifest = [
+        {"filename": "by-code.csv", "vendor_code": "KEL"},
+        {"filename": "by-folder.csv", "custom_folder": "SILVER", "dealer_id": dealer_id},
+        {"filename": "unknown-dealer.csv", "vendor_code": "KEL", "dealer_id": 999},
+        {"filename": "unknown-vendor.csv", "vendor_code": "NOPE"},
+        {"filename": "bad-checksum.csv", "vendor_code": "KEL", "sha256": hashlib.sha256(b"other").hexdigest()},
+        {"filename": "missing-part.csv", "vendor_code": "KEL"},
+    ]
+    files = [
+        (name, f"contents of {name}".encode())
+        for name in ("by-code.csv", "by-folder.csv", "unknown-dealer.csv", "unknown-vendor.csv", "bad-checksum.csv")
+    ]
+
+    res = _upload_batch(client, manifest, files)
+
+    assert res.status_code == 200
+    results = {r["filename"]: r for r in res.json()}
+    assert [r["filename"] for r in res.json()] == [e["filename"] for e in manifest]
+    assert results["by-code.csv"]["status"] == "created"
+    assert results["by-code.csv"]["content_hash"] == hashlib.sha256(b"contents of by-code.csv").hexdigest()
+    assert results["by-folder.csv"]["status"] == "created"
+    assert {name: r["error"] for name, r in results.items() if r["status"] == "error"} == {
+        "unknown-dealer.csv": "Dealer not found: 999",
+        "unknown-vendor.csv": "Vendor not found: NOPE",
+        "bad-checksum.csv": "Uploaded content does not match the declared SHA-256",
+        "missing-part.csv": "No file in request for this manifest entry",
+    }
+    assert _stored(db) == {"by-code.csv": (vendor_id, None), "by-folder.csv": (folder_vendor_id, dealer_id)}
+
+
+def test_zip_members_are_matched_by_member_name(client, db, dealer, vendor, folder_vendor):
+    vendor_id, dealer_id, folder_vendor_id = vendor.id, dealer.id, folder_vendor.id
+    archive = _zip({"KEL/prices.csv": b"kelley", "SILVER/prices.csv": b"silver"})
+    manifest = [
+        {"filename": "KEL/prices.csv", "vendor_code": "KEL"},
+        {"filename": "SILVER/prices.csv", "custom_folder": "SILVER", "dealer_id": dealer_id},
+        {"filename": "KEL/missing.csv", "vendor_code": "KEL"},
+    ]
+
+    res = _upload_batch(client, manifest, archive=archive)
+
+    assert [r["status"] for r in res.json()] == ["created", "created", "error"]
+    db.expire_all()
+    stored = {(pf.vendor_id, pf.dealer_id): (pf.filename, pf.size) for pf in db.scalars(select(PriceFile))}
+    assert stored == {(vendor_id, None): ("prices.csv", 6), (folder_vendor_id, dealer_id): ("prices.csv", 6)}
+
+
+def test_invalid_archive_is_rejected(client, vendor):
+    res = _upload_batch(client, [{"filename": "a.csv", "vendor_code": "KEL"}], archive=b"not a zip")
+
+    assert res.status_code == 400
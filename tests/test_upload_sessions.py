@@ -0,0 +1,91 @@
+import os
+import time
+
+import pytest
+
+from app.config import get_settings
+from app.services import upload_session_service as upload_sessions
+
+settings = get_settings()
+
+
+@pytest.fixture
+def session():
+    created = upload_sessions.create_session(1, None, "prices.bin", 10, None, chunk_size=4)
+    yield created
+    upload_sessions.delete_session(created.id)
+
+
+def _stored(session):
+    return upload_sessions.get_part_path(session.id).read_bytes()
+
+
+def test_chunks_are_stored_in_order(session):
+    assert upload_sessions.write_chunk(session, 0, 0, b"aaaa") == 4
+    assert upload_sessions.write_chunk(session, 1, 4, b"bbbb") == 8
+    assert upload_sessions.write_chunk(session, 2, 8, b"cc") == 10
+    assert _stored(session) == b"aaaabbbbcc"
+
+
+def test_late_retry_of_an_earlier_chunk_keeps_later_chunks(session):
+    upload_sessions.write_chunk(session, 0, 0, b"aaaa")
+    upload_sessions.write_chunk(session, 1, 4, b"bbbb")
+
+    assert upload_sessions.write_chunk(session, 0, 0, b"aaaa") == 8
+    assert _stored(session) == b"aaaabbbb"
+    assert upload_sessions.get_session(session.id).offset == 8
+
+
+def test_chunk_past_stored_data_is_refused(session):
+    upload_sessions.write_chunk(session, 0, 0, b"aaaa")
+
+    with pytest.raises(upload_sessions.OffsetMismatch) as exc:
+        upload_sessions.write_chunk(session, 2, 8, b"cc")
+    assert exc.value.current_offset == 4
+
+
+@pytest.mark.parametrize(
+    "index, offset, data",
+    [
+        (1, 0, b"aaaa"),  # index does not match the offset
+        (0, 0, b"aa"),  # short chunk that is not the last
+        (0, 0, b"aaaaa"),  # longer than chunk_size
+    ],
+)
+def test_malformed_chunks_are_rejected(session, index, offset, data):
+    with pytest.raises(ValueError):
+        upload_sessions.write_chunk(session, index, offset, data)
+    assert _stored(session) == b""
+
+
+def _make_idle(session):
+    long_ago = time.time() - settings.upload_session_ttl_hours * 3600 - 60
+    for path in (upload_sessions.get_part_path(session.id), upload_sessions.get_part_path(session.id).parent):
+        os.utime(path, (long_ago, long_ago))
+
+
+def test_reaper_skips_a_session_being_finalized(session):
+    _make_idle(session)
+
+    with upload_sessions.finalizing(session.id) as part:
+        assert upload_sessions.reap_expired_sessions() == 0
+        assert part.read() == b""
+    assert upload_sessions.get_session(session.id) is None
+
+
+def test_reaper_removes_idle_sessions(session):
+    _make_idle(session)
+
+    assert upload_sessions.reap_expired_sessions() == 1
+    assert upload_sessions.get_session(session.id) is None
+
+
+def test_session_for_an_unknown_dealer_is_refused_up_front(client, vendor):
+    res = client.post(
+        "/api/files/upload-sessions",
+        json={"vendor_code": vendor.code, "dealer_id": 999, "filename": "prices.csv", "size": 10},
+        headers={"X-API-Key": settings.wallace_api_key},
+    )
+
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Dealer not found: 999"